@@ -0,0 +1,156 @@
+"""Write-behind view/click counters: recorded in memory, flushed to product_stats in batched upserts"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
+
+import settings
+from db.dals import ProductStatsDAL
+from db.session import async_session
+
+logger = logging.getLogger(__name__)
+
+VIEW = "views"
+CLICK = "clicks"
+
+
+class ViewCounter:
+    """Aggregates product views/clicks per time bucket and periodically writes them out.
+
+    Incrementing a row per request would make popular products hot rows; here each
+    worker sends one upsert per (product, bucket) per flush interval instead.
+    """
+    def __init__(self):
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed_rows = 0
+        self.flush_failures = 0
+        self._pending: dict[tuple[str, int], dict[str, int]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_rollup = 0.0
+
+    @staticmethod
+    def _bucket(timestamp: float) -> int:
+        bucket_seconds = settings.ANALYTICS_BUCKET_SECONDS
+        return int(timestamp // bucket_seconds * bucket_seconds)
+
+    def _add(self, key: tuple[str, int], views: int, clicks: int) -> bool:
+        counters = self._pending.get(key)
+        if counters is None:
+            # память ограничена числом ключей: при переполнении просим сброс, а лишнее теряем
+            if len(self._pending) >= settings.ANALYTICS_MAX_PENDING_KEYS:
+                self.dropped += views + clicks
+                if self._wakeup is not None:
+                    self._wakeup.set()
+                return False
+            counters = self._pending[key] = {VIEW: 0, CLICK: 0}
+        counters[VIEW] += views
+        counters[CLICK] += clicks
+        return True
+
+    def record(self, product_id: UUID, kind: str = VIEW):
+        key = (str(product_id), self._bucket(time.time()))
+        if self._add(key, views=int(kind == VIEW), clicks=int(kind == CLICK)):
+            self.recorded += 1
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        # одинаковый порядок строк во всех воркерах, чтобы параллельные upsert'ы не ловили deadlock
+        rows = [
+            {
+                "product_id": UUID(product_id),
+                "bucket_start": datetime.fromtimestamp(bucket_start, tz=timezone.utc),
+                **counters,
+            }
+            for (product_id, bucket_start), counters in sorted(pending.items())
+        ]
+        batch_size = settings.ANALYTICS_FLUSH_BATCH_SIZE
+        try:
+            async with async_session() as session:
+                async with session.begin():
+                    stats_dal = ProductStatsDAL(session)
+                    for start in range(0, len(rows), batch_size):
+                        await stats_dal.upsert_counters(rows[start:start + batch_size])
+        except asyncio.CancelledError:
+            # отменили посреди записи: счётчики уже вынуты из _pending, без возврата они бы пропали
+            self._restore(pending)
+            raise
+        except Exception:
+            self.flush_failures += 1
+            logger.warning("Failed to flush %s product stats rows, keeping them for the next try", len(rows), exc_info=True)
+            self._restore(pending)
+            return
+        self.flushed_rows += len(rows)
+
+    def _restore(self, pending: dict[tuple[str, int], dict[str, int]]):
+        for key, counters in pending.items():
+            self._add(key, views=counters[VIEW], clicks=counters[CLICK])
+
+    async def refresh_rollup(self) -> bool:
+        now = datetime.now(timezone.utc)
+        window = timedelta(seconds=settings.ANALYTICS_TRENDING_WINDOW_SECONDS)
+        async with async_session() as session:
+            async with session.begin():
+                return await ProductStatsDAL(session).refresh_trending(
+                    window_start=now - window,
+                    previous_start=now - 2 * window,
+                    keep_since=now - timedelta(days=settings.ANALYTICS_RETENTION_DAYS),
+                )
+
+    async def _maybe_refresh_rollup(self):
+        if time.monotonic() - self._last_rollup < settings.ANALYTICS_ROLLUP_INTERVAL_SECONDS:
+            return
+        self._last_rollup = time.monotonic()
+        try:
+            await self.refresh_rollup()
+        except Exception:
+            logger.warning("Failed to refresh product trending rollup", exc_info=True)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.ANALYTICS_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if not self._stopping:
+                await self._maybe_refresh_rollup()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the background flusher and writes out whatever is still in memory"""
+        if self._task is not None:
+            # задачу не отменяем, а просим выйти из цикла: так начатый flush допишет свою пачку
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+                self._wakeup = None
+                self._stopping = False
+        await self.flush()
+
+    def snapshot(self) -> dict:
+        return {
+            "pending_keys": len(self._pending),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "flushed_rows": self.flushed_rows,
+            "flush_failures": self.flush_failures,
+        }
+
+
+view_counter = ViewCounter()
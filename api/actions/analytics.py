@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from api.models import ProductStatsBucket, ProductStatsResponse, ProductTrendingItem, ProductTrendingResponse, ShowProduct
+from db.dals import ProductStatsDAL
+
+
+async def _get_trending_products(limit: int, session) -> ProductTrendingResponse:
+    """Served from the precomputed product_trending rollup, one indexed query"""
+    async with session.begin():
+        stats_dal = ProductStatsDAL(session)
+        trending = await stats_dal.get_trending(limit=limit)
+    return ProductTrendingResponse(
+        items=[
+            ProductTrendingItem(
+                product=ShowProduct.model_validate(product),
+                views=rollup.views,
+                previous_views=rollup.previous_views,
+                clicks=rollup.clicks,
+                score=rollup.score,
+            )
+            for product, rollup in trending
+        ],
+        computed_at=max((rollup.computed_at for _, rollup in trending), default=None),
+    )
+
+
+async def _get_product_stats(product_id: UUID, hours: int, session) -> ProductStatsResponse:
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    async with session.begin():
+        stats_dal = ProductStatsDAL(session)
+        stats = await stats_dal.get_product_stats(product_id=product_id, since=since)
+    return ProductStatsResponse(
+        product_id=product_id,
+        buckets=[
+            ProductStatsBucket(bucket_start=stat.bucket_start, views=stat.views, clicks=stat.clicks)
+            for stat in stats
+        ],
+    )
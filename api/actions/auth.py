@@ -1,4 +1,6 @@
 from typing import Union
+from uuid import UUID
+
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import status
@@ -8,10 +10,11 @@ from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import settings
+from cache import get_principal_cache
 from db.dals import UserDAL
 from db.models import User
 from db.session import get_db
-from hashing import Hasher
+from hashing import HasherOverloadedError, get_async_hasher
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login/token")
 
@@ -24,13 +27,36 @@ async def _get_user_by_email_for_auth(email: str, db: AsyncSession):
             )
 
 
+def _principal_from_user(user: User) -> dict:
+    # пароль в кэш не кладём, для авторизации запроса он не нужен
+    principal = {
+        column.key: getattr(user, column.key)
+        for column in User.__table__.columns
+        if column.key not in ("hashed_password", "updated_at")
+    }
+    principal["user_id"] = str(principal["user_id"])
+    return principal
+
+
+def _user_from_principal(principal: dict) -> User:
+    return User(**{**principal, "user_id": UUID(principal["user_id"])})
+
+
 async def authenticate_user(
     email: str, password: str, db: AsyncSession
 ) -> Union[User, None]:
     user = await _get_user_by_email_for_auth(email=email, db=db)
     if user is None:
         return
-    if not Hasher.verify_password(password, user.hashed_password):
+    try:
+        is_valid = await get_async_hasher().verify_password(password, user.hashed_password)
+    except HasherOverloadedError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, try again later",
+            headers={"Retry-After": "1"},
+        )
+    if not is_valid:
         return
     return user
 
@@ -46,12 +72,16 @@ async def get_current_user_from_token(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
         email: str = payload.get("sub")
-        print("username/email extracted is ", email)
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    principal = await get_principal_cache().get(email)
+    if principal is not None:
+        return _user_from_principal(principal)
+    generation = await get_principal_cache().get_generation()
     user = await _get_user_by_email_for_auth(email=email, db=db)
     if user is None:
         raise credentials_exception
+    await get_principal_cache().set(email, user.user_id, _principal_from_user(user), generation=generation)
     return user
\ No newline at end of file
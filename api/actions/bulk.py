@@ -0,0 +1,223 @@
+import csv
+import io
+import json
+from typing import AsyncIterable, AsyncIterator, Optional
+from uuid import UUID
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.exc import DBAPIError
+
+import settings
+from api.models import BulkImportError, BulkImportReport, ProductCreate
+from db.dals import ProductDAL
+from db.session import async_session
+from storage import UploadTooLargeError
+
+EXPORT_COLUMNS = ["product_id"] + list(ProductCreate.model_fields)
+BULK_FORMATS = ("ndjson", "csv")
+
+
+##########################
+# BLOCK WITH BULK IMPORT #
+##########################
+
+
+async def _limit_size(chunks: AsyncIterable[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise UploadTooLargeError(f"Import body is larger than {max_bytes} bytes")
+        yield chunk
+
+
+def _decode_line(line: bytes) -> tuple[Optional[str], Optional[str]]:
+    try:
+        return line.decode("utf-8-sig").rstrip("\r"), None
+    except UnicodeDecodeError as e:
+        return None, f"Invalid UTF-8: {e}"
+
+
+async def _iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[tuple[Optional[str], Optional[str]]]:
+    """Yields (line, error) pairs; a line that is not valid UTF-8 is reported instead of failing the whole import"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield _decode_line(line)
+    if buffer:
+        yield _decode_line(buffer)
+
+
+async def _iter_ndjson_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    line_number = 0
+    async for line, error in _iter_lines(chunks):
+        line_number += 1
+        if error is not None:
+            yield line_number, None, error
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, "Each line should be a JSON object"
+            continue
+        yield line_number, record, None
+
+
+async def _iter_csv_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    header = None
+    pending, record_line = "", 0
+    line_number = 0
+    async for line, error in _iter_lines(chunks):
+        line_number += 1
+        if not pending:
+            record_line = line_number
+        if error is not None:
+            # битая строка портит и запись, которую копили до неё
+            pending = ""
+            yield record_line, None, error
+            continue
+        pending = f"{pending}\n{line}" if pending else line
+        # поле в кавычках может содержать перевод строки - копим строки, пока кавычки не закроются
+        if pending.count('"') % 2:
+            continue
+        values, pending = next(csv.reader(io.StringIO(pending))), ""
+        if header is None:
+            header = values
+            continue
+        if not any(values):
+            continue
+        if len(values) != len(header):
+            yield record_line, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield record_line, dict(zip(header, values)), None
+    if pending:
+        yield record_line, None, "Unterminated quoted field"
+
+
+def _row_from_product(body: ProductCreate) -> dict:
+    # то же соответствие полей, что и в _create_new_product
+    return body.model_dump()
+
+
+async def _insert_batch(session, batch: list[tuple[int, dict]], report: BulkImportReport):
+    try:
+        async with session.begin():
+            inserted = await ProductDAL(session).bulk_create_products([row for _, row in batch])
+        report.inserted += inserted
+        return
+    except DBAPIError:
+        pass
+    # батч не вставился целиком - вставляем по одной строке, чтобы найти виноватые
+    for record_line, row in batch:
+        try:
+            async with session.begin():
+                await ProductDAL(session).bulk_create_products([row])
+            report.inserted += 1
+        except DBAPIError as e:
+            _add_error(report, record_line, str(e.orig) if e.orig is not None else str(e))
+
+
+def _add_error(report: BulkImportReport, record_line: int, message: str):
+    report.failed += 1
+    if len(report.errors) < settings.BULK_IMPORT_MAX_REPORTED_ERRORS:
+        report.errors.append(BulkImportError(row=record_line, error=message))
+
+
+async def _import_products(
+    chunks: AsyncIterable[bytes],
+    fmt: str,
+    session,
+    owner_id: Optional[UUID] = None,
+    max_bytes: Optional[int] = None,
+) -> BulkImportReport:
+    """Validates streamed rows with ProductCreate and inserts them in batches.
+
+    Bad rows are reported and skipped, each batch is committed on its own.
+    With owner_id every row is imported for that user, whatever user_id it carries.
+    """
+    if max_bytes is not None:
+        chunks = _limit_size(chunks, max_bytes)
+    records = _iter_csv_records(chunks) if fmt == "csv" else _iter_ndjson_records(chunks)
+    report = BulkImportReport(inserted=0, failed=0, errors=[])
+    batch: list[tuple[int, dict]] = []
+    try:
+        async for record_line, record, error in records:
+            if error is not None:
+                _add_error(report, record_line, error)
+                continue
+            if owner_id is not None:
+                record = {**record, "user_id": str(owner_id)}
+            try:
+                body = ProductCreate.model_validate(record)
+            except ValidationError as e:
+                _add_error(report, record_line, "; ".join(
+                    f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+                ))
+                continue
+            batch.append((record_line, _row_from_product(body)))
+            if len(batch) >= settings.BULK_IMPORT_BATCH_SIZE:
+                await _insert_batch(session, batch, report)
+                batch = []
+    except UploadTooLargeError as e:
+        # уже вставленные пачки закоммичены, поэтому сообщаем, сколько строк успело загрузиться
+        raise HTTPException(status_code=413, detail=f"{e}, {report.inserted} rows were imported before the limit")
+    if batch:
+        await _insert_batch(session, batch, report)
+    return report
+
+
+##########################
+# BLOCK WITH BULK EXPORT #
+##########################
+
+
+def _export_value(value):
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+async def _export_products(
+    fmt: str, owner_id: Optional[UUID] = None, include_inactive: bool = False
+) -> AsyncIterator[str]:
+    """Streams products as NDJSON lines or CSV rows straight from a server-side cursor.
+
+    With owner_id only that user's products are exported; deactivated products only with include_inactive.
+    Opens its own session: the response body is produced after the request dependencies are gone.
+    """
+    async with async_session() as session:
+        async with session.begin():
+            product_dal = ProductDAL(session)
+            rows = product_dal.stream_products(
+                EXPORT_COLUMNS,
+                batch_size=settings.BULK_EXPORT_BATCH_SIZE,
+                user_id=owner_id,
+                is_active=None if include_inactive else True,
+            )
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_COLUMNS)
+                async for row in rows:
+                    writer.writerow([
+                        json.dumps(value, ensure_ascii=False) if isinstance(value, list) else _export_value(value)
+                        for value in (row[column] for column in EXPORT_COLUMNS)
+                    ])
+                    if buffer.tell() >= settings.BULK_EXPORT_CHUNK_BYTES:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                yield buffer.getvalue()
+            else:
+                async for row in rows:
+                    yield json.dumps(
+                        {column: _export_value(value) for column, value in row.items()}, ensure_ascii=False
+                    ) + "\n"
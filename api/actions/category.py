@@ -0,0 +1,131 @@
+from collections import defaultdict
+from typing import Optional, Union
+from uuid import UUID
+
+from fastapi import HTTPException
+
+from api.models import CategoryCreate, CategoryTreeNode, CategoryTreeResponse, DeleteCategoryResponse, ShowCategory, UpdateCategoryRequest
+from cache import get_category_tree_cache
+from db.dals import CategoryDAL, PortalRole
+from db.models import Category, User
+
+
+class CategoryTree:
+    """Snapshot of all categories: lookups by id and children lists without going to the database"""
+    def __init__(self, categories: list[Category]):
+        self.by_id: dict[UUID, Category] = {category.id: category for category in categories}
+        self.children: dict[Optional[UUID], list[Category]] = defaultdict(list)
+        for category in sorted(categories, key=lambda category: category.name):
+            self.children[category.parent_id].append(category)
+
+    def to_nodes(self, parent_id: Optional[UUID] = None) -> list[CategoryTreeNode]:
+        return [
+            CategoryTreeNode(id=category.id, name=category.name, children=self.to_nodes(category.id))
+            for category in self.children.get(parent_id, [])
+        ]
+
+
+async def _load_category_tree(session) -> CategoryTree:
+    async def load_tree():
+        async with session.begin():
+            category_dal = CategoryDAL(session)
+            return CategoryTree(await category_dal.get_all_categories())
+
+    return await get_category_tree_cache().get_or_load(load_tree)
+
+
+async def _find_category(category_id: UUID, session) -> Union[Category, None]:
+    tree = await _load_category_tree(session)
+    category = tree.by_id.get(category_id)
+    if category is None:
+        # категорию могли создать в другом воркере уже после того, как мы загрузили дерево.
+        # Проверяем одну строку: перечитывать всё дерево на каждый неизвестный id слишком дорого
+        async with session.begin():
+            category = await CategoryDAL(session).get_category(category_id)
+        if category is not None:
+            get_category_tree_cache().invalidate()
+    return category
+
+
+async def _resolve_category_path(category_id: UUID, session) -> Union[str, None]:
+    category = await _find_category(category_id, session)
+    return category.path if category is not None else None
+
+
+async def _get_category_tree(session) -> CategoryTreeResponse:
+    tree = await _load_category_tree(session)
+    return CategoryTreeResponse(items=tree.to_nodes())
+
+
+def _check_can_edit_categories(current_user: User):
+    if not {
+        PortalRole.ROLE_PORTAL_ADMIN,
+        PortalRole.ROLE_PORTAL_SUPERADMIN,
+    }.intersection(current_user.roles or []):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+
+
+async def _get_category_or_404(category_dal: CategoryDAL, category_id: UUID, detail: str) -> Category:
+    category = await category_dal.get_category(category_id)
+    if category is None:
+        raise HTTPException(status_code=404, detail=detail)
+    return category
+
+
+async def _create_category(body: CategoryCreate, session) -> ShowCategory:
+    async with session.begin():
+        category_dal = CategoryDAL(session)
+        parent = None
+        if body.parent_id is not None:
+            # FOR SHARE: пока мы не закоммитили, родителя никто не перенесёт и путь ребёнка не устареет
+            parent = (await category_dal.lock_categories([body.parent_id], read=True)).get(body.parent_id)
+            if parent is None:
+                raise HTTPException(status_code=404, detail=f"Parent category with id {body.parent_id} not found.")
+        category = await category_dal.create_category(name=body.name, parent=parent)
+        created_category = ShowCategory.model_validate(category)
+    # сбрасываем после коммита: иначе параллельный запрос успел бы закэшировать дерево без новой категории
+    get_category_tree_cache().invalidate()
+    return created_category
+
+
+async def _update_category(category_id: UUID, body: UpdateCategoryRequest, session) -> ShowCategory:
+    async with session.begin():
+        category_dal = CategoryDAL(session)
+        category = await _get_category_or_404(category_dal, category_id, f"Category with id {category_id} not found.")
+        if body.name is not None:
+            await category_dal.rename_category(category_id, body.name)
+        if "parent_id" in body.model_fields_set and body.parent_id != category.parent_id:
+            # переносы идут по очереди, а пути перечитываем под блокировкой: иначе два встречных
+            # переноса проверили бы цикл по старым путям и оба прошли бы
+            await category_dal.lock_moves()
+            locked = await category_dal.lock_categories(
+                [category_id] if body.parent_id is None else [category_id, body.parent_id]
+            )
+            if category_id not in locked:
+                raise HTTPException(status_code=404, detail=f"Category with id {category_id} not found.")
+            new_parent = None
+            if body.parent_id is not None:
+                new_parent = locked.get(body.parent_id)
+                if new_parent is None:
+                    raise HTTPException(status_code=404, detail=f"Parent category with id {body.parent_id} not found.")
+                if new_parent.path.startswith(category.path):
+                    raise HTTPException(status_code=422, detail="Category can't be moved into its own subtree")
+            await category_dal.move_category(category, new_parent)
+        await session.refresh(category)
+        updated_category = ShowCategory.model_validate(category)
+    get_category_tree_cache().invalidate()
+    return updated_category
+
+
+async def _delete_category(category_id: UUID, session) -> DeleteCategoryResponse:
+    async with session.begin():
+        category_dal = CategoryDAL(session)
+        # удаляем по пути, перечитанному под теми же блокировками, что и перенос:
+        # иначе параллельный перенос сменил бы путь и удаление не задело бы ни одной строки
+        await category_dal.lock_moves()
+        category = (await category_dal.lock_categories([category_id])).get(category_id)
+        if category is None:
+            raise HTTPException(status_code=404, detail=f"Category with id {category_id} not found.")
+        deleted_count = await category_dal.delete_category(category)
+    get_category_tree_cache().invalidate()
+    return DeleteCategoryResponse(deleted_category_id=category_id, deleted_count=deleted_count)
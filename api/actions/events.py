@@ -0,0 +1,46 @@
+import json
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+from fastapi import HTTPException, Request, status
+
+import settings
+from events import RESYNC, Subscription, product_events
+
+SSE_RETRY_MILLISECONDS = 3000
+
+
+def _format_sse(product_event: dict) -> str:
+    return f"event: {product_event['type']}\ndata: {json.dumps(product_event)}\n\n"
+
+
+def _subscribe_to_product_events(user_id: Optional[UUID], product_id: Optional[UUID]) -> Subscription:
+    if product_events.subscribers >= settings.PRODUCT_EVENTS_MAX_SUBSCRIBERS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many event stream subscribers, try again later",
+            headers={"Retry-After": "5"},
+        )
+    return product_events.subscribe(
+        user_id=str(user_id) if user_id is not None else None,
+        product_id=str(product_id) if product_id is not None else None,
+    )
+
+
+async def _stream_product_events(request: Request, subscription: Subscription) -> AsyncIterator[str]:
+    """Server-Sent Events stream; a resync event means the client must re-read the state it shows"""
+    try:
+        yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n"
+        while not await request.is_disconnected():
+            product_event = await subscription.get(timeout=settings.PRODUCT_EVENTS_HEARTBEAT_SECONDS)
+            if product_event is None:
+                if subscription.closed:
+                    break
+                # комментарий держит соединение живым через прокси и позволяет заметить отключение клиента
+                yield ": ping\n\n"
+                continue
+            yield _format_sse(product_event)
+            if product_event["type"] == RESYNC and subscription.closed:
+                break
+    finally:
+        product_events.unsubscribe(subscription)
@@ -0,0 +1,150 @@
+import asyncio
+from pathlib import Path
+from typing import Optional, Union
+from uuid import UUID
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+import settings
+from api.conditional import etag_matches
+from api.models import ImageDerivativeInfo, ShowImage
+from cache import get_product_cache
+from db.dals import ImageDAL
+from db.models import Image, ImageDerivative
+from storage import StagedFile, blob_path, discard, promote, remove_blob, remove_file, sniff_media_type
+from thumbnails import DerivativeStatus, derivative_path, get_thumbnail_queue, remove_derivatives
+
+
+async def _store_product_images(staged_files: list[StagedFile], product_id: UUID, session) -> list[Image]:
+    images = []
+    try:
+        async with session.begin():
+            image_dal = ImageDAL(session)
+            for staged in staged_files:
+                image = await image_dal.create_image(
+                    path=str(blob_path(staged.sha256)),
+                    product_id=product_id,
+                    sha256=staged.sha256,
+                    size=staged.size,
+                    derivatives_status=DerivativeStatus.PENDING if get_thumbnail_queue().enabled else None,
+                )
+                images.append(image)
+        # файлы переносим только после коммита: при откате в хранилище не останется блобов без ссылок
+        await _promote_blobs(staged_files, session)
+    finally:
+        for staged in staged_files:
+            await discard(staged)
+    if images:
+        # сбрасываем после коммита, чтобы параллельное чтение не закэшировало продукт без новых картинок
+        await get_product_cache().invalidate(product_id)
+    # превью строятся уже после коммита, ответ на загрузку их не ждёт
+    for image in images:
+        if image.derivatives_status == DerivativeStatus.PENDING:
+            await get_thumbnail_queue().enqueue(image.id, image.sha256)
+    return images
+
+
+async def _promote_blobs(staged_files: list[StagedFile], session):
+    """Moves committed uploads into the blob store, each under its blob lock"""
+    async with session.begin():
+        image_dal = ImageDAL(session)
+        # один порядок блокировок во всех запросах, чтобы загрузки нескольких файлов не ловили deadlock
+        for staged in sorted(staged_files, key=lambda staged: staged.sha256):
+            await image_dal.lock_blob(staged.sha256)
+            await promote(staged)
+
+
+async def _release_blob(sha256: str, session):
+    """Unlinks the blob and its derivatives if no committed image references it anymore"""
+    async with session.begin():
+        image_dal = ImageDAL(session)
+        # под блокировкой параллельная загрузка того же контента не вернёт файл, пока мы считаем ссылки
+        await image_dal.lock_blob(sha256)
+        if await image_dal.count_blob_references(sha256) == 0:
+            await remove_blob(sha256)
+            await asyncio.to_thread(remove_derivatives, sha256)
+
+
+def _show_image(image: Image, derivatives: list[ImageDerivative]) -> ShowImage:
+    return ShowImage(
+        image_id=image.id,
+        product_id=image.product_id,
+        sha256=image.sha256,
+        size=image.size,
+        derivatives_status=image.derivatives_status,
+        derivatives=[
+            ImageDerivativeInfo(
+                width=derivative.width,
+                height=derivative.height,
+                format=derivative.format,
+                path=derivative.path,
+            )
+            for derivative in derivatives
+        ],
+    )
+
+
+async def _get_image_status(image_id: UUID, session) -> Union[ShowImage, None]:
+    async with session.begin():
+        image_dal = ImageDAL(session)
+        image_with_owner = await image_dal.get_image_with_owner(image_id=image_id)
+        if image_with_owner is None:
+            return
+        image, _ = image_with_owner
+        derivatives = await image_dal.get_derivatives(image_id=image_id)
+        return _show_image(image, derivatives)
+
+
+async def _get_image_with_owner(image_id: UUID, session) -> Union[tuple[Image, Optional[UUID]], None]:
+    async with session.begin():
+        image_dal = ImageDAL(session)
+        return await image_dal.get_image_with_owner(image_id=image_id)
+
+
+async def _delete_image(image_id: UUID, session) -> Union[Image, None]:
+    async with session.begin():
+        image_dal = ImageDAL(session)
+        image = await image_dal.delete_image(image_id=image_id)
+    if image is None:
+        return
+    # файлы удаляем только после коммита: если он сорвётся, запись останется вместе со своим блобом
+    if image.sha256 is None:
+        # старые загрузки лежат не в хранилище блобов, а отдельными файлами
+        await remove_file(image.path)
+    else:
+        await _release_blob(image.sha256, session)
+    if image.product_id is not None:
+        await get_product_cache().invalidate(image.product_id)
+    return image
+
+
+DERIVATIVE_MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+async def _serve_blob(
+    request: Request, sha256: str, width: Optional[int] = None, fmt: Optional[str] = None
+) -> Union[Response, None]:
+    """Serves an original blob or one of its derivatives. Blobs never change, so the hash is a strong ETag"""
+    if width is None:
+        path = blob_path(sha256)
+        etag = f'"{sha256}"'
+    else:
+        path = derivative_path(sha256, width, fmt)
+        etag = f'"{sha256}-{width}-{fmt}"'
+    if not await asyncio.to_thread(path.is_file):
+        return
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.IMAGE_CACHE_MAX_AGE}, immutable",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    media_type = DERIVATIVE_MEDIA_TYPES[fmt] if width is not None else await sniff_media_type(path)
+    if settings.IMAGE_ACCEL_REDIRECT_PREFIX:
+        # файл отдаст nginx через sendfile, воркер только проверяет кэш
+        relative_path = Path(path).relative_to(settings.UPLOAD_DIR).as_posix()
+        headers["X-Accel-Redirect"] = f"{settings.IMAGE_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative_path}"
+        return Response(headers=headers, media_type=media_type)
+    # FileResponse сам обрабатывает Range/If-Range и отдаёт файл через pathsend, если сервер его поддерживает
+    return FileResponse(path, media_type=media_type, headers=headers)
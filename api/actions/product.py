@@ -1,15 +1,20 @@
-from typing import Union
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import Optional, Union
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
 
-from api.models import ProductCreate, ShowProduct
-from db.dals import ProductDAL
-from db.models import Product, User
-from db.session import get_db
-from hashing import Hasher
-
-product_router = APIRouter()
+from api.actions.category import _find_category, _resolve_category_path
+from api.actions.image import _show_image
+from api.models import ProductBatchItem, ProductCategoriesResponse, ProductBatchResponse, ProductCreate, ProductListResponse, ProductSearchHit, ProductSearchResponse, ShowProduct
+from cache import get_product_cache
+from db.dals import NO_RELATIONSHIPS, PRODUCT_WITH_IMAGES, ProductDAL
+from db.models import Product, ProductStatus
+from db.session import async_session, is_replica_session
 
 
 async def _create_new_product(body: ProductCreate, session) -> ShowProduct:
@@ -60,19 +65,226 @@ async def _get_product_by_id(product_id, session) -> Union[Product, None]:
         if product is not None:
             return product
 
-async def _update_product(updated_product_params: dict, product_id: UUID, session) -> Union[UUID, None]:
+async def _get_product_version(product_id: UUID, session) -> Union[tuple[int, datetime], None]:
+    async with session.begin():
+        product_dal = ProductDAL(session)
+        return await product_dal.get_product_version(product_id=product_id)
+
+async def _get_product_for_display(product_id: UUID, session) -> Union[tuple[ShowProduct, int, datetime], None]:
+    """Cached read path for GET handlers. Writes keep using _get_product_by_id for fresh data.
+
+    Cache misses are loaded from the primary even when session is a replica.
+    """
+    async def load_product():
+        # кэш общий для всех клиентов, поэтому заполняем его только с основной базы:
+        # отстающая реплика вернула бы в кэш строку, которую запись только что оттуда сбросила
+        if is_replica_session(session):
+            async with async_session() as primary_session:
+                product = await _get_product_by_id(product_id, primary_session)
+        else:
+            product = await _get_product_by_id(product_id, session)
+        if product is not None:
+            return {
+                "product": ShowProduct.model_validate(product).model_dump(mode="json"),
+                "version": product.version,
+                "updated_at": product.updated_at.isoformat(),
+            }
+
+    cached_product = await get_product_cache().get_or_load(product_id, load_product)
+    if cached_product is not None:
+        return (
+            ShowProduct.model_validate(cached_product["product"]),
+            cached_product["version"],
+            datetime.fromisoformat(cached_product["updated_at"]),
+        )
+
+async def _get_cached_product_version(product_id: UUID, session) -> Union[tuple[int, datetime], None]:
+    """Version for revalidation: from the cache when it's there, otherwise a version-only query"""
+    cached_product = await get_product_cache().peek(product_id)
+    if cached_product is not None:
+        return cached_product["version"], datetime.fromisoformat(cached_product["updated_at"])
+    return await _get_product_version(product_id, session)
+
+async def _raise_not_found_or_forbidden(product_dal: ProductDAL, product_id: UUID):
+    # UPDATE ничего не затронул: либо продукта нет, либо он чужой - второй запрос только на этом пути
+    if await product_dal.product_exists(product_id):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    raise HTTPException(status_code=404, detail=f"Product with id {product_id} not found.")
+
+async def _update_product(
+    updated_product_params: dict, product_id: UUID, session, owner_id: Optional[UUID] = None
+) -> UUID:
+    """Ownership check and update in one statement: 404 if there is no such product, 403 if it's not owner's"""
     async with session.begin():
         product_dal = ProductDAL(session)
         updated_product_id = await product_dal.update_product(
             product_id=product_id,
+            owner_id=owner_id,
             **updated_product_params
         )
-        return updated_product_id
+        if updated_product_id is None:
+            await _raise_not_found_or_forbidden(product_dal, product_id)
+    # сбрасываем после коммита: иначе параллельное чтение успело бы закэшировать старую строку
+    await get_product_cache().invalidate(product_id)
+    return updated_product_id
 
-async def _delete_product(product_id, session) -> Union[UUID, None]:
+async def _delete_product(product_id, session, owner_id: Optional[UUID] = None) -> UUID:
+    """Ownership check and soft delete in one statement: 404 if there is no such product, 403 if it's not owner's"""
     async with session.begin():
         product_dal = ProductDAL(session)
         deleted_product_id = await product_dal.delete_product(
             product_id=product_id,
+            owner_id=owner_id,
+        )
+        if deleted_product_id is None:
+            await _raise_not_found_or_forbidden(product_dal, product_id)
+    await get_product_cache().invalidate(product_id)
+    return deleted_product_id
+
+
+async def _set_product_categories(
+    product_id: UUID, category_ids: list[UUID], session, owner_id: Optional[UUID] = None
+) -> ProductCategoriesResponse:
+    for category_id in category_ids:
+        if await _find_category(category_id, session) is None:
+            raise HTTPException(status_code=422, detail=f"Category with id {category_id} not found.")
+    try:
+        async with session.begin():
+            product_dal = ProductDAL(session)
+            updated_product_id = await product_dal.set_product_categories(
+                product_id=product_id, category_ids=category_ids, owner_id=owner_id
+            )
+            if updated_product_id is None:
+                await _raise_not_found_or_forbidden(product_dal, product_id)
+    except IntegrityError:
+        # категорию удалили между проверкой по дереву и вставкой
+        raise HTTPException(status_code=422, detail="Some of the categories no longer exist.")
+    await get_product_cache().invalidate(product_id)
+    return ProductCategoriesResponse(product_id=product_id, category_ids=sorted(set(category_ids), key=str))
+
+
+def _encode_cursor(payload: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    return payload
+
+
+def _encode_product_cursor(product: Product) -> str:
+    return _encode_cursor({
+        "d": product.post_date.isoformat() if product.post_date else None,
+        "id": str(product.product_id),
+    })
+
+
+def _decode_product_cursor(cursor: str) -> tuple[Optional[date], UUID]:
+    payload = _decode_cursor(cursor)
+    try:
+        post_date = date.fromisoformat(payload["d"]) if payload["d"] else None
+        return post_date, UUID(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+async def _list_products(
+    session,
+    limit: int,
+    cursor: Optional[str] = None,
+    user_id: Optional[UUID] = None,
+    is_active: Optional[bool] = None,
+    status_of_project: Optional[ProductStatus] = None,
+    category_id: Optional[UUID] = None,
+) -> ProductListResponse:
+    after_post_date, after_product_id = None, None
+    if cursor is not None:
+        after_post_date, after_product_id = _decode_product_cursor(cursor)
+    category_path = None
+    if category_id is not None:
+        # путь категории берём из дерева в памяти, в базу идёт только сам список
+        category_path = await _resolve_category_path(category_id, session)
+        if category_path is None:
+            raise HTTPException(status_code=404, detail=f"Category with id {category_id} not found.")
+    async with session.begin():
+        product_dal = ProductDAL(session)
+        # берём на одну запись больше, чтобы понять, есть ли следующая страница
+        products = await product_dal.list_products(
+            limit=limit + 1,
+            after_post_date=after_post_date,
+            after_product_id=after_product_id,
+            user_id=user_id,
+            is_active=is_active,
+            status_of_project=status_of_project,
+            category_path=category_path,
+        )
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = _encode_product_cursor(products[-1])
+    return ProductListResponse(
+        items=[ShowProduct.model_validate(product) for product in products],
+        next_cursor=next_cursor,
+    )
+
+
+async def _search_products(
+    session, query_text: str, limit: int, cursor: Optional[str] = None
+) -> ProductSearchResponse:
+    after_rank, after_product_id = None, None
+    if cursor is not None:
+        payload = _decode_cursor(cursor)
+        try:
+            after_rank, after_product_id = float(payload["r"]), UUID(payload["id"])
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(status_code=422, detail="Invalid cursor")
+    async with session.begin():
+        product_dal = ProductDAL(session)
+        hits = await product_dal.search_products(
+            query_text=query_text,
+            limit=limit + 1,
+            after_rank=after_rank,
+            after_product_id=after_product_id,
+        )
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        last_product, last_rank, _ = hits[-1]
+        next_cursor = _encode_cursor({"r": last_rank, "id": str(last_product.product_id)})
+    return ProductSearchResponse(
+        items=[
+            ProductSearchHit(product=ShowProduct.model_validate(product), rank=rank, headline=headline)
+            for product, rank, headline in hits
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+async def _get_products_batch(product_ids: list[UUID], include_images: bool, session) -> ProductBatchResponse:
+    # повторы убираем, порядок оставляем как в запросе
+    unique_ids = list(dict.fromkeys(product_ids))
+    async with session.begin():
+        product_dal = ProductDAL(session)
+        products = await product_dal.get_products_by_ids(
+            unique_ids, load_options=PRODUCT_WITH_IMAGES if include_images else NO_RELATIONSHIPS
         )
-        return deleted_product_id
\ No newline at end of file
+        products_by_id = {product.product_id: product for product in products}
+        items = [
+            ProductBatchItem(
+                product=ShowProduct.model_validate(products_by_id[product_id]),
+                images=[
+                    _show_image(image, image.derivatives) for image in products_by_id[product_id].images
+                ] if include_images else None,
+            )
+            for product_id in unique_ids
+            if product_id in products_by_id
+        ]
+    return ProductBatchResponse(
+        items=items,
+        missing_ids=[product_id for product_id in unique_ids if product_id not in products_by_id],
+    )
\ No newline at end of file
@@ -1,25 +1,33 @@
-from typing import Union
+from datetime import datetime
+from typing import Optional, Union
 from uuid import UUID
 
-from fastapi import APIRouter, Depends
+from fastapi import HTTPException, status
 
-from api.models import UserCreate, ShowUser
+from api.models import PortfolioProduct, UserCreate, ShowUser, UserPortfolioResponse
+from cache import get_principal_cache
 from db.dals import PortalRole, UserDAL
-from db.models import User
-from db.session import get_db
-from hashing import Hasher
-
-user_router = APIRouter()
+from db.models import ProductStatus, User
+from hashing import HasherOverloadedError, get_async_hasher
 
 
 async def _create_new_user(body: UserCreate, session) -> ShowUser:
+    # хэшируем до открытия транзакции, чтобы не держать соединение пока работает bcrypt
+    try:
+        hashed_password = await get_async_hasher().get_password_hash(body.password)
+    except HasherOverloadedError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many sign-ups in progress, try again later",
+            headers={"Retry-After": "1"},
+        )
     async with session.begin():
         user_dal = UserDAL(session)
         user = await user_dal.create_user(
             name=body.name,
             surname=body.surname,
             email=body.email,
-            hashed_password=Hasher.get_password_hash(body.password),
+            hashed_password=hashed_password,
             roles=[
                  PortalRole.ROLE_PORTAL_USER,
              ],
@@ -45,23 +53,69 @@ async def _create_new_user(body: UserCreate, session) -> ShowUser:
         )
 
 
-async def _delete_user(user_id, session) -> Union[UUID, None]:
+def _forbidden_target_roles(target_user_id: UUID, current_user: User) -> Union[list[str], None]:
+    """Roles the target user must not have for current_user to change it; None - not allowed at all.
+
+    Same rules as check_user_permissions, but expressed as a condition for the UPDATE itself,
+    so the target user doesn't have to be loaded first: anyone may change themselves,
+    admins - other users except admins and superadmins, superadmins - everyone.
+    Delete and update share them (the update handler used to call check_user_permissions inverted).
+    """
+    if target_user_id == current_user.user_id:
+        return []
+    # check admin role
+    if not {
+        PortalRole.ROLE_PORTAL_ADMIN,
+        PortalRole.ROLE_PORTAL_SUPERADMIN,
+    }.intersection(current_user.roles):
+        return None
+    # admin can't change other admins and superadmins
+    if PortalRole.ROLE_PORTAL_ADMIN in current_user.roles:
+        return [PortalRole.ROLE_PORTAL_ADMIN.value, PortalRole.ROLE_PORTAL_SUPERADMIN.value]
+    return []
+
+
+async def _raise_not_found_or_forbidden(user_dal: UserDAL, user_id: UUID):
+    # UPDATE ничего не затронул: либо пользователя нет, либо прав не хватило - второй запрос только на этом пути
+    if await user_dal.user_exists(user_id):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    raise HTTPException(status_code=404, detail=f"User with id {user_id} not found.")
+
+
+async def _delete_user(user_id, session, current_user: User) -> UUID:
+    """Permission check and deactivation in one transaction: 404 if there is no such user, 403 if not allowed"""
     async with session.begin():
         user_dal = UserDAL(session)
-        deleted_user_id = await user_dal.delete_user(
-            user_id=user_id,
-        )
-        return deleted_user_id
+        forbidden_roles = _forbidden_target_roles(target_user_id=user_id, current_user=current_user)
+        deleted_user_id = None
+        if forbidden_roles is not None:
+            deleted_user_id = await user_dal.delete_user(
+                user_id=user_id,
+                forbidden_roles=forbidden_roles,
+            )
+        if deleted_user_id is None:
+            await _raise_not_found_or_forbidden(user_dal, user_id)
+    # сбрасываем после коммита: иначе параллельный запрос успел бы закэшировать ещё активного пользователя
+    await get_principal_cache().invalidate_user(user_id)
+    return deleted_user_id
 
 
-async def _update_user(updated_user_params: dict, user_id: UUID, session) -> Union[UUID, None]:
+async def _update_user(updated_user_params: dict, user_id: UUID, session, current_user: User) -> UUID:
+    """Permission check and update in one transaction: 404 if there is no such user, 403 if not allowed"""
     async with session.begin():
         user_dal = UserDAL(session)
-        updated_user_id = await user_dal.update_user(
-            user_id=user_id,
-            **updated_user_params
-        )
-        return updated_user_id
+        forbidden_roles = _forbidden_target_roles(target_user_id=user_id, current_user=current_user)
+        updated_user_id = None
+        if forbidden_roles is not None:
+            updated_user_id = await user_dal.update_user(
+                user_id=user_id,
+                forbidden_roles=forbidden_roles,
+                **updated_user_params
+            )
+        if updated_user_id is None:
+            await _raise_not_found_or_forbidden(user_dal, user_id)
+    await get_principal_cache().invalidate_user(user_id)
+    return updated_user_id
 
 
 async def _get_user_by_id(user_id, session) -> Union[User, None]:
@@ -73,6 +127,42 @@ async def _get_user_by_id(user_id, session) -> Union[User, None]:
         if user is not None:
             return user
 
+def _status_label(status_name: Optional[str]) -> Optional[str]:
+    # в базе хранится имя члена enum, наружу отдаём его значение, как и в остальных ответах
+    return ProductStatus[status_name].value if status_name else None
+
+
+async def _get_user_portfolio(user_id: UUID, session) -> Union[UserPortfolioResponse, None]:
+    async with session.begin():
+        user_dal = UserDAL(session)
+        user_with_portfolio = await user_dal.get_portfolio(user_id=user_id)
+    if user_with_portfolio is None:
+        return None
+    user, portfolio = user_with_portfolio
+    if portfolio is None:
+        return UserPortfolioResponse(
+            user=ShowUser.model_validate(user), product_count=0, active_product_count=0, status_counts={}, products=[]
+        )
+    return UserPortfolioResponse(
+        user=ShowUser.model_validate(user),
+        product_count=portfolio["product_count"],
+        active_product_count=portfolio["active_product_count"],
+        status_counts={
+            _status_label(status_name): count for status_name, count in portfolio["status_counts"].items() if count
+        },
+        latest_post_date=portfolio["latest_post_date"],
+        latest_product_id=portfolio["latest_product_id"],
+        products=[
+            PortfolioProduct(**{**product, "status_of_project": _status_label(product.get("status_of_project"))})
+            for product in portfolio["products"]
+        ],
+    )
+
+async def _get_user_version(user_id, session) -> Union[tuple[int, datetime], None]:
+    async with session.begin():
+        user_dal = UserDAL(session)
+        return await user_dal.get_user_version(user_id=user_id)
+
 def check_user_permissions(target_user: User, current_user: User) -> bool:
      if target_user.user_id != current_user.user_id:
          # check admin role
@@ -1,26 +1,29 @@
-from datetime import datetime
-import os
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy import delete, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from api.actions.product import _create_new_product, _delete_product, _get_product_by_id, _update_product
-from api.actions.user import check_user_permissions
+from api.conditional import has_conditional_headers, is_not_modified, validator_headers, version_etag
+from analytics import CLICK, view_counter
+from api.actions.analytics import _get_product_stats, _get_trending_products
+from api.actions.bulk import _export_products, _import_products
+from api.actions.category import _check_can_edit_categories, _create_category, _delete_category, _get_category_tree, _update_category
+from api.actions.events import _stream_product_events, _subscribe_to_product_events
+from api.actions.image import _delete_image, _get_image_status, _get_image_with_owner, _serve_blob, _store_product_images
+from api.actions.product import _create_new_product, _delete_product, _get_cached_product_version, _get_products_batch, _get_product_for_display, _list_products, _search_products, _set_product_categories, _update_product
 from api.actions.auth import get_current_user_from_token
-from api.actions.user import _create_new_user, _delete_user, _get_user_by_id, _update_user
-from api.models import DeleteProductResponse, ProductCreate, ShowProduct, UpdateProductRequest, UpdatedProductResponse, UserCreate, ShowUser, DeleteUserResponse, UpdateUserRequest, UpdatedUserResponse
-from db.dals import ImageDAL
-from db.models import Image, User
-from db.session import get_db
-import shutil
-from pathlib import Path
+from api.actions.user import _create_new_user, _delete_user, _get_user_by_id, _get_user_portfolio, _get_user_version, _update_user
+from api.models import BulkImportReport, CategoryCreate, CategoryTreeResponse, DeleteCategoryResponse, ProductCategoriesRequest, ProductCategoriesResponse, ShowCategory, UpdateCategoryRequest, UserPortfolioResponse, ProductStatsResponse, ProductTrendingResponse, DeleteProductResponse, ProductBatchRequest, ProductBatchResponse, ProductCreate, ProductListResponse, ProductSearchResponse, ShowImage, ShowProduct, UpdateProductRequest, UpdatedProductResponse, UserCreate, ShowUser, DeleteUserResponse, UpdateUserRequest, UpdatedUserResponse
+from db.models import ProductStatus, User
+from db.session import get_db, get_read_db
 
-from settings import UPLOAD_DIR
+import settings
+from storage import SHA256_PATTERN, UploadTooLargeError, discard, save_upload
 
 user_router = APIRouter()
 product_router = APIRouter()
+category_router = APIRouter()
 
 
 @user_router.post("/", response_model=ShowUser)
@@ -34,28 +37,40 @@ async def delete_user(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
     ) -> DeleteUserResponse:
-    user_for_deletion = await _get_user_by_id(user_id, db)
-    if user_for_deletion is None:
-        raise HTTPException(
-            status_code=404, detail=f"User with id {user_id} not found."
-        )
-    if not check_user_permissions(
-        target_user=user_for_deletion,
-        current_user=current_user,
-    ):
-        raise HTTPException(status_code=403, detail="Forbidden.")
-    deleted_user_id = await _delete_user(user_id, db)
-    if deleted_user_id is None:
-        raise HTTPException(status_code=404, detail=f"User with id {user_id} not found.")
+    # права проверяются в том же UPDATE, отдельного чтения пользователя нет
+    deleted_user_id = await _delete_user(user_id, db, current_user=current_user)
     return DeleteUserResponse(deleted_user_id=deleted_user_id)
 
 @user_router.get("/", response_model=ShowUser)
-async def get_user_by_id(user_id: UUID, db: AsyncSession = Depends(get_db)) -> ShowUser:
+async def get_user_by_id(
+    user_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+) -> ShowUser:
+    if has_conditional_headers(request):
+        # сначала дешёвая проверка версии, целиком пользователя грузим только если он изменился
+        user_version = await _get_user_version(user_id, db)
+        if user_version is None:
+            raise HTTPException(status_code=404, detail=f"User with id {user_id} not found.")
+        version, updated_at = user_version
+        etag = version_etag(version)
+        if is_not_modified(request, etag, updated_at):
+            return Response(status_code=304, headers=validator_headers(etag, updated_at))
     user = await _get_user_by_id(user_id, db)
     if user is None:
         raise HTTPException(status_code=404, detail=f"User with id {user_id} not found.")
+    response.headers.update(validator_headers(version_etag(user.version), user.updated_at))
     return user
 
+@user_router.get("/{user_id}/portfolio", response_model=UserPortfolioResponse)
+async def get_user_portfolio(user_id: UUID, db: AsyncSession = Depends(get_read_db)) -> UserPortfolioResponse:
+    # пользователь и сводка по его продуктам одним запросом по первичному ключу
+    portfolio = await _get_user_portfolio(user_id, db)
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail=f"User with id {user_id} not found.")
+    return portfolio
+
 @user_router.patch("/", response_model=UpdatedUserResponse)
 async def update_user_by_id(
         user_id: UUID, 
@@ -66,15 +81,9 @@ async def update_user_by_id(
     updated_user_params = body.model_dump(exclude_none=True)
     if updated_user_params == {}:
         raise HTTPException(status_code=422, detail="At least one parameter for user update info should be provided")
-    user_for_update = await _get_user_by_id(user_id, db)
-    if user_for_update is None:
-        raise HTTPException(status_code=404, detail=f"User with id {user_id} not found.")
-    if user_id != current_user.user_id:
-         if check_user_permissions(
-             target_user=user_for_update, current_user=current_user
-         ):
-             raise HTTPException(status_code=403, detail="Forbidden.")
-    updated_user_id = await _update_user(updated_user_params=updated_user_params, db=db, user_id=user_id)
+    updated_user_id = await _update_user(
+        updated_user_params=updated_user_params, user_id=user_id, session=db, current_user=current_user
+    )
     return UpdatedUserResponse(updated_user_id=updated_user_id)
 
 ### Product handlers ###
@@ -92,99 +101,275 @@ async def update_product_by_id(
     updated_product_params = body.model_dump(exclude_none=True)
     if updated_product_params == {}:
         raise HTTPException(status_code=422, detail="At least one parameter for product update info should be provided")
-    product_for_update = await _get_product_by_id(product_id, db)
-    if product_for_update is None:
-        raise HTTPException(status_code=404, detail=f"Product with id {product_id} not found.")
-
-    if current_user.user_id != product_for_update.user_id:
-        raise HTTPException(status_code=403, detail="Forbidden.")
-         
-    updated_product_id = await _update_product(updated_product_params=updated_product_params, session=db, product_id=product_id)
+    # владелец проверяется в том же UPDATE, отдельного чтения продукта нет
+    updated_product_id = await _update_product(
+        updated_product_params=updated_product_params, product_id=product_id, session=db, owner_id=current_user.user_id
+    )
     return UpdatedProductResponse(updated_product_id=updated_product_id)
 
 @product_router.get("/", response_model=ShowProduct)
-async def get_product_by_id(product_id: UUID, db: AsyncSession = Depends(get_db)) -> ShowProduct:
-    product = await _get_product_by_id(product_id, db)
-    if product is None:
+async def get_product_by_id(
+    product_id: UUID,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+) -> ShowProduct:
+    if has_conditional_headers(request):
+        # сначала дешёвая проверка версии, целиком продукт грузим только если он изменился
+        product_version = await _get_cached_product_version(product_id, db)
+        if product_version is None:
+            raise HTTPException(status_code=404, detail=f"Product with id {product_id} not found.")
+        version, updated_at = product_version
+        etag = version_etag(version)
+        if is_not_modified(request, etag, updated_at):
+            view_counter.record(product_id)
+            return Response(status_code=304, headers=validator_headers(etag, updated_at))
+    product_with_version = await _get_product_for_display(product_id, db)
+    if product_with_version is None:
         raise HTTPException(status_code=404, detail=f"Product with id {product_id} not found.")
+    # просмотр только считается в памяти, в базу уходит пачкой из analytics.ViewCounter
+    view_counter.record(product_id)
+    product, version, updated_at = product_with_version
+    response.headers.update(validator_headers(version_etag(version), updated_at))
     return product
 
+@product_router.get("/list", response_model=ProductListResponse)
+async def list_products(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    user_id: Optional[UUID] = None,
+    is_active: Optional[bool] = None,
+    status_of_project: Optional[ProductStatus] = None,
+    category_id: Optional[UUID] = None,
+    db: AsyncSession = Depends(get_read_db),
+) -> ProductListResponse:
+    return await _list_products(
+        db,
+        limit=limit,
+        cursor=cursor,
+        user_id=user_id,
+        is_active=is_active,
+        status_of_project=status_of_project,
+        category_id=category_id,
+    )
+
+@product_router.put("/categories", response_model=ProductCategoriesResponse)
+async def set_product_categories(
+    product_id: UUID,
+    body: ProductCategoriesRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> ProductCategoriesResponse:
+    return await _set_product_categories(
+        product_id=product_id, category_ids=body.category_ids, session=db, owner_id=current_user.user_id
+    )
+
+@product_router.get("/search", response_model=ProductSearchResponse)
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+) -> ProductSearchResponse:
+    return await _search_products(db, query_text=q, limit=limit, cursor=cursor)
+
+@product_router.get("/trending", response_model=ProductTrendingResponse)
+async def get_trending_products(
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+) -> ProductTrendingResponse:
+    return await _get_trending_products(limit=limit, session=db)
+
+@product_router.get("/stats", response_model=ProductStatsResponse)
+async def get_product_stats(
+    product_id: UUID,
+    hours: int = Query(24, ge=1, le=24 * 90),
+    db: AsyncSession = Depends(get_read_db),
+) -> ProductStatsResponse:
+    return await _get_product_stats(product_id=product_id, hours=hours, session=db)
+
+@product_router.post("/click", status_code=204)
+async def record_product_click(product_id: UUID, db: AsyncSession = Depends(get_read_db)) -> Response:
+    # версия почти всегда берётся из кэша, так что проверка существования обычно бесплатна
+    if await _get_cached_product_version(product_id, db) is None:
+        raise HTTPException(status_code=404, detail=f"Product with id {product_id} not found.")
+    view_counter.record(product_id, kind=CLICK)
+    return Response(status_code=204)
+
+@product_router.get("/events")
+async def stream_product_events(
+    request: Request,
+    user_id: Optional[UUID] = None,
+    product_id: Optional[UUID] = None,
+) -> StreamingResponse:
+    # одно долгое соединение вместо периодического опроса GET /product/
+    subscription = _subscribe_to_product_events(user_id=user_id, product_id=product_id)
+    return StreamingResponse(
+        _stream_product_events(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@product_router.post("/batch", response_model=ProductBatchResponse)
+async def get_products_batch(
+    body: ProductBatchRequest, db: AsyncSession = Depends(get_read_db)
+) -> ProductBatchResponse:
+    if not body.product_ids:
+        raise HTTPException(status_code=422, detail="At least one product id should be provided")
+    if len(body.product_ids) > settings.PRODUCT_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"No more than {settings.PRODUCT_BATCH_MAX_SIZE} products can be requested at once",
+        )
+    return await _get_products_batch(body.product_ids, body.include_images, db)
+
+@product_router.post("/import", response_model=BulkImportReport)
+async def import_products(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> BulkImportReport:
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > settings.BULK_IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Import body is larger than {settings.BULK_IMPORT_MAX_BYTES} bytes")
+    # тело читаем потоком, весь файл в память не поднимаем; продукты всегда достаются тому, кто импортирует
+    return await _import_products(
+        request.stream(), format, db, owner_id=current_user.user_id, max_bytes=settings.BULK_IMPORT_MAX_BYTES
+    )
+
+@product_router.get("/export")
+async def export_products(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_inactive: bool = False,
+    current_user: User = Depends(get_current_user_from_token),
+) -> StreamingResponse:
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    # выгружаются только продукты вызывающего, как и импорт пишет только ему
+    return StreamingResponse(
+        _export_products(format, owner_id=current_user.user_id, include_inactive=include_inactive),
+        media_type=media_type,
+    )
+
 @product_router.delete("/", response_model=DeleteProductResponse)
 async def delete_product(
     product_id: UUID, 
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token)
     ) -> DeleteProductResponse:
-
-    product_for_deletion = await _get_product_by_id(product_id, db)
-    if product_for_deletion is None:
-        raise HTTPException(
-            status_code=404, detail=f"Product with id {product_id} not found."
-        )
-    if current_user.user_id != product_for_deletion.user_id:
-        raise HTTPException(status_code=403, detail="Forbidden.")
-    
-    deleted_product_id = await _delete_product(product_id, db)
-    if deleted_product_id is None:
-        raise HTTPException(status_code=404, detail=f"Product with id {product_id} not found.")
-    
+    deleted_product_id = await _delete_product(product_id, db, owner_id=current_user.user_id)
     return DeleteProductResponse(deleted_product_id=deleted_product_id)
 
 
 ## Сохранение изображений ##
 
-async def generate_product_image_filename(product_id: str, extension="png"):
-    timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    return f"{product_id}_{timestamp}.{extension}"
-
- 
 @product_router.post("/upload-logo/")
 async def upload_image(
-    product_id: str, 
+    product_id: UUID, 
     images: List[UploadFile] = File(...),
     db_session: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token),
 
 ):
-    dal = ImageDAL(db_session)
-    uploaded = []
-
-    for image in images:
-        filename = await generate_product_image_filename(product_id)
-        file_path = UPLOAD_DIR / filename
-        with open(file_path, "wb") as f:
-            f.write(await image.read())
+    staged_files = []
+    remaining_bytes = settings.MAX_UPLOAD_REQUEST_SIZE
+    try:
+        for image in images:
+            staged = await save_upload(
+                image, max_bytes=min(settings.MAX_UPLOAD_FILE_SIZE, remaining_bytes)
+            )
+            staged_files.append(staged)
+            remaining_bytes -= staged.size
+    except UploadTooLargeError as e:
+        # запрос целиком отклоняем, уже принятые файлы убираем
+        for staged in staged_files:
+            await discard(staged)
+        raise HTTPException(status_code=413, detail=str(e))
 
-        image = await dal.create_image(path=file_path, product_id=product_id)
-        uploaded.append(image.path)
+    stored_images = await _store_product_images(staged_files, product_id, db_session)
+    uploaded = [image.path for image in stored_images]
 
     return {"uploaded_files": uploaded, "message": "Изображения успешно загружено"}
 
+@product_router.get("/images/{image_id}", response_model=ShowImage)
+async def get_image_status(image_id: UUID, db_session: AsyncSession = Depends(get_read_db)) -> ShowImage:
+    image = await _get_image_status(image_id, db_session)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return image
+
+@product_router.get("/blobs/{sha256}")
+async def get_image_blob(
+    sha256: str,
+    request: Request,
+    width: Optional[int] = None,
+    format: str = Query("webp", pattern="^(webp|jpeg)$"),
+):
+    if not SHA256_PATTERN.match(sha256):
+        raise HTTPException(status_code=404, detail="Image not found")
+    if width is not None and width not in settings.THUMBNAIL_WIDTHS:
+        raise HTTPException(status_code=404, detail="Image not found")
+    response = await _serve_blob(request, sha256, width=width, fmt=format)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return response
+
 @product_router.delete("/images/{image_id}")
 async def delete_image(
-    image_id: int,
+    image_id: UUID,
     db_session: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token),
 ):
-    # 1. Получаем изображение
-    result = await db_session.execute(select(Image).where(Image.id == image_id))
-    image = result.scalar_one_or_none()
-
-    if not image:
+    # 1. Получаем изображение вместе с владельцем продукта
+    image_with_owner = await _get_image_with_owner(image_id, db_session)
+    if image_with_owner is None:
         raise HTTPException(status_code=404, detail="Image not found")
 
     # 2. Проверяем владельца
-    if image.product_id not in current_user.products:
+    _, owner_id = image_with_owner
+    if owner_id != current_user.user_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this image")
-    
-    # 3. Удаляем файл с диска (если он существует)
-    try:
-        os.remove(image.path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при удалении файла: {str(e)}")
 
-    # 4. Удаляем запись из БД
-    await db_session.execute(delete(Image).where(Image.id == image_id))
-    await db_session.commit()
+    # 3. Удаляем запись, а файл - только если на него больше никто не ссылается
+    deleted_image = await _delete_image(image_id, db_session)
+    if deleted_image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    return {"message": "Файл успешно удалён"}
+
 
-    return {"message": "Файл успешно удалён"}
\ No newline at end of file
+### Category handlers ###
+@category_router.get("/tree", response_model=CategoryTreeResponse)
+async def get_category_tree(db: AsyncSession = Depends(get_read_db)) -> CategoryTreeResponse:
+    # дерево отдаётся из памяти воркера, база нужна только после изменений
+    return await _get_category_tree(db)
+
+@category_router.post("/", response_model=ShowCategory)
+async def create_category(
+    body: CategoryCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> ShowCategory:
+    _check_can_edit_categories(current_user)
+    return await _create_category(body, db)
+
+@category_router.patch("/", response_model=ShowCategory)
+async def update_category(
+    category_id: UUID,
+    body: UpdateCategoryRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> ShowCategory:
+    _check_can_edit_categories(current_user)
+    if not body.model_fields_set:
+        raise HTTPException(status_code=422, detail="At least one parameter for category update info should be provided")
+    return await _update_category(category_id, body, db)
+
+@category_router.delete("/", response_model=DeleteCategoryResponse)
+async def delete_category(
+    category_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> DeleteCategoryResponse:
+    _check_can_edit_categories(current_user)
+    return await _delete_category(category_id, db)
@@ -0,0 +1,26 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from analytics import view_counter
+from cache import get_category_tree_cache, get_principal_cache, get_product_cache
+from db.session import get_engine, pool_metrics
+from events import product_events
+from hashing import get_async_hasher
+from metrics import render_gauges, render_prometheus
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics() -> PlainTextResponse:
+    content = render_prometheus(extra_gauges=[
+        render_gauges("db_pool", "Primary connection pool state", pool_metrics.snapshot(get_engine().pool)),
+        render_gauges("password_hasher", "Password hashing worker pool state", get_async_hasher().metrics.snapshot()),
+        render_gauges("principal_cache", "Authenticated principal cache", get_principal_cache().stats.snapshot()),
+        render_gauges("product_cache", "Product read cache", get_product_cache().stats.snapshot()),
+        render_gauges("category_tree_cache", "In-memory category tree", get_category_tree_cache().stats.snapshot()),
+        render_gauges("product_events", "Product change feed subscribers", product_events.snapshot()),
+        render_gauges("product_views", "Write-behind product view counters", view_counter.snapshot()),
+    ])
+    # формат text exposition, который понимает Prometheus
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4")
@@ -1,10 +1,10 @@
-from datetime import date
+from datetime import date, datetime
 import re
 import uuid
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import HTTPException
-from pydantic import BaseModel, EmailStr, field_validator, validator, constr
+from pydantic import BaseModel, ConfigDict, EmailStr, field_validator, constr
 
 #########################
 # BLOCK WITH API MODELS #
@@ -14,10 +14,8 @@ LETTER_MATCH_PATTERN = re.compile(r"^[а-яА-Яa-zA-Z\-]+$")
 
 
 class TunedModel(BaseModel):
-    class Config:
-        """tells pydantic to convert even non dict obj to json"""
-
-        orm_mode = True
+    # tells pydantic to convert even non dict obj (ORM rows) to json
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ShowUser(TunedModel):
@@ -63,6 +61,26 @@ class UserCreate(BaseModel):
         return value
 
 
+class PortfolioProduct(BaseModel):
+    product_id: uuid.UUID
+    name: str
+    description: Optional[str] = None
+    logo: Optional[str] = None
+    link_to_product: Optional[str] = None
+    status_of_project: Optional[str] = None
+    post_date: Optional[date] = None
+
+
+class UserPortfolioResponse(BaseModel):
+    user: ShowUser
+    product_count: int
+    active_product_count: int
+    status_counts: dict[str, int]
+    latest_post_date: Optional[date] = None
+    latest_product_id: Optional[uuid.UUID] = None
+    products: List[PortfolioProduct]
+
+
 class DeleteUserResponse(BaseModel):
     deleted_user_id: uuid.UUID
 
@@ -154,4 +172,129 @@ class UpdateProductRequest(BaseModel):
     link: Optional[str]
 
 class DeleteProductResponse(BaseModel):
-    deleted_product_id: uuid.UUID
\ No newline at end of file
+    deleted_product_id: uuid.UUID
+
+class ProductListResponse(BaseModel):
+    items: List[ShowProduct]
+    next_cursor: Optional[str] = None
+
+
+class ProductSearchHit(BaseModel):
+    product: ShowProduct
+    rank: float
+    headline: str
+
+
+class ProductSearchResponse(BaseModel):
+    items: List[ProductSearchHit]
+    next_cursor: Optional[str] = None
+
+
+### Image ###
+class ImageDerivativeInfo(BaseModel):
+    width: int
+    height: int
+    format: str
+    path: str
+
+
+class ShowImage(BaseModel):
+    image_id: uuid.UUID
+    product_id: Optional[uuid.UUID] = None
+    sha256: Optional[str] = None
+    size: Optional[int] = None
+    derivatives_status: Optional[str] = None
+    derivatives: List[ImageDerivativeInfo] = []
+
+
+class ProductBatchRequest(BaseModel):
+    product_ids: List[uuid.UUID]
+    include_images: bool = False
+
+
+class ProductBatchItem(BaseModel):
+    product: ShowProduct
+    images: Optional[List[ShowImage]] = None
+
+
+class ProductBatchResponse(BaseModel):
+    items: List[ProductBatchItem]
+    missing_ids: List[uuid.UUID]
+
+
+class BulkImportError(BaseModel):
+    row: int
+    error: str
+
+
+class BulkImportReport(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BulkImportError]
+
+
+class ProductTrendingItem(BaseModel):
+    product: ShowProduct
+    views: int
+    previous_views: int
+    clicks: int
+    score: float
+
+
+class ProductTrendingResponse(BaseModel):
+    items: List[ProductTrendingItem]
+    computed_at: Optional[datetime] = None
+
+
+class ProductStatsBucket(BaseModel):
+    bucket_start: datetime
+    views: int
+    clicks: int
+
+
+class ProductStatsResponse(BaseModel):
+    product_id: uuid.UUID
+    buckets: List[ProductStatsBucket]
+
+
+class ShowCategory(TunedModel):
+    id: uuid.UUID
+    name: str
+    parent_id: Optional[uuid.UUID] = None
+    path: str
+    depth: int
+
+
+class CategoryTreeNode(BaseModel):
+    id: uuid.UUID
+    name: str
+    children: List["CategoryTreeNode"] = []
+
+
+class CategoryTreeResponse(BaseModel):
+    items: List[CategoryTreeNode]
+
+
+class CategoryCreate(BaseModel):
+    name: constr(min_length=1, max_length=100)
+    parent_id: Optional[uuid.UUID] = None
+
+
+class UpdateCategoryRequest(BaseModel):
+    """parent_id: null moves the category to the root, a missing field leaves it where it is"""
+    name: Optional[constr(min_length=1, max_length=100)] = None
+    parent_id: Optional[uuid.UUID] = None
+
+
+class DeleteCategoryResponse(BaseModel):
+    deleted_category_id: uuid.UUID
+    deleted_count: int
+
+
+class ProductCategoriesRequest(BaseModel):
+    category_ids: List[uuid.UUID]
+
+
+class ProductCategoriesResponse(BaseModel):
+    product_id: uuid.UUID
+    category_ids: List[uuid.UUID]
@@ -0,0 +1,28 @@
+"""One-time backfill of user_portfolios for products created before the summary table existed.
+
+    python backfill_portfolios.py
+    python backfill_portfolios.py --batch-size 200
+
+Safe to re-run: users that already have a summary are skipped.
+"""
+
+import argparse
+import asyncio
+
+from db.dals import _backfill_portfolios
+from db.session import async_session, dispose_engine
+
+
+async def main(args):
+    try:
+        async with async_session() as session:
+            backfilled = await _backfill_portfolios(session, batch_size=args.batch_size)
+        print(f"portfolios built for {backfilled} users")
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build missing user portfolio summaries")
+    parser.add_argument("--batch-size", type=int, default=500, help="users per transaction")
+    asyncio.run(main(parser.parse_args()))
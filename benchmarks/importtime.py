@@ -0,0 +1,119 @@
+"""Import-time budget for the application entry point.
+
+    python -m benchmarks.importtime
+    python -m benchmarks.importtime --module main --budget-ms 800
+
+Runs `python -X importtime -c "import main"` in a clean interpreter several times
+and fails (exit code 1) when the best run is over budget, or when the import
+created files on disk, a database engine, caches or worker pools, or pulled in
+redis/Pillow/multiprocessing.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# после импорта приложения ничего из этого не должно быть создано - всё делается в lifespan
+SIDE_EFFECT_CHECK = """
+import sys
+import {module}
+import cache
+import db.session
+import hashing
+import thumbnails
+problems = []
+if db.session._engine is not None:
+    problems.append("database engine created at import")
+if db.session._replica_set is not None:
+    problems.append("replica engines created at import")
+# эти объекты читают настройки при создании, поэтому тоже строятся при первом использовании
+for name, value in (
+    ("principal cache", cache._principal_cache),
+    ("product cache", cache._product_cache),
+    ("category tree cache", cache._category_tree_cache),
+    ("password hasher", hashing._async_hasher),
+    ("thumbnail queue", thumbnails._thumbnail_queue),
+):
+    if value is not None:
+        problems.append(f"{{name}} created at import")
+# тяжёлые необязательные зависимости грузятся при первом использовании (redis ~70 мс, Pillow ~10 мс)
+for name in ("redis", "PIL", "multiprocessing"):
+    if name in sys.modules:
+        problems.append(f"{{name}} imported at import")
+print("\\n".join(problems))
+"""
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """`-X importtime` output -> cumulative microseconds per module"""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if not cumulative_us.strip().isdigit():
+            continue  # строка заголовка
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def measure(module: str, cwd: str) -> dict[str, int]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": str(ROOT), "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if completed.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr)
+
+
+def check_side_effects(module: str, cwd: str) -> list[str]:
+    completed = subprocess.run(
+        [sys.executable, "-c", SIDE_EFFECT_CHECK.format(module=module)],
+        cwd=cwd, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": str(ROOT), "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if completed.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    problems = [line for line in completed.stdout.splitlines() if line]
+    created = sorted(path.name for path in Path(cwd).iterdir())
+    if created:
+        problems.append(f"files created at import: {', '.join(created)}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=1250, help="allowed cumulative import time")
+    parser.add_argument("--runs", type=int, default=5, help="best of N, the first run also warms the OS cache")
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest imports to print")
+    args = parser.parse_args()
+
+    # запускаем из пустой папки, чтобы заметить любые файлы, созданные импортом
+    with tempfile.TemporaryDirectory() as cwd:
+        runs = [measure(args.module, cwd) for _ in range(args.runs)]
+        problems = check_side_effects(args.module, cwd)
+
+    best = min(runs, key=lambda run: run.get(args.module, 0))
+    total_ms = best.get(args.module, 0) / 1000
+    print(f"{'module':<48}{'cumulative ms':>14}")
+    for name, micros in sorted(best.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{name:<48}{micros / 1000:>14.1f}")
+    print(f"\nimport {args.module}: {total_ms:.1f}ms (budget {args.budget_ms:.0f}ms)")
+
+    if total_ms > args.budget_ms:
+        problems.append(f"import time {total_ms:.1f}ms is over budget {args.budget_ms:.0f}ms")
+    if problems:
+        print("\n".join(problems), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Micro-benchmarks for the hot CPU paths of a request.
+
+    python -m benchmarks.micro
+    python -m benchmarks.micro --compare benchmarks/results/micro-<stamp>.json
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from types import SimpleNamespace
+
+from jose import jwt
+
+import settings
+from api.models import ShowProduct
+from benchmarks.common import compare_results, print_table, summarize, write_results
+from hashing import Hasher
+from security import create_access_token
+
+
+def _measure(fn, iterations: int) -> dict:
+    fn()  # прогрев
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _sample_product():
+    # объект с атрибутами как у ORM-модели, ShowProduct читает их через from_attributes
+    return SimpleNamespace(
+        product_id=uuid.uuid4(),
+        user_id=uuid.uuid4(),
+        name="Продукт",
+        description="Описание продукта " * 10,
+        link_to_product="https://example.com/product",
+        price="1000",
+        logo="logo.png",
+        about="О продукте " * 20,
+        problem="Проблема " * 20,
+        decision="Решение " * 20,
+        advantages="Преимущества " * 20,
+        additional="Дополнительно",
+        link="https://example.com",
+    )
+
+
+def run(iterations: int, hash_iterations: int) -> dict:
+    password = "correct horse battery staple"
+    hashed_password = Hasher.get_password_hash(password)
+    token = create_access_token(data={"sub": "user@example.com"})
+    product = _sample_product()
+    return {
+        "hasher_get_password_hash": _measure(lambda: Hasher.get_password_hash(password), hash_iterations),
+        "hasher_verify_password": _measure(lambda: Hasher.verify_password(password, hashed_password), hash_iterations),
+        "create_access_token": _measure(lambda: create_access_token(data={"sub": "user@example.com"}), iterations),
+        "jwt_decode": _measure(
+            lambda: jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]), iterations
+        ),
+        "show_product_serialize": _measure(
+            lambda: ShowProduct.model_validate(product).model_dump_json(), iterations
+        ),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for hashing, JWT and serialization")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--hash-iterations", type=int, default=20, help="bcrypt is slow, keep this small")
+    parser.add_argument("--output", help="where to write JSON results (default: benchmarks/results/)")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.hash_iterations)
+    print_table(results)
+    print(f"results written to {write_results('micro', results, args.output)}")
+    if args.compare:
+        regressions = compare_results(args.compare, results, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,57 @@
+"""Command line bulk import/export of products.
+
+    python bulk.py import products.ndjson
+    python bulk.py import products.csv --format csv
+    python bulk.py export --format csv > products.csv
+    python bulk.py export --include-inactive > products.ndjson
+"""
+
+import argparse
+import asyncio
+import sys
+
+import settings
+from api.actions.bulk import BULK_FORMATS, _export_products, _import_products
+from db.session import async_session, dispose_engine
+
+
+async def _read_file(path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, settings.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def run_import(path: str, fmt: str):
+    async with async_session() as session:
+        report = await _import_products(_read_file(path), fmt, session)
+    print(report.model_dump_json(indent=2))
+
+
+async def run_export(fmt: str, include_inactive: bool):
+    async for part in _export_products(fmt, include_inactive=include_inactive):
+        sys.stdout.write(part)
+
+
+async def main(args):
+    try:
+        if args.command == "import":
+            await run_import(args.path, args.format)
+        else:
+            await run_export(args.format, args.include_inactive)
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import/export of products")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="load products from an NDJSON/CSV file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=BULK_FORMATS, default="ndjson")
+    export_parser = subparsers.add_parser("export", help="write products of all users to stdout")
+    export_parser.add_argument("--format", choices=BULK_FORMATS, default="ndjson")
+    export_parser.add_argument("--include-inactive", action="store_true", help="also export deactivated products")
+    asyncio.run(main(parser.parse_args()))
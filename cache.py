@@ -0,0 +1,341 @@
+"""In-process and shared caches used to keep hot lookups off the database"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+import settings
+
+#########################
+# BLOCK WITH CACHE CORE #
+#########################
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class CacheBackend:
+    """Interface for cache storages. Values must be JSON-compatible so any backend can hold them"""
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    async def get_counter(self, key: str) -> int:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """LRU cache with per-entry TTL living in the worker process"""
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.evictions = 0
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        # счётчики не вытесняются и не протухают, поэтому живут отдельно от LRU
+        self._counters: dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def get_counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache shared between workers through any Redis-compatible server"""
+    def __init__(self, url: str):
+        # redis - необязательная зависимость, нужна только для общего кэша;
+        # импортируем при создании бэкенда: на уровне модуля он добавлял ~70 мс к импорту приложения
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("redis package is required for CACHE_REDIS_URL")
+        self._client = aioredis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._client.get(key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self._client.set(key, json.dumps(value), px=int(ttl * 1000))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._client.delete(*keys)
+
+    async def get_counter(self, key: str) -> int:
+        raw = await self._client.get(key)
+        return int(raw) if raw is not None else 0
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(key)
+
+
+def make_cache_backend(max_size: int) -> CacheBackend:
+    if settings.CACHE_REDIS_URL:
+        return RedisCacheBackend(settings.CACHE_REDIS_URL)
+    return InMemoryCacheBackend(max_size=max_size)
+
+
+##############################
+# BLOCK WITH PRINCIPAL CACHE #
+##############################
+
+
+class PrincipalCache:
+    """Caches authenticated users by token `sub` so protected requests skip the auth query"""
+    PREFIX = "principal:"
+    GENERATION_KEY = f"{PREFIX}generation"
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    async def get_generation(self) -> int:
+        """Take it before loading a user from the database and pass it to set().
+
+        The counter lives in the backend, so with a shared Redis invalidations from every worker count.
+        """
+        return await self.backend.get_counter(self.GENERATION_KEY)
+
+    def _sub_key(self, sub: str) -> str:
+        return f"{self.PREFIX}sub:{sub}"
+
+    def _user_key(self, user_id) -> str:
+        return f"{self.PREFIX}uid:{user_id}"
+
+    async def get(self, sub: str) -> Optional[dict]:
+        principal = await self.backend.get(self._sub_key(sub))
+        self.stats.record(hit=principal is not None)
+        return principal
+
+    async def set(self, sub: str, user_id, principal: dict, generation: Optional[int] = None) -> None:
+        # если пока пользователь грузился кого-то инвалидировали, загруженное могло устареть - не кэшируем
+        if generation is not None and generation != await self.backend.get_counter(self.GENERATION_KEY):
+            return
+        await self.backend.set(self._sub_key(sub), principal, self.ttl)
+        # обратный индекс, чтобы DAL мог выкинуть запись зная только user_id
+        await self.backend.set(self._user_key(user_id), sub, self.ttl)
+
+    async def invalidate_user(self, user_id) -> None:
+        await self.backend.incr(self.GENERATION_KEY)
+        sub = await self.backend.get(self._user_key(user_id))
+        keys = [self._user_key(user_id)]
+        if sub is not None:
+            keys.append(self._sub_key(sub))
+        await self.backend.delete(*keys)
+
+
+_principal_cache: Optional[PrincipalCache] = None
+
+
+def get_principal_cache() -> PrincipalCache:
+    """Returns the principal cache from settings, creating it on first use"""
+    global _principal_cache
+    if _principal_cache is None:
+        _principal_cache = PrincipalCache(
+            backend=make_cache_backend(max_size=settings.PRINCIPAL_CACHE_MAX_SIZE),
+            ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+        )
+    return _principal_cache
+
+
+
+#################################
+# BLOCK WITH READ-THROUGH CACHE #
+#################################
+
+_LOAD_FAILED = object()
+
+
+class ReadThroughCache:
+    """Cache in front of a loader. Concurrent misses for one key share a single load (single-flight)"""
+    def __init__(self, backend: CacheBackend, prefix: str, ttl: float):
+        self.backend = backend
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._invalidations = 0
+
+    def _key(self, key) -> str:
+        return f"{self.prefix}{key}"
+
+    async def get_or_load(self, key, loader: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        cache_key = self._key(key)
+        value = await self.backend.get(cache_key)
+        self.stats.record(hit=value is not None)
+        if value is not None:
+            return value
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            value = await asyncio.shield(inflight)
+            if value is not _LOAD_FAILED:
+                return value
+            # загрузка у "ведущего" запроса сорвалась - грузим сами
+            return await loader()
+        return await self._load(cache_key, loader)
+
+    async def _load(self, cache_key: str, loader: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        invalidations_at_start = self._invalidations
+        try:
+            value = await loader()
+        except BaseException:
+            future.set_result(_LOAD_FAILED)
+            raise
+        finally:
+            if self._inflight.get(cache_key) is future:
+                del self._inflight[cache_key]
+        # если за время загрузки что-то инвалидировали, значение могло устареть - не кэшируем
+        if value is not None and invalidations_at_start == self._invalidations:
+            await self.backend.set(cache_key, value, self.ttl)
+        future.set_result(value)
+        return value
+
+    async def peek(self, key) -> Optional[Any]:
+        """Returns the cached value without loading it and without touching hit/miss stats"""
+        return await self.backend.get(self._key(key))
+
+    async def invalidate(self, key) -> None:
+        cache_key = self._key(key)
+        self._invalidations += 1
+        self._inflight.pop(cache_key, None)
+        await self.backend.delete(cache_key)
+
+
+_product_cache: Optional[ReadThroughCache] = None
+
+
+def get_product_cache() -> ReadThroughCache:
+    """Returns the product cache from settings, creating it on first use"""
+    global _product_cache
+    if _product_cache is None:
+        _product_cache = ReadThroughCache(
+            backend=make_cache_backend(max_size=settings.PRODUCT_CACHE_MAX_SIZE),
+            prefix="product:",
+            ttl=settings.PRODUCT_CACHE_TTL_SECONDS,
+        )
+    return _product_cache
+
+
+##############################
+# BLOCK WITH SNAPSHOT CACHES #
+##############################
+
+
+class SnapshotCache:
+    """Holds one small, whole dataset (e.g. the category tree) in worker memory.
+
+    The snapshot is reloaded on the first request after invalidate() or after `ttl`
+    seconds, which bounds how long other workers keep serving an old copy.
+    """
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._value: Optional[Any] = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _fresh(self) -> bool:
+        ttl = self.ttl if self.ttl is not None else settings.CATEGORY_CACHE_TTL_SECONDS
+        return self._value is not None and time.monotonic() - self._loaded_at < ttl
+
+    async def get_or_load(self, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if self._fresh():
+            self.stats.record(hit=True)
+            return self._value
+        self.stats.record(hit=False)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # пока ждали блокировку, снимок мог загрузить другой запрос
+            if self._fresh():
+                return self._value
+            generation = self._generation
+            value = await loader()
+            if generation == self._generation:
+                self._value = value
+                self._loaded_at = time.monotonic()
+            return value
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._value = None
+
+
+_category_tree_cache: Optional[SnapshotCache] = None
+
+
+def get_category_tree_cache() -> SnapshotCache:
+    global _category_tree_cache
+    if _category_tree_cache is None:
+        _category_tree_cache = SnapshotCache()
+    return _category_tree_cache
+
+
+def reset_caches():
+    """Drops the cache objects, so the next use builds them from the current settings"""
+    global _principal_cache, _product_cache, _category_tree_cache
+    _principal_cache = _product_cache = _category_tree_cache = None
@@ -1,11 +1,19 @@
-from datetime import date
-from typing import Union
-from uuid import UUID
+import json
+from collections import Counter
+from datetime import date, datetime
+from itertools import chain
+from typing import AsyncIterator, Optional, Sequence, Union
+from uuid import UUID, uuid4
 from enum import Enum
-from sqlalchemy import update, and_, select
+from sqlalchemy import REAL, Select, any_, cast, delete, func, insert, literal, literal_column, tuple_, type_coerce, update, and_, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, REGCONFIG, UUID as PG_UUID, aggregate_order_by, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload, selectinload
+from sqlalchemy.orm.interfaces import ORMOption
 
-from db.models import Image, Product, User
+import settings
+from db.models import Category, Image, ImageDerivative, Product, ProductCategory, ProductStat, ProductStatus, ProductTrending, User, UserPortfolio
+from events import PENDING_EVENTS_KEY, make_event
 
 ###########################################################
 # BLOCK FOR INTERACTION WITH DATABASE IN BUSINESS CONTEXT #
@@ -16,6 +24,123 @@ class PortalRole(str, Enum):
      ROLE_PORTAL_ADMIN = "ROLE_PORTAL_ADMIN"
      ROLE_PORTAL_SUPERADMIN = "ROLE_PORTAL_SUPERADMIN"
 
+########################################
+# BLOCK WITH RELATIONSHIP LOAD OPTIONS #
+########################################
+
+# по умолчанию связи не грузятся, а обращение к незагруженной связи падает сразу,
+# вместо неявного запроса (который в async всё равно невозможен)
+NO_RELATIONSHIPS: tuple[ORMOption, ...] = (raiseload("*"),)
+PRODUCT_WITH_IMAGES: tuple[ORMOption, ...] = (
+    selectinload(Product.images).selectinload(Image.derivatives),
+    raiseload("*"),
+)
+
+
+##################################
+# BLOCK WITH PRODUCT CHANGE FEED #
+##################################
+
+
+async def _emit_product_event(session: AsyncSession, event_type: str, product_id, user_id, **data) -> None:
+    """Queues a change event for subscribers; they see it only if the transaction commits"""
+    product_event = make_event(event_type, product_id=product_id, user_id=user_id, **data)
+    if settings.PRODUCT_EVENTS_NOTIFY:
+        # NOTIFY доставляется слушателям только после COMMIT, при откате событие пропадает вместе с изменениями
+        await session.execute(
+            select(func.pg_notify(settings.PRODUCT_EVENTS_CHANNEL, json.dumps(product_event)))
+        )
+    else:
+        session.info.setdefault(PENDING_EVENTS_KEY, []).append(product_event)
+
+
+#####################################
+# BLOCK WITH USER PORTFOLIO SUMMARY #
+#####################################
+
+PORTFOLIO_COLUMNS = [
+    "product_count", "active_product_count", "status_counts", "latest_post_date", "latest_product_id", "products",
+]
+
+
+def _portfolio_rollup(user_ids: Sequence[UUID]):
+    """Aggregates products of the given users into user_portfolios columns, one row per user"""
+    active = Product.is_active.is_(True)
+    newest_first = (Product.post_date.desc().nulls_last(), Product.product_id.desc())
+    brief = func.jsonb_build_object(
+        "product_id", Product.product_id,
+        "name", Product.name,
+        "description", Product.description,
+        "logo", Product.logo,
+        "link_to_product", Product.link_to_product,
+        "status_of_project", Product.status_of_project,
+        "post_date", Product.post_date,
+    )
+    latest = type_coerce(
+        func.array_agg(aggregate_order_by(brief, *newest_first)).filter(active), ARRAY(JSONB)
+    )
+    latest_ids = type_coerce(
+        func.array_agg(aggregate_order_by(Product.product_id, *newest_first)).filter(active), ARRAY(PG_UUID(as_uuid=True))
+    )
+    # статусов немного и список фиксирован, поэтому считаем их одним проходом через FILTER
+    status_counts = func.jsonb_build_object(*chain.from_iterable(
+        (status.name, func.count().filter(and_(active, Product.status_of_project == status)))
+        for status in ProductStatus
+    ))
+    return select(
+        Product.user_id,
+        func.count().label("product_count"),
+        func.count().filter(active).label("active_product_count"),
+        status_counts.label("status_counts"),
+        func.max(Product.post_date).filter(active).label("latest_post_date"),
+        latest_ids[1].label("latest_product_id"),
+        func.coalesce(
+            func.to_jsonb(latest[1:settings.PORTFOLIO_MAX_PRODUCTS]), literal_column("'[]'::jsonb")
+        ).label("products"),
+    ).where(Product.user_id.in_(user_ids)).group_by(Product.user_id)
+
+
+async def _refresh_portfolios(session: AsyncSession, user_ids) -> None:
+    """Recomputes user_portfolios rows of the given users inside the current transaction"""
+    user_ids = list({UUID(str(user_id)) for user_id in user_ids if user_id is not None})
+    if not user_ids:
+        return
+    # пересчёты одного пользователя идут по очереди: следующий ждёт коммита предыдущего
+    # и видит все его продукты, иначе параллельные изменения затирали бы друг друга
+    await session.execute(
+        select(User.user_id).where(User.user_id.in_(user_ids)).
+        order_by(User.user_id).with_for_update(key_share=True)
+    )
+    query = pg_insert(UserPortfolio).from_select(["user_id", *PORTFOLIO_COLUMNS], _portfolio_rollup(user_ids))
+    query = query.on_conflict_do_update(
+        index_elements=[UserPortfolio.user_id],
+        set_={
+            **{column: query.excluded[column] for column in PORTFOLIO_COLUMNS},
+            "refreshed_at": func.now(),
+        },
+    )
+    await session.execute(query)
+
+
+async def _backfill_portfolios(session: AsyncSession, batch_size: int) -> int:
+    """Builds user_portfolios rows for owners of products created before the summary existed.
+
+    Each batch of users is committed on its own; returns how many users got a summary.
+    """
+    backfilled = 0
+    while True:
+        async with session.begin():
+            missing = select(Product.user_id).where(
+                Product.user_id.is_not(None),
+                ~select(UserPortfolio.user_id).where(UserPortfolio.user_id == Product.user_id).exists(),
+            ).distinct().limit(batch_size)
+            user_ids = list((await session.execute(missing)).scalars().all())
+            if not user_ids:
+                return backfilled
+            await _refresh_portfolios(session, user_ids)
+        backfilled += len(user_ids)
+
+
 class UserDAL:
     """Data Access Layer for operating user info"""
     def __init__(self, db_session: AsyncSession):
@@ -53,33 +178,82 @@ class UserDAL:
         await self.db_session.flush()
         return new_user
 
-    async def delete_user(self, user_id: UUID) -> Union[UUID, None]:
+    @staticmethod
+    def _mutable_user_filter(user_id: UUID, forbidden_roles: Optional[Sequence[str]]):
+        conditions = [User.user_id == user_id, User.is_active == True]
+        if forbidden_roles:
+            # проверка прав прямо в WHERE: строку с такой ролью UPDATE просто не затронет
+            conditions.append(or_(User.roles.is_(None), ~User.roles.overlap(list(forbidden_roles))))
+        return and_(*conditions)
+
+    async def delete_user(
+        self, user_id: UUID, forbidden_roles: Optional[Sequence[str]] = None
+    ) -> Union[UUID, None]:
+        """Deactivates the user unless it has one of forbidden_roles; None if no row was changed"""
         query = update(User).\
-            where(and_(User.user_id == user_id, User.is_active == True)).\
-            values(is_active=False).returning(User.user_id)
+            where(self._mutable_user_filter(user_id, forbidden_roles)).\
+            values(is_active=False, version=User.version + 1, updated_at=func.now()).returning(User.user_id)
         res = await self.db_session.execute(query)
         deleted_user_id_row = res.fetchone()
         if deleted_user_id_row is not None:
             return deleted_user_id_row[0]
 
-    async def get_user_by_id(self, user_id: UUID) -> Union[User, None]:
-        query = select(User).where(User.user_id == user_id)
+    async def get_user_by_id(
+        self, user_id: UUID, load_options: Sequence[ORMOption] = NO_RELATIONSHIPS
+    ) -> Union[User, None]:
+        query = select(User).where(User.user_id == user_id).options(*load_options)
         res = await self.db_session.execute(query)
         user_row = res.fetchone()
         if user_row is not None:
             return user_row[0]
     
-    async def get_user_by_email(self, email: str) -> Union[User, None]:
-         query = select(User).where(User.email == email)
+    async def get_user_by_email(
+        self, email: str, load_options: Sequence[ORMOption] = NO_RELATIONSHIPS
+    ) -> Union[User, None]:
+         query = select(User).where(User.email == email).options(*load_options)
          res = await self.db_session.execute(query)
          user_row = res.fetchone()
          if user_row is not None:
              return user_row[0]
 
-    async def update_user(self, user_id: UUID, **kwargs) -> Union[UUID, None]:
+    async def get_portfolio(self, user_id: UUID) -> Union[tuple[User, Optional[dict]], None]:
+        """User with its product summary in one lookup by primary key"""
+        query = select(User, UserPortfolio). \
+            outerjoin(UserPortfolio, UserPortfolio.user_id == User.user_id). \
+            where(User.user_id == user_id). \
+            options(*NO_RELATIONSHIPS)
+        res = await self.db_session.execute(query)
+        portfolio_row = res.fetchone()
+        if portfolio_row is None:
+            return None
+        user, portfolio = portfolio_row
+        if portfolio is not None:
+            return user, {column: getattr(portfolio, column) for column in PORTFOLIO_COLUMNS}
+        # сводки ещё нет (продукты появились до неё) - считаем на лету, без записи: сессия может быть на реплике
+        res = await self.db_session.execute(_portfolio_rollup([user_id]))
+        computed = res.mappings().first()
+        return user, dict(computed) if computed is not None else None
+
+    async def get_user_version(self, user_id: UUID) -> Union[tuple[int, datetime], None]:
+        """Version-only lookup for conditional GET, without loading the whole row"""
+        query = select(User.version, User.updated_at).where(User.user_id == user_id)
+        res = await self.db_session.execute(query)
+        version_row = res.fetchone()
+        if version_row is not None:
+            return version_row[0], version_row[1]
+
+    async def user_exists(self, user_id: UUID) -> bool:
+        """Whether an active user with this id exists"""
+        query = select(User.user_id).where(and_(User.user_id == user_id, User.is_active == True))
+        return await self.db_session.scalar(query) is not None
+
+    async def update_user(
+        self, user_id: UUID, forbidden_roles: Optional[Sequence[str]] = None, **kwargs
+    ) -> Union[UUID, None]:
+        """Updates the user unless it has one of forbidden_roles; None if no row was changed"""
         query = update(User). \
-            where(and_(User.user_id == user_id, User.is_active == True)). \
-            values(kwargs). \
+            where(self._mutable_user_filter(user_id, forbidden_roles)). \
+            values(**kwargs, version=User.version + 1, updated_at=func.now()). \
             returning(User.user_id)
         res = await self.db_session.execute(query)
         update_user_id_row = res.fetchone()
@@ -129,46 +303,480 @@ class ProductDAL:
         
         self.db_session.add(new_product)
         await self.db_session.flush()
+        await _emit_product_event(self.db_session, "product.created", new_product.product_id, new_product.user_id)
+        await _refresh_portfolios(self.db_session, [new_product.user_id])
         return new_product
     
-    async def get_product_by_id(self, product_id: UUID) -> Union[Product, None]:
-        query = select(Product).where(Product.product_id == product_id)
+    async def bulk_create_products(self, rows: list[dict]) -> int:
+        """Inserts many products in one executemany, which SQLAlchemy sends as multi-row INSERTs"""
+        if not rows:
+            return 0
+        await self.db_session.execute(insert(Product), rows)
+        # одно событие на владельца, а не на строку: подписчикам проще перечитать список,
+        # а подписанные на пользователя видят только свои продукты
+        for user_id, count in Counter(row.get("user_id") for row in rows).items():
+            await _emit_product_event(self.db_session, "product.bulk_created", None, user_id, count=count)
+        await _refresh_portfolios(self.db_session, [row.get("user_id") for row in rows])
+        return len(rows)
+
+    async def stream_products(
+        self,
+        columns: list[str],
+        batch_size: int,
+        user_id: Optional[UUID] = None,
+        is_active: Optional[bool] = None,
+    ) -> AsyncIterator[dict]:
+        """Yields products through a server-side cursor, batch_size rows at a time"""
+        query = select(*(getattr(Product, column) for column in columns))
+        if user_id is not None:
+            query = query.where(Product.user_id == user_id)
+        if is_active is not None:
+            query = query.where(Product.is_active.is_(True) if is_active else Product.is_active.is_(False))
+        query = query.order_by(Product.product_id).execution_options(yield_per=batch_size)
+        res = await self.db_session.stream(query)
+        async for row in res.mappings():
+            yield dict(row)
+
+    async def get_product_by_id(
+        self, product_id: UUID, load_options: Sequence[ORMOption] = NO_RELATIONSHIPS
+    ) -> Union[Product, None]:
+        query = select(Product).where(Product.product_id == product_id).options(*load_options)
         res = await self.db_session.execute(query)
         product_row = res.fetchone()
         if product_row is not None:
             return product_row[0]
     
-    async def update_product(self, product_id: UUID, **kwargs) -> Union[UUID, None]:
+    async def get_products_by_ids(
+        self, product_ids: list[UUID], load_options: Sequence[ORMOption] = NO_RELATIONSHIPS
+    ) -> list[Product]:
+        """Fetches many products in one query. Ids go as a single array parameter, so the statement is reused"""
+        ids_param = literal(product_ids, type_=ARRAY(PG_UUID(as_uuid=True)))
+        query = select(Product).where(Product.product_id == any_(ids_param)).options(*load_options)
+        res = await self.db_session.execute(query)
+        return list(res.scalars().all())
+
+    async def get_product_version(self, product_id: UUID) -> Union[tuple[int, datetime], None]:
+        """Version-only lookup for conditional GET, without loading the whole row"""
+        query = select(Product.version, Product.updated_at).where(Product.product_id == product_id)
+        res = await self.db_session.execute(query)
+        version_row = res.fetchone()
+        if version_row is not None:
+            return version_row[0], version_row[1]
+
+    async def list_products(
+        self,
+        limit: int,
+        after_post_date: Optional[date] = None,
+        after_product_id: Optional[UUID] = None,
+        user_id: Optional[UUID] = None,
+        is_active: Optional[bool] = None,
+        status_of_project: Optional[ProductStatus] = None,
+        category_path: Optional[str] = None,
+        load_options: Sequence[ORMOption] = NO_RELATIONSHIPS,
+    ) -> list[Product]:
+        """Keyset pagination over (post_date DESC NULLS LAST, product_id DESC)"""
+        query = self._list_products_query(
+            limit, after_post_date, after_product_id, user_id, is_active, status_of_project, category_path
+        ).options(*load_options)
+        res = await self.db_session.execute(query)
+        return list(res.scalars().all())
+
+    @staticmethod
+    def _list_products_query(
+        limit: int,
+        after_post_date: Optional[date] = None,
+        after_product_id: Optional[UUID] = None,
+        user_id: Optional[UUID] = None,
+        is_active: Optional[bool] = None,
+        status_of_project: Optional[ProductStatus] = None,
+        category_path: Optional[str] = None,
+    ) -> Select:
+        query = select(Product)
+        if user_id is not None:
+            query = query.where(Product.user_id == user_id)
+        if is_active is not None:
+            # литерал, а не параметр: иначе планировщик не сможет применить частичный индекс по активным
+            query = query.where(Product.is_active.is_(True) if is_active else Product.is_active.is_(False))
+        if status_of_project is not None:
+            query = query.where(Product.status_of_project == status_of_project)
+        if category_path is not None:
+            # всё поддерево - один диапазон по индексу путей, без рекурсивного обхода
+            lower, upper = _subtree_bounds(category_path)
+            in_subtree = select(ProductCategory.product_id). \
+                join(Category, Category.id == ProductCategory.category_id). \
+                where(and_(Category.path >= lower, Category.path < upper))
+            query = query.where(Product.product_id.in_(in_subtree))
+        if after_product_id is not None:
+            if after_post_date is not None:
+                query = query.where(or_(
+                    Product.post_date < after_post_date,
+                    and_(Product.post_date == after_post_date, Product.product_id < after_product_id),
+                    Product.post_date.is_(None),
+                ))
+            else:
+                # курсор уже в хвосте без даты публикации
+                query = query.where(and_(Product.post_date.is_(None), Product.product_id < after_product_id))
+        return query.order_by(
+            Product.post_date.desc().nulls_last(), Product.product_id.desc()
+        ).limit(limit)
+
+    async def search_products(
+        self,
+        query_text: str,
+        limit: int,
+        after_rank: Optional[float] = None,
+        after_product_id: Optional[UUID] = None,
+        load_options: Sequence[ORMOption] = NO_RELATIONSHIPS,
+    ) -> list[tuple[Product, float, str]]:
+        """Full-text search over the GIN-indexed search_vector, ordered by (rank DESC, product_id DESC)"""
+        ts_query = func.websearch_to_tsquery(literal("russian").cast(REGCONFIG), query_text).op("||")(
+            func.websearch_to_tsquery(literal("english").cast(REGCONFIG), query_text)
+        )
+        rank = func.ts_rank_cd(Product.search_vector, ts_query)
+        headline = func.ts_headline(
+            literal("russian").cast(REGCONFIG),
+            func.concat_ws(" ", Product.description, Product.about),
+            ts_query,
+            "MaxFragments=2, MaxWords=20, MinWords=5",
+        )
+        query = select(Product, rank.label("rank"), headline.label("headline")).where(
+            Product.search_vector.op("@@")(ts_query),
+            Product.is_active.is_not(False),
+        ).options(*load_options)
+        if after_product_id is not None:
+            # ранг float4, поэтому сравниваем тоже в real, иначе равные значения разъедутся
+            query = query.where(
+                tuple_(rank, Product.product_id) < tuple_(cast(after_rank, REAL), after_product_id)
+            )
+        query = query.order_by(rank.desc(), Product.product_id.desc()).limit(limit)
+        res = await self.db_session.execute(query)
+        return [(row[0], row[1], row[2]) for row in res.all()]
+
+    @staticmethod
+    def _owned_product_filter(product_id: UUID, owner_id: Optional[UUID]):
+        if owner_id is None:
+            return Product.product_id == product_id
+        # владелец проверяется в том же UPDATE, без отдельного SELECT перед ним
+        return and_(Product.product_id == product_id, Product.user_id == owner_id)
+
+    async def product_exists(self, product_id: UUID) -> bool:
+        query = select(Product.product_id).where(Product.product_id == product_id)
+        return await self.db_session.scalar(query) is not None
+
+    async def set_product_categories(
+        self, product_id: UUID, category_ids: Sequence[UUID], owner_id: Optional[UUID] = None
+    ) -> Union[UUID, None]:
+        """Replaces the product's categories if it belongs to owner_id (when given); None if not found or not owned"""
+        # смена категорий - тоже изменение продукта: новая версия, и строка заблокирована до коммита
+        owned = await self.db_session.execute(
+            update(Product).
+            where(self._owned_product_filter(product_id, owner_id)).
+            values(version=Product.version + 1, updated_at=func.now()).
+            returning(Product.product_id, Product.user_id)
+        )
+        owned_row = owned.fetchone()
+        if owned_row is None:
+            return None
+        await self.db_session.execute(delete(ProductCategory).where(ProductCategory.product_id == product_id))
+        if category_ids:
+            await self.db_session.execute(
+                insert(ProductCategory),
+                [{"product_id": product_id, "category_id": category_id} for category_id in set(category_ids)],
+            )
+        await _emit_product_event(self.db_session, "product.updated", product_id, owned_row[1], fields=["categories"])
+        return owned_row[0]
+
+    async def update_product(
+        self, product_id: UUID, owner_id: Optional[UUID] = None, **kwargs
+    ) -> Union[UUID, None]:
+        """Updates the product if it belongs to owner_id (when given); None if no row was changed"""
         query = update(Product). \
-            where(Product.product_id == product_id). \
-            values(kwargs). \
-            returning(Product.product_id)
+            where(self._owned_product_filter(product_id, owner_id)). \
+            values(**kwargs, version=Product.version + 1, updated_at=func.now()). \
+            returning(Product.product_id, Product.user_id)
         res = await self.db_session.execute(query)
         update_product_id_row = res.fetchone()
         if update_product_id_row is not None:
+            await _emit_product_event(
+                self.db_session, "product.updated", product_id, update_product_id_row[1], fields=sorted(kwargs)
+            )
+            await _refresh_portfolios(self.db_session, [update_product_id_row[1]])
             return update_product_id_row[0]
 
-    async def delete_product(self, product_id: UUID) -> Union[UUID, None]:
+    async def delete_product(self, product_id: UUID, owner_id: Optional[UUID] = None) -> Union[UUID, None]:
+        """Deactivates the product if it belongs to owner_id (when given); None if no row was changed"""
         query = update(Product).\
-            where(and_(Product.product_id == product_id)).\
-            values(is_active=False).\
-            returning(Product.product_id)
+            where(self._owned_product_filter(product_id, owner_id)).\
+            values(is_active=False, version=Product.version + 1, updated_at=func.now()).\
+            returning(Product.product_id, Product.user_id)
         res = await self.db_session.execute(query)
         deleted_product_id_row = res.fetchone()
         if deleted_product_id_row is not None:
+            await _emit_product_event(self.db_session, "product.deleted", product_id, deleted_product_id_row[1])
+            await _refresh_portfolios(self.db_session, [deleted_product_id_row[1]])
             return deleted_product_id_row[0]
         
 class ImageDAL:
     def __init__(self, db_session: AsyncSession):
         self.db_session = db_session
 
-    async def create_image(self, path: str, product_id: int) -> Image:
-        new_image = Image(path=path, product_id=product_id)
-        self.db_session.add(new_image)
-        await self.db_session.flush()  
+    async def _product_owner(self, product_id: UUID) -> Union[UUID, None]:
+        return await self.db_session.scalar(select(Product.user_id).where(Product.product_id == product_id))
+
+    async def lock_blob(self, sha256: str) -> None:
+        """Transaction-scoped lock serializing file changes (promote/unlink) for one blob"""
+        await self.db_session.execute(select(func.pg_advisory_xact_lock(func.hashtext(sha256))))
+
+    async def create_image(
+        self, path: str, product_id: UUID, sha256: str, size: int, derivatives_status: Optional[str] = None
+    ) -> Image:
+        """Adds a reference to the blob. Repeated uploads of the same content return the existing row"""
+        existing = select(Image). \
+            where(and_(Image.product_id == product_id, Image.sha256 == sha256)). \
+            options(*NO_RELATIONSHIPS)
+        existing_image = (await self.db_session.execute(existing)).scalar_one_or_none()
+        if existing_image is not None:
+            return existing_image
+        # параллельная загрузка того же файла могла вставить строку после SELECT выше:
+        # ON CONFLICT дождётся её коммита и ничего не вставит вместо ошибки уникальности
+        query = pg_insert(Image). \
+            values(path=path, product_id=product_id, sha256=sha256, size=size, derivatives_status=derivatives_status). \
+            on_conflict_do_nothing(constraint="uq_images_product_sha256"). \
+            returning(Image)
+        new_image = (await self.db_session.execute(
+            query, execution_options={"populate_existing": True}
+        )).scalar_one_or_none()
+        if new_image is None:
+            # новый запрос - новый снимок, в нём строка победителя уже видна
+            return (await self.db_session.execute(existing)).scalar_one()
+        await _emit_product_event(
+            self.db_session, "image.created", product_id, await self._product_owner(product_id),
+            image_id=str(new_image.id),
+        )
         return new_image
+
+    async def get_image_with_owner(
+        self, image_id: UUID, load_options: Sequence[ORMOption] = NO_RELATIONSHIPS
+    ) -> Union[tuple[Image, Optional[UUID]], None]:
+        query = select(Image, Product.user_id). \
+            outerjoin(Product, Product.product_id == Image.product_id). \
+            where(Image.id == image_id). \
+            options(*load_options)
+        res = await self.db_session.execute(query)
+        image_row = res.fetchone()
+        if image_row is not None:
+            return image_row[0], image_row[1]
+
+    async def delete_image(self, image_id: UUID) -> Union[Image, None]:
+        query = delete(Image).where(Image.id == image_id).returning(Image).options(*NO_RELATIONSHIPS)
+        res = await self.db_session.execute(query)
+        deleted_image = res.scalar_one_or_none()
+        if deleted_image is not None and deleted_image.product_id is not None:
+            await _emit_product_event(
+                self.db_session, "image.deleted", deleted_image.product_id,
+                await self._product_owner(deleted_image.product_id), image_id=str(image_id),
+            )
+        return deleted_image
+
+    async def count_blob_references(self, sha256: str) -> int:
+        query = select(func.count()).select_from(Image).where(Image.sha256 == sha256)
+        res = await self.db_session.execute(query)
+        return res.scalar_one()
     
-    async def get_images_by_product(self, product_id: int) -> list[Image]:
-        result = await self.session.execute(select(Image).where(Image.product_id == product_id))
+    async def set_derivatives_status(self, image_id: UUID, status: str) -> None:
+        query = update(Image).where(Image.id == image_id).values(derivatives_status=status)
+        await self.db_session.execute(query)
+
+    async def get_image_jobs_by_derivatives_status(self, statuses: Sequence[str]) -> list[tuple[UUID, str]]:
+        """(id, sha256) of images whose derivatives are in one of the statuses"""
+        query = select(Image.id, Image.sha256). \
+            where(and_(Image.derivatives_status.in_(statuses), Image.sha256.is_not(None))). \
+            order_by(Image.id)
+        res = await self.db_session.execute(query)
+        return [(row[0], row[1]) for row in res.all()]
+
+    async def replace_derivatives(self, image_id: UUID, derivatives: list[dict]) -> None:
+        # одну картинку могут пересчитать два процесса (перезапуск поднял её из pending):
+        # блокировка строки не даёт им вставить превью дважды
+        await self.db_session.execute(select(Image.id).where(Image.id == image_id).with_for_update())
+        await self.db_session.execute(delete(ImageDerivative).where(ImageDerivative.image_id == image_id))
+        self.db_session.add_all(ImageDerivative(image_id=image_id, **derivative) for derivative in derivatives)
+        await self.db_session.flush()
+
+    async def get_derivatives(self, image_id: UUID) -> list[ImageDerivative]:
+        query = select(ImageDerivative). \
+            where(ImageDerivative.image_id == image_id). \
+            options(*NO_RELATIONSHIPS). \
+            order_by(ImageDerivative.width, ImageDerivative.format)
+        res = await self.db_session.execute(query)
+        return list(res.scalars().all())
+
+    async def get_images_by_product(
+        self, product_id: UUID, load_options: Sequence[ORMOption] = NO_RELATIONSHIPS
+    ) -> list[Image]:
+        query = select(Image).where(Image.product_id == product_id).options(*load_options)
+        result = await self.db_session.execute(query)
         return result.scalars().all()
-    
\ No newline at end of file
+
+
+def _subtree_bounds(path: str) -> tuple[str, str]:
+    # пути заканчиваются на "/", а следующий за ним символ - "0": всё поддерево лежит в [path, path[:-1] + "0")
+    return path, path[:-1] + "0"
+
+
+class CategoryDAL:
+    """Data Access Layer for the category tree stored as materialized paths"""
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def get_all_categories(self) -> list[Category]:
+        query = select(Category).order_by(Category.path)
+        res = await self.db_session.execute(query)
+        return list(res.scalars().all())
+
+    async def get_category(self, category_id: UUID) -> Union[Category, None]:
+        query = select(Category).where(Category.id == category_id)
+        res = await self.db_session.execute(query)
+        return res.scalar_one_or_none()
+
+    async def lock_categories(self, category_ids: Sequence[UUID], read: bool = False) -> dict[UUID, Category]:
+        """Locks the rows (FOR SHARE with read=True) and re-reads them, so paths can't change until commit"""
+        query = select(Category). \
+            where(Category.id.in_(category_ids)). \
+            order_by(Category.id). \
+            with_for_update(read=read). \
+            execution_options(populate_existing=True)
+        res = await self.db_session.execute(query)
+        return {category.id: category for category in res.scalars().all()}
+
+    async def lock_moves(self) -> None:
+        """Serializes moves until commit: a move checks for cycles against paths no other move is rewriting"""
+        await self.db_session.execute(select(func.pg_advisory_xact_lock(func.hashtext("category_moves"))))
+
+    async def create_category(self, name: str, parent: Optional[Category] = None) -> Category:
+        category_id = uuid4()
+        parent_path = parent.path if parent is not None else "/"
+        new_category = Category(
+            id=category_id,
+            name=name,
+            parent_id=parent.id if parent is not None else None,
+            path=f"{parent_path}{category_id.hex}/",
+            depth=parent.depth + 1 if parent is not None else 0,
+        )
+        self.db_session.add(new_category)
+        await self.db_session.flush()
+        return new_category
+
+    async def rename_category(self, category_id: UUID, name: str) -> Union[UUID, None]:
+        query = update(Category).where(Category.id == category_id).values(name=name).returning(Category.id)
+        res = await self.db_session.execute(query)
+        return res.scalar_one_or_none()
+
+    async def move_category(self, category: Category, new_parent: Optional[Category]) -> None:
+        """Re-parents the category; paths of the whole subtree are rewritten in one UPDATE.
+
+        Expects lock_moves() and fresh category/new_parent rows from lock_categories().
+        """
+        old_path = category.path
+        new_path = f"{new_parent.path if new_parent is not None else '/'}{category.id.hex}/"
+        depth_delta = (new_parent.depth + 1 if new_parent is not None else 0) - category.depth
+        lower, upper = _subtree_bounds(old_path)
+        # сначала блокируем поддерево: создание детей ждёт (оно держит FOR SHARE на родителе),
+        # а UPDATE ниже со свежим снимком увидит и тех детей, что успели закоммитить до блокировки
+        await self.db_session.execute(
+            select(Category.id).
+            where(and_(Category.path >= lower, Category.path < upper)).
+            order_by(Category.id).
+            with_for_update()
+        )
+        await self.db_session.execute(
+            update(Category).
+            where(and_(Category.path >= lower, Category.path < upper)).
+            values(
+                path=literal(new_path) + func.substr(Category.path, len(old_path) + 1),
+                depth=Category.depth + depth_delta,
+            )
+        )
+        await self.db_session.execute(
+            update(Category).
+            where(Category.id == category.id).
+            values(parent_id=new_parent.id if new_parent is not None else None)
+        )
+
+    async def delete_category(self, category: Category) -> int:
+        """Deletes the category with its whole subtree; product links go away by ON DELETE CASCADE"""
+        lower, upper = _subtree_bounds(category.path)
+        res = await self.db_session.execute(
+            delete(Category).where(and_(Category.path >= lower, Category.path < upper)).returning(Category.id)
+        )
+        return len(res.all())
+
+
+class ProductStatsDAL:
+    """Data Access Layer for view/click counters and the trending rollup"""
+    # клик - более сильный сигнал интереса, чем просмотр
+    CLICK_WEIGHT = 3
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def upsert_counters(self, rows: list[dict]) -> None:
+        """rows: {product_id, bucket_start, views, clicks}; counters are added to what is already stored"""
+        if not rows:
+            return
+        query = pg_insert(ProductStat).values(rows)
+        query = query.on_conflict_do_update(
+            index_elements=[ProductStat.product_id, ProductStat.bucket_start],
+            set_={
+                "views": ProductStat.views + query.excluded.views,
+                "clicks": ProductStat.clicks + query.excluded.clicks,
+            },
+        )
+        await self.db_session.execute(query)
+
+    async def refresh_trending(self, window_start: datetime, previous_start: datetime, keep_since: datetime) -> bool:
+        """Rebuilds product_trending from product_stats; False if another worker is doing it right now"""
+        locked = await self.db_session.scalar(
+            select(func.pg_try_advisory_xact_lock(func.hashtext("product_trending")))
+        )
+        if not locked:
+            return False
+        in_window = ProductStat.bucket_start >= window_start
+        views = func.coalesce(func.sum(ProductStat.views).filter(in_window), 0)
+        previous_views = func.coalesce(func.sum(ProductStat.views).filter(~in_window), 0)
+        clicks = func.coalesce(func.sum(ProductStat.clicks).filter(in_window), 0)
+        rollup = select(
+            ProductStat.product_id,
+            views,
+            previous_views,
+            clicks,
+            cast(views + clicks * self.CLICK_WEIGHT, REAL),
+        ).where(ProductStat.bucket_start >= previous_start).group_by(ProductStat.product_id)
+        # читатели до коммита видят прошлую версию таблицы, пустой её никто не застанет
+        await self.db_session.execute(delete(ProductTrending))
+        await self.db_session.execute(
+            insert(ProductTrending).from_select(
+                ["product_id", "views", "previous_views", "clicks", "score"], rollup
+            )
+        )
+        await self.db_session.execute(delete(ProductStat).where(ProductStat.bucket_start < keep_since))
+        return True
+
+    async def get_trending(
+        self, limit: int, load_options: Sequence[ORMOption] = NO_RELATIONSHIPS
+    ) -> list[tuple[Product, ProductTrending]]:
+        query = select(Product, ProductTrending). \
+            join(Product, Product.product_id == ProductTrending.product_id). \
+            where(Product.is_active.is_(True)). \
+            order_by(ProductTrending.score.desc(), ProductTrending.product_id). \
+            limit(limit). \
+            options(*load_options)
+        res = await self.db_session.execute(query)
+        return [(row[0], row[1]) for row in res.all()]
+
+    async def get_product_stats(self, product_id: UUID, since: datetime) -> list[ProductStat]:
+        query = select(ProductStat). \
+            where(and_(ProductStat.product_id == product_id, ProductStat.bucket_start >= since)). \
+            order_by(ProductStat.bucket_start)
+        res = await self.db_session.execute(query)
+        return list(res.scalars().all())
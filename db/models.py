@@ -4,8 +4,8 @@ import uuid
 from enum import Enum
 from sqlalchemy import Date, ForeignKey, ForeignKeyConstraint, Index, PrimaryKeyConstraint, UniqueConstraint
 
-from sqlalchemy import Column, DateTime, Integer, String, Boolean
-from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from sqlalchemy import BigInteger, Column, Computed, DateTime, Float, Integer, String, Boolean, func
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, JSONB, TSVECTOR
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column, relationship
 from sqlalchemy import Enum as SQLAEnum
 
@@ -24,6 +24,22 @@ class ProductStatus(str, Enum):  # наследуем str, чтобы хорош
     status6 = "В поиске отзывовб оценки",
     status7 = "В поиске партнерства и коллабы"
 
+# контент двуязычный, поэтому каждое поле индексируем и русской, и английской конфигурацией
+def _bilingual_tsvector(weight: str, *columns: str) -> str:
+    document = " || ' ' || ".join(f"coalesce({column}, '')" for column in columns)
+    return " || ".join(
+        f"setweight(to_tsvector('{config}'::regconfig, {document}), '{weight}')"
+        for config in ("russian", "english")
+    )
+
+
+PRODUCT_SEARCH_VECTOR_SQL = " || ".join((
+    _bilingual_tsvector("A", "name"),
+    _bilingual_tsvector("B", "description", "about"),
+    _bilingual_tsvector("C", "problem", "decision", "advantages"),
+))
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -41,6 +57,9 @@ class User(Base):
     headline: Mapped[str] = mapped_column(String, nullable=True)
     about: Mapped[str] = mapped_column(String, nullable=True)
     links: Mapped[str] = mapped_column(String, nullable=True)
+    # версия и время изменения для ETag/Last-Modified, обновляются в UserDAL
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
     
     products: Mapped[list["Product"]] = relationship(back_populates="user")
 
@@ -61,7 +80,7 @@ class Product(Base):
     name: Mapped[str] = mapped_column(String, nullable=True)
     description: Mapped[str] = mapped_column(String, nullable=True)
     link_to_product: Mapped[str] = mapped_column(String, nullable=True)
-    #categories: Mapped[list["Category"]] = relationship(back_populates="product_id") #Категории - [{ id, name, path }]
+    categories: Mapped[list["Category"]] = relationship(secondary="product_categories", viewonly=True) #Категории - [{ id, name, path }]
     price: Mapped[str] = mapped_column(String, nullable=True)
     logo: Mapped[str] = mapped_column(String, nullable=True)
     about: Mapped[str] = mapped_column(String, nullable=True)
@@ -72,9 +91,15 @@ class Product(Base):
     link: Mapped[str] = mapped_column(String, nullable=True)
     status_of_project: Mapped[ProductStatus] = mapped_column(SQLAEnum(ProductStatus, name="product_status_enum"), nullable=True)
     born_date: Mapped[datetime.date] = mapped_column(Date, nullable=True)
-    post_date: Mapped[datetime.date] = mapped_column(Date, nullable=True)
+    post_date: Mapped[datetime.date] = mapped_column(Date, nullable=True, default=datetime.date.today)
     pictures = Column(ARRAY(String), nullable=True) #Галерея - массив изображений продукта
+    # версия и время изменения для ETag/Last-Modified, обновляются в ProductDAL
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
     images: Mapped[list["Image"]] = relationship(back_populates="product")
+    search_vector = mapped_column(
+        TSVECTOR, Computed(PRODUCT_SEARCH_VECTOR_SQL, persisted=True), deferred=True
+    )  # генерируемая колонка для полнотекстового поиска, в обычные выборки не грузим
     #audience: Mapped[int] = mapped_column(Integer, nullable=True)
 
     #__table_args__ = (
@@ -82,14 +107,43 @@ class Product(Base):
     #    Index('title_content_index' 'title', 'content'), # composite index on title and content   
     #)
 
+# порядок совпадает с сортировкой списка продуктов, чтобы keyset-пагинация шла по индексу
+PRODUCT_LIST_ORDER = (Product.post_date.desc().nulls_last(), Product.product_id.desc())
+Index("ix_products_post_date_product_id", *PRODUCT_LIST_ORDER)
+# фильтры списка: равенство по ведущей колонке + тот же порядок, чтобы не было сортировки
+Index("ix_products_user_id_post_date", Product.user_id, *PRODUCT_LIST_ORDER)
+Index("ix_products_status_post_date", Product.status_of_project, *PRODUCT_LIST_ORDER)
+# неактивных (удалённых) продуктов мало кто смотрит, поэтому частичный индекс только по активным
+Index(
+    "ix_products_active_post_date",
+    *PRODUCT_LIST_ORDER,
+    postgresql_where=Product.is_active.is_(True),
+)
+Index("ix_products_search_vector", Product.search_vector, postgresql_using="gin")
+
 
 class Category(Base):
     __tablename__ = "categories"
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name: Mapped[int] = mapped_column(Integer, nullable=False)   
-    #product_id: Mapped[int] = mapped_column(ForeignKey("products.product_id"))
-    #author: Mapped[User] = relationship(back_populates="posts")
+    name: Mapped[str] = mapped_column(String, nullable=False)
+    parent_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("categories.id", ondelete="CASCADE"), nullable=True, index=True)
+    # материализованный путь "/<id корня>/.../<id>/" из hex-id предков; поддерево - диапазон строк с этим префиксом.
+    # collation "C" сравнивает побайтно, поэтому диапазон по btree-индексу точно совпадает с префиксом
+    path: Mapped[str] = mapped_column(String(collation="C"), nullable=False)
+    depth: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
+Index("ix_categories_path", Category.path, unique=True)
+
+
+class ProductCategory(Base):
+    __tablename__ = "product_categories"
+
+    product_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("products.product_id", ondelete="CASCADE"), primary_key=True)
+    category_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True)
+
+# фильтр списка идёт от категорий к продуктам, PK (product_id, category_id) для этого не подходит
+Index("ix_product_categories_category_id_product_id", ProductCategory.category_id, ProductCategory.product_id)
 
 class Image(Base):
     __tablename__ = "images"
@@ -97,5 +151,68 @@ class Image(Base):
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     path: Mapped[str] = mapped_column(nullable=False)
     product_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("products.product_id"), nullable=True)
+    sha256: Mapped[str] = mapped_column(String(64), nullable=True, index=True)  # адрес блоба в хранилище
+    size: Mapped[int] = mapped_column(Integer, nullable=True)
+    derivatives_status: Mapped[str] = mapped_column(String, nullable=True)  # pending/processing/ready/failed
+
+    product: Mapped["Product"] = relationship(back_populates="images")
+    derivatives: Mapped[list["ImageDerivative"]] = relationship(back_populates="image", passive_deletes=True)
+
+    __table_args__ = (
+        # одна и та же картинка у продукта хранится одной записью
+        UniqueConstraint("product_id", "sha256", name="uq_images_product_sha256"),
+    )
+
+
+class ImageDerivative(Base):
+    __tablename__ = "image_derivatives"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    image_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("images.id", ondelete="CASCADE"), nullable=False, index=True)
+    width: Mapped[int] = mapped_column(Integer, nullable=False)
+    height: Mapped[int] = mapped_column(Integer, nullable=False)
+    format: Mapped[str] = mapped_column(String, nullable=False)
+    path: Mapped[str] = mapped_column(String, nullable=False)
+
+    image: Mapped["Image"] = relationship(back_populates="derivatives")
+
+
+class ProductStat(Base):
+    """Views and clicks of a product per time bucket, written in batches by analytics.ViewCounter"""
+    __tablename__ = "product_stats"
+
+    product_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("products.product_id", ondelete="CASCADE"), primary_key=True)
+    bucket_start: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    views: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+    clicks: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+
+# rollup и чистка старых данных идут по диапазону времени, а не по продукту
+Index("ix_product_stats_bucket_start", ProductStat.bucket_start)
+
+
+class ProductTrending(Base):
+    """Precomputed rollup of product_stats over the trending window, rebuilt periodically"""
+    __tablename__ = "product_trending"
+
+    product_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("products.product_id", ondelete="CASCADE"), primary_key=True)
+    views: Mapped[int] = mapped_column(BigInteger, nullable=False)  # за текущее окно
+    previous_views: Mapped[int] = mapped_column(BigInteger, nullable=False)  # за окно перед ним, для динамики
+    clicks: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    score: Mapped[float] = mapped_column(Float, nullable=False)
+    computed_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+Index("ix_product_trending_score", ProductTrending.score.desc(), ProductTrending.product_id)
+
+
+class UserPortfolio(Base):
+    """Per-user summary of products for profile pages, recomputed by ProductDAL on every product change"""
+    __tablename__ = "user_portfolios"
 
-    product: Mapped["Product"] = relationship(back_populates="images")
\ No newline at end of file
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    product_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    active_product_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    status_counts: Mapped[dict] = mapped_column(JSONB, nullable=False)  # имя статуса -> число активных продуктов
+    latest_post_date: Mapped[datetime.date] = mapped_column(Date, nullable=True)
+    latest_product_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=True)
+    products: Mapped[list] = mapped_column(JSONB, nullable=False)  # последние активные продукты в кратком виде
+    refreshed_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
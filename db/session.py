@@ -1,19 +1,138 @@
-from typing import Generator
+import asyncio
+import itertools
+import logging
+import time
+from typing import Optional
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from fastapi import Request, Response
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
 import settings
+from metrics import record_pool_wait
+
+logger = logging.getLogger(__name__)
 
 ##############################################
 # BLOCK FOR COMMON INTERACTION WITH DATABASE #
 ##############################################
 
-# create async engine for interaction with database
-engine = create_async_engine(settings.REAL_DATABASE_URL, future=True, echo=True)
 
-# create session for the interaction with database
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+class PoolMetrics:
+    """How long requests wait to get a connection out of the pool"""
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def observe_wait(self, wait: float):
+        self.checkouts += 1
+        self.wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def snapshot(self, pool) -> dict:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checked_in": pool.checkedin(),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": self.wait_seconds,
+            "wait_seconds_max": self.max_wait_seconds,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeasuredAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records the time spent waiting for a free connection"""
+    def _do_get(self):
+        started_at = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        wait = time.monotonic() - started_at
+        pool_metrics.observe_wait(wait)
+        record_pool_wait(wait)
+        return connection
+
+
+def create_engine(url: str) -> AsyncEngine:
+    """Creates an async engine with pool settings taken from settings.py"""
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args["statement_cache_size"] = settings.DB_STATEMENT_CACHE_SIZE
+    return create_async_engine(
+        url,
+        future=True,
+        echo=settings.DB_ECHO,
+        poolclass=MeasuredAsyncQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+class LazyLoadError(Exception):
+    """Raised in strict loading mode when a relationship is loaded implicitly"""
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _guard_lazy_loads(orm_execute_state):
+    # связи должны грузиться только явно через load_options в DAL;
+    # у INSERT/UPDATE/DELETE lazy_loaded_from не бывает (и само свойство для них падает)
+    if not orm_execute_state.is_select or orm_execute_state.lazy_loaded_from is None:
+        return
+    state = orm_execute_state.lazy_loaded_from
+    message = f"Implicit lazy load on {state.class_.__name__} ({orm_execute_state.statement})"
+    if settings.DB_STRICT_LOADING:
+        raise LazyLoadError(message)
+    logger.warning(message)
+
+
+# engine и фабрика сессий создаются при первом обращении, а не при импорте модуля
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[sessionmaker] = None
+
+
+def get_engine() -> AsyncEngine:
+    """Returns the primary engine, creating it on first use"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(settings.REAL_DATABASE_URL)
+    return _engine
+
+
+def get_session_factory() -> sessionmaker:
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(get_engine(), expire_on_commit=False, class_=AsyncSession)
+    return _session_factory
+
+
+def async_session() -> AsyncSession:
+    """Opens a new session on the primary database"""
+    return get_session_factory()()
+
+
+async def dispose_engine():
+    """Closes pooled connections; the next get_engine() call builds a fresh engine"""
+    global _engine, _session_factory
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _session_factory = None
 
 
 async def get_db():
@@ -23,3 +142,125 @@ async def get_db():
         yield session
     finally:
         await session.close()
+
+
+###################################
+# BLOCK WITH READ REPLICA ROUTING #
+###################################
+
+STICKY_COOKIE_NAME = "read_primary_until"
+REPLICA_SESSION_KEY = "replica"
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine = create_engine(url)
+        self.session_factory = sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+        self.healthy = True
+
+    @property
+    def active_connections(self) -> int:
+        return self.engine.pool.checkedout()
+
+
+class ReplicaSet:
+    """Picks a healthy replica for read-only sessions, falling back to the primary"""
+    def __init__(self, urls: list[str], strategy: str, health_check_interval: float):
+        self.replicas = [Replica(url) for url in urls]
+        self.strategy = strategy
+        self.health_check_interval = health_check_interval
+        self._round_robin = itertools.count()
+        self._last_health_check = 0.0
+        self._health_check_task: Optional[asyncio.Task] = None
+
+    def choose(self) -> Optional[Replica]:
+        self._maybe_schedule_health_check()
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.strategy == "least_connections":
+            return min(healthy, key=lambda replica: replica.active_connections)
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def _maybe_schedule_health_check(self):
+        if not self.replicas:
+            return
+        if time.monotonic() - self._last_health_check < self.health_check_interval:
+            return
+        if self._health_check_task is not None and not self._health_check_task.done():
+            return
+        self._last_health_check = time.monotonic()
+        self._health_check_task = asyncio.create_task(self.check_health())
+
+    async def _check_replica(self, replica: Replica):
+        try:
+            async with replica.engine.connect() as connection:
+                await asyncio.wait_for(connection.execute(text("SELECT 1")), timeout=settings.DB_POOL_TIMEOUT)
+        except Exception:
+            if replica.healthy:
+                logger.warning("Read replica %s is unhealthy, routing reads elsewhere", replica.engine.url)
+            replica.healthy = False
+        else:
+            replica.healthy = True
+
+    async def check_health(self):
+        await asyncio.gather(*(self._check_replica(replica) for replica in self.replicas))
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+_replica_set: Optional[ReplicaSet] = None
+
+
+def get_replica_set() -> ReplicaSet:
+    """Returns the replica set from settings, creating replica engines on first use"""
+    global _replica_set
+    if _replica_set is None:
+        _replica_set = ReplicaSet(
+            urls=settings.DB_REPLICA_URLS,
+            strategy=settings.DB_REPLICA_STRATEGY,
+            health_check_interval=settings.DB_REPLICA_HEALTH_CHECK_INTERVAL,
+        )
+    return _replica_set
+
+
+async def dispose_replica_set():
+    global _replica_set
+    if _replica_set is not None:
+        await _replica_set.dispose()
+    _replica_set = None
+
+
+def stick_to_primary(response: Response):
+    """After a write the client reads from the primary for a while, so it sees its own changes"""
+    until = time.time() + settings.READ_YOUR_WRITES_SECONDS
+    response.set_cookie(
+        STICKY_COOKIE_NAME, str(int(until)), max_age=settings.READ_YOUR_WRITES_SECONDS, httponly=True
+    )
+
+
+def _is_sticky(request: Request) -> bool:
+    until = request.cookies.get(STICKY_COOKIE_NAME)
+    try:
+        return until is not None and float(until) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_read_db(request: Request):
+    """Dependency for getting async session for read-only handlers"""
+    replica = None if _is_sticky(request) else get_replica_set().choose()
+    session_factory = replica.session_factory if replica is not None else get_session_factory()
+    try:
+        session: AsyncSession = session_factory()
+        session.info[REPLICA_SESSION_KEY] = replica is not None
+        yield session
+    finally:
+        await session.close()
+
+
+def is_replica_session(session: AsyncSession) -> bool:
+    """Whether the session came from get_read_db and reads from a replica, which may lag behind the primary"""
+    return session.info.get(REPLICA_SESSION_KEY, False)
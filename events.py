@@ -0,0 +1,223 @@
+"""Product change feed: in-process fan-out of product events, with Postgres LISTEN/NOTIFY between workers"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+RESYNC = "resync"
+PENDING_EVENTS_KEY = "pending_product_events"
+
+
+def make_event(event_type: str, product_id=None, user_id=None, **data) -> dict:
+    return {
+        "type": event_type,
+        "product_id": str(product_id) if product_id is not None else None,
+        "user_id": str(user_id) if user_id is not None else None,
+        "at": time.time(),
+        **data,
+    }
+
+
+################################
+# BLOCK WITH IN-PROCESS FANOUT #
+################################
+
+
+class Subscription:
+    """Bounded buffer of events for one client.
+
+    A client that can't keep up loses its backlog and gets a single resync event
+    instead, after which it should re-read the state it cares about.
+    """
+    def __init__(self, user_id: Optional[str], product_id: Optional[str], max_size: int):
+        self.user_id = user_id
+        self.product_id = product_id
+        self.dropped = 0
+        self.closed = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+
+    def matches(self, product_event: dict) -> bool:
+        if product_event["type"] == RESYNC:
+            return True
+        if self.user_id is not None and product_event.get("user_id") != self.user_id:
+            return False
+        if self.product_id is not None and product_event.get("product_id") != self.product_id:
+            return False
+        return True
+
+    def _clear(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+            self.dropped += 1
+
+    def offer(self, product_event: dict) -> bool:
+        """Returns False if the buffer overflowed and was replaced with a resync event"""
+        try:
+            self._queue.put_nowait(product_event)
+            return True
+        except asyncio.QueueFull:
+            self._clear()
+            self.dropped += 1
+            self._queue.put_nowait(make_event(RESYNC, reason="overflow"))
+            return False
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Next event, or None on timeout (time to send a heartbeat) and after close()"""
+        if self.closed and self._queue.empty():
+            return None
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.closed = True
+        # будим читателя, чтобы поток завершился сразу, а не по таймауту heartbeat
+        self._clear()
+        self._queue.put_nowait(make_event(RESYNC, reason="shutdown"))
+
+
+class EventBroadcaster:
+    def __init__(self, buffer_size: Optional[int] = None):
+        self.buffer_size = buffer_size
+        self.published = 0
+        self.overflows = 0
+        self._subscriptions: set[Subscription] = set()
+
+    def subscribe(self, user_id: Optional[str] = None, product_id: Optional[str] = None) -> Subscription:
+        subscription = Subscription(
+            user_id=user_id,
+            product_id=product_id,
+            max_size=self.buffer_size or settings.PRODUCT_EVENTS_BUFFER_SIZE,
+        )
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(self, product_event: dict):
+        self.published += 1
+        for subscription in self._subscriptions:
+            if subscription.matches(product_event) and not subscription.offer(product_event):
+                self.overflows += 1
+
+    def resync_all(self, reason: str):
+        self.publish(make_event(RESYNC, reason=reason))
+
+    def close(self):
+        for subscription in self._subscriptions:
+            subscription.close()
+
+    def snapshot(self) -> dict:
+        return {
+            "subscribers": self.subscribers,
+            "published": self.published,
+            "overflows": self.overflows,
+        }
+
+
+product_events = EventBroadcaster()
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_events(session):
+    # без NOTIFY события копятся в сессии и уходят подписчикам этого воркера только после COMMIT
+    for product_event in session.info.pop(PENDING_EVENTS_KEY, []):
+        product_events.publish(product_event)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_events(session):
+    session.info.pop(PENDING_EVENTS_KEY, None)
+
+
+##################################
+# BLOCK WITH CROSS-WORKER FANOUT #
+##################################
+
+
+class PgEventListener:
+    """Keeps one dedicated connection LISTENing on the channel and feeds the local broadcaster"""
+    def __init__(self, broadcaster: EventBroadcaster, check_interval: float = 30):
+        self.broadcaster = broadcaster
+        self.check_interval = check_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            product_event = json.loads(payload)
+        except ValueError:
+            logger.warning("Malformed product event on %s: %r", channel, payload)
+            return
+        self.broadcaster.publish(product_event)
+
+    async def _listen(self, connection, channel: str):
+        lost = asyncio.Event()
+        connection.add_termination_listener(lambda _: lost.set())
+        await connection.add_listener(channel, self._on_notify)
+        while not lost.is_set():
+            try:
+                await asyncio.wait_for(lost.wait(), timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                # молча умершее соединение само не закроется - проверяем его запросом
+                await asyncio.wait_for(connection.fetchval("SELECT 1"), timeout=self.check_interval)
+
+    async def _run(self):
+        import asyncpg  # нужен только воркерам приложения, CLI и импорту модуля он не нужен
+
+        dsn = make_url(settings.REAL_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        channel = settings.PRODUCT_EVENTS_CHANNEL
+        backoff, connected_before = 1, False
+        while True:
+            try:
+                connection = await asyncpg.connect(dsn)
+            except Exception:
+                logger.warning("Can't connect for product events, retrying in %ss", backoff, exc_info=True)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            backoff = 1
+            if connected_before:
+                # всё, что пришло пока соединения не было, потеряно - клиенты перечитывают состояние
+                self.broadcaster.resync_all("reconnected")
+            connected_before = True
+            try:
+                await self._listen(connection, channel)
+            except Exception:
+                logger.warning("Product events connection lost, reconnecting", exc_info=True)
+            finally:
+                try:
+                    await connection.close(timeout=5)
+                except Exception:
+                    pass
+
+
+event_listener = PgEventListener(product_events)
@@ -1,5 +1,13 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional
+
 from passlib.context import CryptContext
- 
+
+import settings
+from metrics import record_hash
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
  
  
@@ -10,4 +18,123 @@ class Hasher:
 
     @staticmethod
     def get_password_hash(password: str) -> str:
-        return pwd_context.hash(password)
\ No newline at end of file
+        return pwd_context.hash(password)
+
+
+############################
+# BLOCK WITH ASYNC HASHING #
+############################
+
+class HasherOverloadedError(Exception):
+    """Raised when too many hashing jobs are already waiting for a worker"""
+
+
+def _timed_call(fn, *args):
+    # runs inside the worker, so the start mark shows how long the job sat in the queue
+    started_at = time.monotonic()
+    result = fn(*args)
+    return result, started_at, time.monotonic()
+
+
+class HasherMetrics:
+    """Counters for hashing jobs: how long they waited for a worker vs. how long bcrypt took"""
+    def __init__(self):
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.queue_wait_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+
+    def observe(self, queue_wait: float, hash_time: float):
+        self.completed += 1
+        self.queue_wait_seconds += queue_wait
+        self.hash_seconds += hash_time
+        self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, queue_wait)
+
+    def snapshot(self) -> dict:
+        return {
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "queue_wait_seconds_total": self.queue_wait_seconds,
+            "hash_seconds_total": self.hash_seconds,
+            "queue_wait_seconds_max": self.max_queue_wait_seconds,
+        }
+
+
+class AsyncHasher:
+    """Runs bcrypt in a bounded worker pool so logins and sign-ups don't block the event loop"""
+    def __init__(self, max_workers: int, max_queue: int, use_processes: bool = False):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.use_processes = use_processes
+        self.metrics = HasherMetrics()
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        # пул создаём лениво, чтобы импорт модуля не поднимал потоки/процессы
+        if self._executor is None:
+            if self.use_processes:
+                # multiprocessing импортируется только если процессы действительно нужны
+                from concurrent.futures import ProcessPoolExecutor
+
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="hasher"
+                )
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.metrics.in_flight >= self.max_workers + self.max_queue:
+            self.metrics.rejected += 1
+            raise HasherOverloadedError("Too many password hashing jobs in progress")
+        loop = asyncio.get_running_loop()
+        submitted_at = time.monotonic()
+        self.metrics.in_flight += 1
+        try:
+            result, started_at, finished_at = await loop.run_in_executor(
+                self._get_executor(), _timed_call, fn, *args
+            )
+        finally:
+            self.metrics.in_flight -= 1
+        self.metrics.observe(
+            queue_wait=max(started_at - submitted_at, 0.0),
+            hash_time=finished_at - started_at,
+        )
+        record_hash(finished_at - started_at)
+        return result
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(Hasher.verify_password, plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str) -> str:
+        return await self._run(Hasher.get_password_hash, password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+_async_hasher: Optional[AsyncHasher] = None
+
+
+def get_async_hasher() -> AsyncHasher:
+    """Returns the hasher from settings, creating it on first use"""
+    global _async_hasher
+    if _async_hasher is None:
+        _async_hasher = AsyncHasher(
+            max_workers=settings.HASHER_MAX_WORKERS,
+            max_queue=settings.HASHER_MAX_QUEUE,
+            use_processes=settings.HASHER_USE_PROCESSES,
+        )
+    return _async_hasher
+
+
+def shutdown_async_hasher():
+    global _async_hasher
+    if _async_hasher is not None:
+        _async_hasher.shutdown()
+    _async_hasher = None
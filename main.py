@@ -1,36 +1,118 @@
-from fastapi import FastAPI
-import uvicorn
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from sqlalchemy import text
 from fastapi.routing import APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 
 from api.handlers import user_router
 from api.login_handler import login_router
 from api.handlers import product_router
+from api.handlers import category_router
+from api.metrics_handler import metrics_router
+import settings
+from analytics import view_counter
+from events import event_listener, product_events
+from db.session import dispose_engine, dispose_replica_set, get_engine, get_replica_set, stick_to_primary
+from hashing import shutdown_async_hasher
+from metrics import MetricsMiddleware
+from thumbnails import get_thumbnail_queue, stop_thumbnail_queue
+
+logger = logging.getLogger(__name__)
+
+############################
+# BLOCK WITH APP LIFECYCLE #
+############################
+
+async def _warm_up_pool():
+    """Opens connections up front so the first requests don't pay for TCP/TLS/auth handshakes"""
+    async def touch():
+        async with get_engine().connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    # соединения держим одновременно, иначе пул будет раз за разом отдавать одно и то же
+    connections = min(settings.DB_POOL_WARMUP_CONNECTIONS, settings.DB_POOL_SIZE)
+    try:
+        await asyncio.gather(*(touch() for _ in range(connections)))
+    except Exception:
+        # база может подняться позже приложения - стартуем всё равно, пул доберёт соединения сам
+        logger.warning("Connection pool warm-up failed", exc_info=True)
+    replica_set = get_replica_set()
+    if replica_set.replicas:
+        await replica_set.check_health()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await _warm_up_pool()
+    if settings.PRODUCT_EVENTS_NOTIFY:
+        event_listener.start()
+    view_counter.start()
+    # задачи на превью живут только в памяти: поднимаем те, что не успел доделать прошлый запуск
+    get_thumbnail_queue().requeue_unfinished()
+    yield
+    # к этому моменту uvicorn уже дождался завершения запросов в работе
+    product_events.close()
+    await event_listener.stop()
+    await stop_thumbnail_queue(drain=True)
+    # накопленные в памяти просмотры дописываем до закрытия пула
+    await view_counter.stop()
+    await asyncio.to_thread(shutdown_async_hasher)
+    await dispose_replica_set()
+    await dispose_engine()
+
 
 #########################
 # BLOCK WITH API ROUTES #
 #########################
 
-# create instance of the app
-app = FastAPI(title="luchanos-oxford-university")
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    # после успешной записи клиент какое-то время читает из основной базы, а не из реплики
+    if (
+        get_replica_set().replicas
+        and request.method not in ("GET", "HEAD", "OPTIONS")
+        and response.status_code < 400
+    ):
+        stick_to_primary(response)
+    return response
+
+
+def create_app() -> FastAPI:
+    """Builds the application; engines and pools are created in lifespan, not here"""
+    # create instance of the app
+    app = FastAPI(title="luchanos-oxford-university", lifespan=lifespan)
 
-# create the instance for the routes
-main_api_router = APIRouter()
+    # create the instance for the routes
+    main_api_router = APIRouter()
 
-# set routes to the app instance
-main_api_router.include_router(user_router, prefix="/user", tags=["user"])
-main_api_router.include_router(login_router, prefix="/login", tags=["login"])
-main_api_router.include_router(product_router, prefix="/product", tags=["product"])
-app.include_router(main_api_router)
+    # set routes to the app instance
+    main_api_router.include_router(user_router, prefix="/user", tags=["user"])
+    main_api_router.include_router(login_router, prefix="/login", tags=["login"])
+    main_api_router.include_router(product_router, prefix="/product", tags=["product"])
+    main_api_router.include_router(category_router, prefix="/category", tags=["category"])
+    app.include_router(main_api_router)
+    app.include_router(metrics_router, tags=["metrics"])
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"]
-)
+    app.middleware("http")(read_your_writes)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"]
+    )
+    # добавляется последним, чтобы оборачивать всё приложение, включая CORS
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+
+app = create_app()
 
 if __name__ == "__main__":
+    import uvicorn
+
     # run app on the host and port
     uvicorn.run(app, host="0.0.0.0", port=8000)
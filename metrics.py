@@ -0,0 +1,184 @@
+"""Request latency, DB query and hashing instrumentation exposed in Prometheus text format"""
+
+import bisect
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+###########################
+# BLOCK WITH METRIC TYPES #
+###########################
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            # счётчики по бакетам + сумма + общее количество
+            series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (bucket_counts, total, count) in self._series.items():
+            labels = _format_labels(self.label_names, label_values)
+            bucket_label_names = self.label_names + ("le",)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(bucket_label_names, label_values + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _format_labels(bucket_label_names, label_values + ("+Inf",))
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def render_gauges(name: str, help_text: str, values: dict) -> list[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for key, value in values.items():
+        lines.append(f'{name}{{stat="{key}"}} {float(value)}')
+    return lines
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+request_db_queries = Histogram(
+    "http_request_db_queries", "DB queries issued per HTTP request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+db_query_latency = Histogram("db_query_duration_seconds", "SQL statement execution time", ())
+password_hash_latency = Histogram(
+    "password_hash_duration_seconds", "bcrypt hash/verify time spent in the worker pool", ()
+)
+pool_wait_latency = Histogram("db_pool_wait_seconds", "Time spent waiting for a pooled connection", ())
+
+
+###################################
+# BLOCK WITH PER-REQUEST TRACKING #
+###################################
+
+
+class RequestStats:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def record_hash(seconds: float):
+    password_hash_latency.observe(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.hash_seconds += seconds
+
+
+def record_pool_wait(seconds: float):
+    pool_wait_latency.observe(seconds)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started_at"].pop()
+    elapsed = time.perf_counter() - started
+    db_query_latency.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+
+
+def _server_timing(stats: RequestStats, total: float) -> bytes:
+    # Server-Timing ждёт миллисекунды
+    return (
+        f"app;dur={total * 1000:.1f}, "
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_queries} queries", '
+        f"pool;dur={stats.pool_wait_seconds * 1000:.1f}, "
+        f"hash;dur={stats.hash_seconds * 1000:.1f}"
+    ).encode()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: records latency per route template and adds a Server-Timing header"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(stats, time.perf_counter() - stats.started_at)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            route = scope.get("route")
+            # шаблон пути, а не сам путь, иначе метрик будет столько же, сколько id
+            route_path = getattr(route, "path", "unmatched")
+            request_latency.observe(
+                time.perf_counter() - stats.started_at, scope["method"], route_path, status_code
+            )
+            request_db_queries.observe(stats.db_queries, route_path)
+
+
+def render_prometheus(extra_gauges: list[list[str]] = ()) -> str:
+    lines = []
+    for histogram in (request_latency, request_db_queries, db_query_latency, password_hash_latency, pool_wait_latency):
+        lines.extend(histogram.render())
+    for gauge_lines in extra_gauges:
+        lines.extend(gauge_lines)
+    return "\n".join(lines) + "\n"
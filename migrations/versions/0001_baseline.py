@@ -0,0 +1,92 @@
+"""baseline schema
+
+Tables as they were before the performance backlog. Databases created earlier with
+create_all/autogenerate already have them: mark them with `alembic stamp 0001` and upgrade from there.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PRODUCT_STATUSES = ('status1', 'status2', 'status3', 'status4', 'status5', 'status6', 'status7')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'users',
+        sa.Column('user_id', sa.UUID(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('surname', sa.String(), nullable=True),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.Column('roles', postgresql.ARRAY(sa.String()), nullable=True),
+        sa.Column('username', sa.String(), nullable=True),
+        sa.Column('current_company', sa.String(), nullable=True),
+        sa.Column('your_role', sa.String(), nullable=True),
+        sa.Column('headline', sa.String(), nullable=True),
+        sa.Column('about', sa.String(), nullable=True),
+        sa.Column('links', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('user_id'),
+        sa.UniqueConstraint('email'),
+    )
+    op.create_table(
+        'products',
+        sa.Column('product_id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.UUID(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('link_to_product', sa.String(), nullable=True),
+        sa.Column('price', sa.String(), nullable=True),
+        sa.Column('logo', sa.String(), nullable=True),
+        sa.Column('about', sa.String(), nullable=True),
+        sa.Column('problem', sa.String(), nullable=True),
+        sa.Column('decision', sa.String(), nullable=True),
+        sa.Column('advantages', sa.String(), nullable=True),
+        sa.Column('additional', sa.String(), nullable=True),
+        sa.Column('link', sa.String(), nullable=True),
+        sa.Column('status_of_project', sa.Enum(*PRODUCT_STATUSES, name='product_status_enum'), nullable=True),
+        sa.Column('born_date', sa.Date(), nullable=True),
+        sa.Column('post_date', sa.Date(), nullable=True),
+        sa.Column('pictures', postgresql.ARRAY(sa.String()), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('product_id'),
+    )
+    op.create_table(
+        'categories',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('name', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'images',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('path', sa.String(), nullable=False),
+        sa.Column('product_id', sa.UUID(), nullable=True),
+        sa.ForeignKeyConstraint(['product_id'], ['products.product_id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('images')
+    op.drop_table('categories')
+    op.drop_table('products')
+    op.drop_table('users')
+    sa.Enum(name='product_status_enum').drop(op.get_bind(), checkfirst=True)
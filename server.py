@@ -0,0 +1,40 @@
+"""Production entry point: python server.py
+
+Runs N uvicorn worker processes (one per core by default) with uvloop/httptools when they
+are installed. Workers finish in-flight requests on SIGTERM and can be recycled after
+SERVER_MAX_REQUESTS requests; the uvicorn supervisor starts a fresh process in their place.
+"""
+
+import importlib.util
+import os
+
+import uvicorn
+
+import settings
+
+
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def main():
+    workers = settings.SERVER_WORKERS or os.cpu_count() or 1
+    uvicorn.run(
+        # приложение передаём строкой, чтобы каждый воркер импортировал его сам
+        "main:app",
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=workers,
+        loop="uvloop" if _has_module("uvloop") else "asyncio",
+        http="httptools" if _has_module("httptools") else "h11",
+        lifespan="on",
+        limit_max_requests=settings.SERVER_MAX_REQUESTS or None,
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_TIMEOUT,
+        backlog=settings.SERVER_BACKLOG,
+        proxy_headers=True,
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
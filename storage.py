@@ -0,0 +1,139 @@
+"""Content-addressed storage of uploaded product images on disk"""
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from fastapi import UploadFile
+
+import settings
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# сигнатуры форматов: блобы лежат без расширения, тип определяем по первым байтам
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+###############################
+# BLOCK WITH STREAMING UPLOAD #
+###############################
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an uploaded file exceeds the allowed size while it is being streamed"""
+
+
+class StagedFile:
+    """Fully received upload waiting in a temp file to be promoted into the blob store"""
+    def __init__(self, tmp_path: Path, sha256: str, size: int):
+        self.tmp_path = tmp_path
+        self.sha256 = sha256
+        self.size = size
+
+
+def blob_root() -> Path:
+    return settings.UPLOAD_DIR / "blobs"
+
+
+def blob_path(sha256: str) -> Path:
+    # шардируем по первым байтам хэша, чтобы в одной папке не копились миллионы файлов
+    return blob_root() / sha256[:2] / sha256[2:4] / sha256
+
+
+def _write_chunk(tmp_file, digest, chunk: bytes):
+    # hashlib отпускает GIL на больших буферах, так что хэш тоже считаем в потоке
+    digest.update(chunk)
+    tmp_file.write(chunk)
+
+
+def _remove_if_exists(path: Path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def save_upload(upload: UploadFile, max_bytes: int) -> StagedFile:
+    """Streams the upload into a temp file chunk by chunk, hashing on the fly.
+
+    The temp file lives next to the blobs so promote() can move it into place atomically.
+    """
+    root = blob_root()
+    await asyncio.to_thread(root.mkdir, parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix=".upload-")
+    tmp_file = os.fdopen(fd, "wb")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await upload.read(settings.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"File {upload.filename} is larger than {max_bytes} bytes")
+            # запись на диск уводим в поток, чтобы не блокировать event loop
+            await asyncio.to_thread(_write_chunk, tmp_file, digest, chunk)
+        await asyncio.to_thread(tmp_file.close)
+    except BaseException:
+        tmp_file.close()
+        await asyncio.to_thread(_remove_if_exists, Path(tmp_path))
+        raise
+    return StagedFile(tmp_path=Path(tmp_path), sha256=digest.hexdigest(), size=size)
+
+
+def _promote(staged: StagedFile) -> Path:
+    destination = blob_path(staged.sha256)
+    if destination.exists():
+        # такой контент уже лежит в хранилище, копия не нужна
+        _remove_if_exists(staged.tmp_path)
+    else:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged.tmp_path, destination)
+    return destination
+
+
+async def promote(staged: StagedFile) -> Path:
+    """Moves a staged upload to its content address. Safe to repeat for identical content.
+
+    Call it after the referencing row is committed, while holding the blob lock
+    (ImageDAL.lock_blob), so a concurrent release of the same blob can't unlink
+    it underneath the new reference.
+    """
+    return await asyncio.to_thread(_promote, staged)
+
+
+async def discard(staged: StagedFile):
+    await asyncio.to_thread(_remove_if_exists, staged.tmp_path)
+
+
+async def remove_file(path: Path):
+    await asyncio.to_thread(_remove_if_exists, Path(path))
+
+
+async def remove_blob(sha256: str):
+    """Unlinks a blob. Call only under the blob lock once its last reference is committed away"""
+    await remove_file(blob_path(sha256))
+
+
+
+def _sniff_media_type(path: Path) -> str:
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, media_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    return "application/octet-stream"
+
+
+async def sniff_media_type(path: Path) -> str:
+    return await asyncio.to_thread(_sniff_media_type, path)
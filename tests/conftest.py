@@ -0,0 +1,164 @@
+"""Shared fixtures. Database tests run against TEST_DATABASE_URL
+(`docker-compose -f docker-compose-local.yml up -d db_test`) and are skipped when it is not reachable.
+"""
+
+import os
+import uuid
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import settings
+from db.dals import PortalRole, ProductDAL, UserDAL
+from db.models import Base
+from cache import reset_caches
+from db.session import get_db, get_read_db
+from main import create_app
+from security import create_access_token
+
+# код приложения, который сам открывает сессии (аналитика, превью), тоже должен ходить в тестовую базу
+os.environ["REAL_DATABASE_URL"] = settings.TEST_DATABASE_URL
+# неявная подгрузка связи в тестах - ошибка, а не предупреждение в логе
+os.environ["DB_STRICT_LOADING"] = "1"
+settings.get_settings.cache_clear()
+
+
+@pytest.fixture
+def override_settings(monkeypatch):
+    """override_settings(NAME=value, ...) sets env variables and reloads settings; all is restored after the test"""
+    def override(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        settings.get_settings.cache_clear()
+        # кэши читают настройки при создании
+        reset_caches()
+
+    yield override
+    monkeypatch.undo()
+    settings.get_settings.cache_clear()
+    reset_caches()
+
+
+@pytest.fixture(scope="session")
+def sync_engine():
+    """Creates the schema once per run; psycopg2 is enough for DDL and cleanup"""
+    url = make_url(settings.TEST_DATABASE_URL).set(drivername="postgresql+psycopg2")
+    engine = create_engine(url, poolclass=NullPool)
+    try:
+        with engine.connect():
+            pass
+    except OperationalError as e:
+        pytest.skip(f"test database is not available: {e.orig}")
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+async def session_factory(sync_engine):
+    """Sessions on a fresh engine; every table is emptied after the test"""
+    engine = create_async_engine(settings.TEST_DATABASE_URL, poolclass=NullPool)
+    try:
+        yield sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    finally:
+        await engine.dispose()
+        tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+        with sync_engine.begin() as connection:
+            connection.execute(text(f"TRUNCATE {tables} CASCADE"))
+
+
+@pytest.fixture
+async def db_session(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+@pytest.fixture
+def make_user(db_session):
+    async def make(**kwargs):
+        fields = {
+            "name": "Ivan",
+            "surname": "Ivanov",
+            "email": f"{uuid.uuid4().hex}@example.com",
+            "hashed_password": "not-a-real-hash",
+            "roles": [PortalRole.ROLE_PORTAL_USER],
+            "username": "ivan",
+            "current_company": "Company",
+            "your_role": "Founder",
+            "headline": "Headline",
+            "about": "About",
+            "links": "https://example.com",
+            **kwargs,
+        }
+        async with db_session.begin():
+            return await UserDAL(db_session).create_user(**fields)
+
+    return make
+
+
+@pytest.fixture
+def make_product(db_session):
+    async def make(user_id, post_date=None, **kwargs):
+        fields = {
+            "user_id": user_id,
+            "name": "Product",
+            "description": "Description",
+            "link_to_product": "https://example.com/product",
+            "price": "100",
+            "logo": "logo.png",
+            "about": "About",
+            "problem": "Problem",
+            "decision": "Decision",
+            "advantages": "Advantages",
+            "additional": "Additional",
+            "link": "https://example.com",
+            "pictures": None,
+            **kwargs,
+        }
+        async with db_session.begin():
+            product = await ProductDAL(db_session).create_product(**fields)
+            if post_date is not None:
+                product.post_date = post_date
+        return product
+
+    return make
+
+
+@pytest.fixture
+async def client(session_factory):
+    """HTTP client for the app; both primary and replica sessions come from the test database"""
+    async def get_test_db():
+        async with session_factory() as session:
+            yield session
+
+    app = create_app()
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_read_db] = get_test_db
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as http_client:
+        yield http_client
+
+
+def auth_headers(user) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+
+
+# полные тела PATCH: поля моделей обязательные, хотя и допускают null
+UPDATE_USER_BODY = {
+    "name": "Petr", "surname": "Petrov", "email": None, "username": None, "current_company": None,
+    "your_role": None, "headline": None, "about": None, "links": None,
+}
+
+UPDATE_PRODUCT_BODY = {
+    "name": "Renamed", "description": None, "link_to_product": None, "logo": None, "about": None,
+    "problem": None, "decision": None, "advantages": None, "additional": None, "link": None,
+}
@@ -0,0 +1,105 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import analytics
+from analytics import ViewCounter
+from db.dals import ProductStatsDAL
+
+
+async def test_trending_lists_products_by_score(client, db_session, make_user, make_product):
+    user = await make_user()
+    popular = await make_product(user.user_id, name="Popular")
+    quiet = await make_product(user.user_id, name="Quiet")
+    now = datetime.now(timezone.utc)
+    async with db_session.begin():
+        stats_dal = ProductStatsDAL(db_session)
+        await stats_dal.upsert_counters([
+            {"product_id": popular.product_id, "bucket_start": now - timedelta(minutes=5), "views": 10, "clicks": 2},
+            {"product_id": quiet.product_id, "bucket_start": now - timedelta(minutes=5), "views": 1, "clicks": 0},
+        ])
+        assert await stats_dal.refresh_trending(
+            window_start=now - timedelta(hours=1),
+            previous_start=now - timedelta(hours=2),
+            keep_since=now - timedelta(days=1),
+        )
+
+    response = await client.get("/product/trending")
+
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [item["product"]["name"] for item in items] == ["Popular", "Quiet"]
+    assert (items[0]["views"], items[0]["clicks"]) == (10, 2)
+    assert response.json()["computed_at"] is not None
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def begin(self):
+        return self
+
+
+@pytest.fixture
+def blocked_upsert(monkeypatch):
+    """The first upsert hangs until released; written rows are collected instead of going to the database"""
+    entered, release = asyncio.Event(), asyncio.Event()
+    written = []
+
+    class FakeStatsDAL:
+        def __init__(self, session):
+            pass
+
+        async def upsert_counters(self, rows):
+            if not entered.is_set():
+                entered.set()
+                await release.wait()
+            written.extend(rows)
+
+    monkeypatch.setattr(analytics, "async_session", FakeSession)
+    monkeypatch.setattr(analytics, "ProductStatsDAL", FakeStatsDAL)
+    return entered, release, written
+
+
+async def test_stop_waits_for_the_flush_in_progress(blocked_upsert):
+    entered, release, written = blocked_upsert
+    counter = ViewCounter()
+    counter._last_rollup = float("inf")  # пересчёт трендов в этом тесте не нужен
+    counter.start()
+    product_id = uuid.uuid4()
+    counter.record(product_id)
+    counter.record(product_id)
+    counter._wakeup.set()
+    await asyncio.wait_for(entered.wait(), timeout=1)
+
+    stopping = asyncio.create_task(counter.stop())
+    await asyncio.sleep(0.05)
+    release.set()
+    await asyncio.wait_for(stopping, timeout=1)
+
+    assert sum(row["views"] for row in written) == 2
+    assert counter.snapshot()["pending_keys"] == 0
+
+
+async def test_cancelled_flush_keeps_counters(blocked_upsert):
+    entered, release, written = blocked_upsert
+    counter = ViewCounter()
+    product_id = uuid.uuid4()
+    counter.record(product_id)
+
+    flushing = asyncio.create_task(counter.flush())
+    await asyncio.wait_for(entered.wait(), timeout=1)
+    flushing.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flushing
+
+    assert written == []
+    release.set()
+    await counter.flush()
+    assert [row["views"] for row in written] == [1]
@@ -0,0 +1,135 @@
+import csv
+import io
+import json
+
+import pytest
+from sqlalchemy import select
+
+from db.dals import ProductDAL
+from db.models import Product
+from tests.conftest import auth_headers
+
+
+def product_row(user_id, name: str) -> dict:
+    return {
+        "user_id": str(user_id),
+        "name": name,
+        "description": "Description",
+        "link_to_product": "https://example.com/product",
+        "price": "100",
+        "logo": "logo.png",
+        "about": "About",
+        "problem": "Problem",
+        "decision": "Decision",
+        "advantages": "Advantages",
+        "additional": "Additional",
+        "link": "https://example.com",
+        "pictures": "",
+    }
+
+
+def ndjson(rows) -> bytes:
+    return b"".join(json.dumps(row).encode() + b"\n" for row in rows)
+
+
+@pytest.fixture
+def import_limits(override_settings):
+    """Small body cap and one-row batches, so the cap is hit after some rows are committed"""
+    override_settings(BULK_IMPORT_MAX_BYTES=1000, BULK_IMPORT_BATCH_SIZE=1)
+
+
+async def test_import_assigns_products_to_the_caller(client, make_user, db_session):
+    owner = await make_user()
+    victim = await make_user()
+
+    response = await client.post(
+        "/product/import",
+        content=ndjson([product_row(victim.user_id, "Foreign"), product_row(owner.user_id, "Own")]),
+        headers=auth_headers(owner),
+    )
+
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 2
+    owners = (await db_session.execute(select(Product.user_id))).scalars().all()
+    assert owners == [owner.user_id, owner.user_id]
+
+
+async def test_import_rejects_declared_oversized_body(client, make_user, db_session, import_limits):
+    user = await make_user()
+
+    response = await client.post(
+        "/product/import",
+        content=ndjson(product_row(user.user_id, f"Product {i}") for i in range(10)),
+        headers=auth_headers(user),
+    )
+
+    assert response.status_code == 413
+    assert (await db_session.execute(select(Product))).scalars().all() == []
+
+
+async def test_import_stops_streamed_body_at_the_limit(client, make_user, db_session, import_limits):
+    user = await make_user()
+
+    async def body():
+        # без Content-Length: лимит должен сработать по мере чтения потока
+        for i in range(10):
+            yield ndjson([product_row(user.user_id, f"Product {i}")])
+
+    response = await client.post("/product/import", content=body(), headers=auth_headers(user))
+
+    assert response.status_code == 413
+    imported = len((await db_session.execute(select(Product))).scalars().all())
+    assert 0 < imported < 10
+    assert f"{imported} rows were imported" in response.json()["detail"]
+
+
+@pytest.mark.parametrize("fmt, body, bad_line", [
+    ("ndjson", lambda rows: ndjson(rows[:1]) + b'{"name": "\xff"}\n' + ndjson(rows[1:]), 2),
+    # первая строка CSV - заголовок
+    ("csv", lambda rows: csv_body(rows[:1], header=True) + b"\xff,broken\n" + csv_body(rows[1:], header=False), 3),
+])
+async def test_import_reports_rows_that_are_not_utf8(client, make_user, fmt, body, bad_line):
+    user = await make_user()
+    rows = [product_row(user.user_id, "First"), product_row(user.user_id, "Second")]
+
+    response = await client.post(
+        f"/product/import?format={fmt}", content=body(rows), headers=auth_headers(user)
+    )
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["inserted"] == 2
+    assert report["failed"] == 1
+    assert report["errors"][0]["row"] == bad_line
+    assert report["errors"][0]["error"].startswith("Invalid UTF-8")
+
+
+def csv_body(rows, header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def test_export_returns_only_active_products_of_the_caller(client, make_user, make_product, db_session):
+    user = await make_user()
+    other = await make_user()
+    active = await make_product(user.user_id, name="Active")
+    inactive = await make_product(user.user_id, name="Inactive")
+    await make_product(other.user_id, name="Foreign")
+    async with db_session.begin():
+        await ProductDAL(db_session).delete_product(inactive.product_id)
+
+    response = await client.get("/product/export", headers=auth_headers(user))
+    assert response.status_code == 200
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["product_id"] for row in exported] == [str(active.product_id)]
+
+    response = await client.get("/product/export?include_inactive=true&format=csv", headers=auth_headers(user))
+    assert response.status_code == 200
+    exported = list(csv.DictReader(io.StringIO(response.text)))
+    assert sorted(row["product_id"] for row in exported) == sorted(
+        str(product.product_id) for product in (active, inactive)
+    )
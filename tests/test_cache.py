@@ -0,0 +1,44 @@
+import uuid
+
+from cache import InMemoryCacheBackend, PrincipalCache, get_product_cache
+
+
+async def test_principal_loaded_before_invalidation_is_not_cached():
+    cache = PrincipalCache(backend=InMemoryCacheBackend(max_size=10), ttl=60)
+    user_id = uuid.uuid4()
+
+    generation = await cache.get_generation()
+    # пока пользователь грузился, его изменили и сбросили из кэша
+    await cache.invalidate_user(user_id)
+    await cache.set("user@example.com", user_id, {"user_id": str(user_id)}, generation=generation)
+
+    assert await cache.get("user@example.com") is None
+
+
+async def test_principal_is_cached_without_concurrent_invalidation():
+    cache = PrincipalCache(backend=InMemoryCacheBackend(max_size=10), ttl=60)
+    user_id = uuid.uuid4()
+
+    await cache.set("user@example.com", user_id, {"user_id": str(user_id)}, generation=await cache.get_generation())
+
+    assert await cache.get("user@example.com") == {"user_id": str(user_id)}
+
+
+async def test_invalidation_in_another_worker_blocks_stale_principal():
+    # два воркера с общим бэкендом (как с Redis): счётчик инвалидаций у них тоже общий
+    shared_backend = InMemoryCacheBackend(max_size=10)
+    loading_worker = PrincipalCache(backend=shared_backend, ttl=60)
+    invalidating_worker = PrincipalCache(backend=shared_backend, ttl=60)
+    user_id = uuid.uuid4()
+
+    generation = await loading_worker.get_generation()
+    await invalidating_worker.invalidate_user(user_id)
+    await loading_worker.set("user@example.com", user_id, {"user_id": str(user_id)}, generation=generation)
+
+    assert await loading_worker.get("user@example.com") is None
+
+
+def test_caches_pick_up_reloaded_settings(override_settings):
+    override_settings(PRODUCT_CACHE_TTL_SECONDS=7)
+
+    assert get_product_cache().ttl == 7
@@ -0,0 +1,134 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from api.actions.category import _create_category, _delete_category, _find_category, _update_category
+from api.models import CategoryCreate, UpdateCategoryRequest
+from db.dals import CategoryDAL, PortalRole
+from tests.conftest import auth_headers
+
+
+@pytest.fixture
+def make_category(db_session):
+    async def make(name, parent=None):
+        async with db_session.begin():
+            return await CategoryDAL(db_session).create_category(name=name, parent=parent)
+
+    return make
+
+
+async def test_admin_creates_and_moves_categories(client, make_user):
+    admin = await make_user(roles=[PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN])
+    headers = auth_headers(admin)
+
+    response = await client.post("/category/", json={"name": "Root"}, headers=headers)
+    assert response.status_code == 200
+    root = response.json()
+    response = await client.post("/category/", json={"name": "Child", "parent_id": root["id"]}, headers=headers)
+    assert response.status_code == 200
+    child = response.json()
+    assert (child["parent_id"], child["depth"]) == (root["id"], 1)
+    assert child["path"] == f"{root['path']}{uuid.UUID(child['id']).hex}/"
+
+    response = await client.patch(
+        "/category/", params={"category_id": child["id"]}, json={"name": "Moved", "parent_id": None}, headers=headers
+    )
+    assert response.status_code == 200
+    moved = response.json()
+    assert (moved["name"], moved["parent_id"], moved["depth"]) == ("Moved", None, 0)
+    assert moved["path"] == f"/{uuid.UUID(child['id']).hex}/"
+
+
+async def test_regular_user_cannot_create_categories(client, make_user):
+    user = await make_user()
+
+    response = await client.post("/category/", json={"name": "Root"}, headers=auth_headers(user))
+
+    assert response.status_code == 403
+
+
+async def test_unknown_category_does_not_reload_the_tree(db_session, make_category, monkeypatch):
+    await make_category("Root")
+    loads = []
+    get_all_categories = CategoryDAL.get_all_categories
+
+    async def counting_get_all_categories(self):
+        loads.append(1)
+        return await get_all_categories(self)
+
+    monkeypatch.setattr(CategoryDAL, "get_all_categories", counting_get_all_categories)
+    await _find_category(uuid.uuid4(), db_session)
+    loads_after_first_miss = len(loads)
+
+    for _ in range(3):
+        assert await _find_category(uuid.uuid4(), db_session) is None
+
+    assert len(loads) == loads_after_first_miss
+
+
+async def test_category_created_elsewhere_is_found(db_session, session_factory, make_category):
+    await make_category("Root")
+    await _find_category(uuid.uuid4(), db_session)  # дерево в кэше
+    async with session_factory() as other_session:
+        created = await _create_category(CategoryCreate(name="Fresh"), other_session)
+
+    found = await _find_category(created.id, db_session)
+
+    assert found is not None and found.path == created.path
+
+
+async def test_create_waits_for_parent_move(session_factory, make_category):
+    parent = await make_category("Parent")
+    new_root = await make_category("New root")
+    async with session_factory() as mover, session_factory() as creator:
+        async with mover.begin():
+            await _move_without_commit(mover, parent.id, new_root.id)
+            creating = asyncio.create_task(_create_category(CategoryCreate(name="Child", parent_id=parent.id), creator))
+            await asyncio.sleep(0.2)
+            # создание ждёт блокировку родителя, пока перенос не закоммичен
+            assert not creating.done()
+        child = await asyncio.wait_for(creating, timeout=5)
+
+    assert child.path == f"{new_root.path}{parent.id.hex}/{child.id.hex}/"
+    assert child.depth == 2
+
+
+async def test_crossing_moves_cannot_make_a_cycle(session_factory, make_category):
+    first = await make_category("First")
+    second = await make_category("Second")
+    async with session_factory() as mover, session_factory() as other_mover:
+        async with mover.begin():
+            await _move_without_commit(mover, first.id, second.id)
+            moving_back = asyncio.create_task(
+                _update_category(second.id, UpdateCategoryRequest(parent_id=first.id), other_mover)
+            )
+            await asyncio.sleep(0.2)
+            assert not moving_back.done()
+        with pytest.raises(HTTPException) as error:
+            await asyncio.wait_for(moving_back, timeout=5)
+
+    assert error.value.status_code == 422
+
+
+async def _move_without_commit(session, category_id, new_parent_id):
+    category_dal = CategoryDAL(session)
+    await category_dal.lock_moves()
+    locked = await category_dal.lock_categories([category_id, new_parent_id])
+    await category_dal.move_category(locked[category_id], locked[new_parent_id])
+
+
+async def test_delete_waits_for_move_and_removes_moved_subtree(session_factory, make_category):
+    parent = await make_category("Parent")
+    await make_category("Child", parent=parent)
+    new_root = await make_category("New root")
+    async with session_factory() as mover, session_factory() as deleter:
+        async with mover.begin():
+            await _move_without_commit(mover, parent.id, new_root.id)
+            deleting = asyncio.create_task(_delete_category(parent.id, deleter))
+            await asyncio.sleep(0.2)
+            assert not deleting.done()
+        deleted = await asyncio.wait_for(deleting, timeout=5)
+
+    assert deleted.deleted_count == 2
@@ -0,0 +1,87 @@
+"""ETag/Last-Modified on GET /user/ and GET /product/: the version bumps on every write,
+and a client holding the current version gets 304 without the row being loaded."""
+
+import uuid
+
+import pytest
+
+from tests.conftest import UPDATE_PRODUCT_BODY, UPDATE_USER_BODY, auth_headers
+
+
+@pytest.fixture
+async def user(make_user):
+    return await make_user()
+
+
+@pytest.fixture
+async def product(user, make_product):
+    return await make_product(user.user_id)
+
+
+def resource_params(kind: str, user, product) -> tuple[str, dict]:
+    if kind == "user":
+        return "/user/", {"user_id": str(user.user_id)}
+    return "/product/", {"product_id": str(product.product_id)}
+
+
+async def change(client, kind: str, user, product):
+    path, params = resource_params(kind, user, product)
+    body = UPDATE_USER_BODY if kind == "user" else UPDATE_PRODUCT_BODY
+    response = await client.patch(path, params=params, json=body, headers=auth_headers(user))
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.parametrize("kind", ["user", "product"])
+async def test_if_none_match(client, user, product, kind):
+    path, params = resource_params(kind, user, product)
+
+    response = await client.get(path, params=params)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag == '"1"'
+
+    response = await client.get(path, params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    await change(client, kind, user, product)
+    response = await client.get(path, params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"2"'
+
+
+@pytest.mark.parametrize("kind", ["user", "product"])
+async def test_if_modified_since(client, user, product, kind):
+    path, params = resource_params(kind, user, product)
+    last_modified = (await client.get(path, params=params)).headers["last-modified"]
+
+    response = await client.get(path, params=params, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    assert response.headers["last-modified"] == last_modified
+
+    response = await client.get(path, params=params, headers={"If-Modified-Since": "Sat, 01 Jan 2000 00:00:00 GMT"})
+    assert response.status_code == 200
+    # If-None-Match важнее: не совпавший ETag - полный ответ, даже если дата подходит
+    response = await client.get(
+        path, params=params, headers={"If-None-Match": '"999"', "If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 200
+
+
+async def test_product_delete_bumps_version(client, user, product):
+    path, params = resource_params("product", user, product)
+
+    response = await client.delete(path, params=params, headers=auth_headers(user))
+    assert response.status_code == 200
+
+    response = await client.get(path, params=params, headers={"If-None-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"2"'
+
+
+@pytest.mark.parametrize("path, param", [("/user/", "user_id"), ("/product/", "product_id")])
+async def test_conditional_get_of_missing_row_is_404(client, path, param):
+    response = await client.get(path, params={param: str(uuid.uuid4())}, headers={"If-None-Match": '"1"'})
+
+    assert response.status_code == 404
@@ -0,0 +1,86 @@
+"""Every statement a DAL call sends must have an index behind it: the statements are captured
+while the call runs and each one is EXPLAINed with the same parameters."""
+
+import hashlib
+import uuid
+
+import pytest
+from sqlalchemy import event, text
+
+from db.dals import PRODUCT_WITH_IMAGES, ImageDAL, ProductDAL
+
+SHA256 = hashlib.sha256(b"image").hexdigest()
+
+
+async def plans_of(session, call) -> list[str]:
+    """Runs call(session) in a transaction that is rolled back and returns the plans of its statements"""
+    statements = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    engine = session.bind.sync_engine
+    async with session.begin():
+        # запасной выход для планировщика: если подходящего индекса нет, seq scan всё равно появится в плане
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            await call(session)
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+        connection = await session.connection()
+        plans = []
+        for statement, parameters in statements:
+            rows = await connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            plans.append("\n".join(row[0] for row in rows))
+        await session.rollback()
+    assert plans
+    return plans
+
+
+@pytest.fixture
+async def product(make_user, make_product):
+    user = await make_user()
+    return await make_product(user.user_id)
+
+
+@pytest.mark.parametrize("call", [
+    pytest.param(
+        lambda session, product: ProductDAL(session).update_product(
+            product.product_id, owner_id=product.user_id, name="Renamed"
+        ),
+        id="update_product",
+    ),
+    pytest.param(
+        lambda session, product: ProductDAL(session).delete_product(product.product_id, owner_id=product.user_id),
+        id="delete_product",
+    ),
+    pytest.param(
+        lambda session, product: ProductDAL(session).update_product(
+            product.product_id, owner_id=uuid.uuid4(), name="Renamed"
+        ),
+        id="update_product_not_owned",
+    ),
+    pytest.param(lambda session, product: ProductDAL(session).product_exists(product.product_id), id="product_exists"),
+    pytest.param(
+        lambda session, product: ProductDAL(session).get_product_by_id(
+            product.product_id, load_options=PRODUCT_WITH_IMAGES
+        ),
+        id="get_product_with_images",
+    ),
+    pytest.param(
+        lambda session, product: ImageDAL(session).create_image(
+            path="blob", product_id=product.product_id, sha256=SHA256, size=5
+        ),
+        id="create_image",
+    ),
+    pytest.param(lambda session, product: ImageDAL(session).count_blob_references(SHA256), id="count_blob_references"),
+    pytest.param(
+        lambda session, product: ImageDAL(session).get_images_by_product(product.product_id),
+        id="get_images_by_product",
+    ),
+])
+async def test_dal_statements_use_indexes(db_session, override_settings, product, call):
+    override_settings(PRODUCT_EVENTS_NOTIFY=0)
+    for plan in await plans_of(db_session, lambda session: call(session, product)):
+        assert "Seq Scan" not in plan, plan
@@ -0,0 +1,121 @@
+import json
+import uuid
+
+import pytest
+
+from api.handlers import stream_product_events
+from db.dals import CategoryDAL, ProductDAL
+from events import RESYNC, make_event, product_events
+from tests.conftest import auth_headers
+
+
+class ConnectedRequest:
+    async def is_disconnected(self) -> bool:
+        return False
+
+
+def parse_sse(message: str) -> dict:
+    fields = dict(line.split(": ", 1) for line in message.strip().splitlines())
+    return {"event": fields["event"], **json.loads(fields["data"])}
+
+
+@pytest.fixture
+def local_events(override_settings):
+    # без NOTIFY события публикуются в этом процессе сразу после COMMIT, слушатель Postgres не нужен
+    override_settings(PRODUCT_EVENTS_NOTIFY=0)
+
+
+async def test_bulk_create_notifies_each_owner(local_events, db_session, make_user):
+    first, second = await make_user(), await make_user()
+    subscription = product_events.subscribe(user_id=str(first.user_id))
+    rows = [
+        {"user_id": str(first.user_id), "name": "First"},
+        {"user_id": str(second.user_id), "name": "Second"},
+        {"user_id": str(first.user_id), "name": "Third"},
+    ]
+    try:
+        async with db_session.begin():
+            await ProductDAL(db_session).bulk_create_products(rows)
+
+        product_event = await subscription.get(timeout=1)
+        assert product_event["type"] == "product.bulk_created"
+        assert product_event["user_id"] == str(first.user_id)
+        assert product_event["count"] == 2
+        # событие второго владельца сюда не попадает
+        assert await subscription.get(timeout=0.1) is None
+    finally:
+        product_events.unsubscribe(subscription)
+
+
+async def test_setting_categories_bumps_version_and_notifies(local_events, client, db_session, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    async with db_session.begin():
+        category = await CategoryDAL(db_session).create_category(name="Category")
+    subscription = product_events.subscribe(user_id=str(user.user_id))
+    try:
+        response = await client.put(
+            "/product/categories",
+            params={"product_id": str(product.product_id)},
+            json={"category_ids": [str(category.id)]},
+            headers=auth_headers(user),
+        )
+        assert response.status_code == 200
+
+        product_event = await subscription.get(timeout=1)
+        assert product_event["type"] == "product.updated"
+        assert product_event["fields"] == ["categories"]
+    finally:
+        product_events.unsubscribe(subscription)
+    version = await ProductDAL(db_session).get_product_version(product.product_id)
+    assert version[0] == product.version + 1
+
+
+async def test_event_stream_filters_by_owner_and_product(override_settings):
+    override_settings(PRODUCT_EVENTS_HEARTBEAT_SECONDS=1)
+    owner, product_id = uuid.uuid4(), uuid.uuid4()
+    response = await stream_product_events(ConnectedRequest(), user_id=owner, product_id=product_id)
+    stream = response.body_iterator
+    try:
+        assert await anext(stream) == "retry: 3000\n\n"
+        product_events.publish(make_event("product.updated", product_id=uuid.uuid4(), user_id=owner))
+        product_events.publish(make_event("product.updated", product_id=product_id, user_id=uuid.uuid4()))
+        product_events.publish(make_event("product.updated", product_id=product_id, user_id=owner))
+
+        product_event = parse_sse(await anext(stream))
+        assert product_event["event"] == "product.updated"
+        assert (product_event["user_id"], product_event["product_id"]) == (str(owner), str(product_id))
+        assert await anext(stream) == ": ping\n\n"
+    finally:
+        await stream.aclose()
+    assert product_events.subscribers == 0
+
+
+async def test_event_stream_resyncs_after_overflow(override_settings):
+    override_settings(PRODUCT_EVENTS_BUFFER_SIZE=2, PRODUCT_EVENTS_HEARTBEAT_SECONDS=1)
+    overflows = product_events.overflows
+    response = await stream_product_events(ConnectedRequest(), user_id=None, product_id=None)
+    stream = response.body_iterator
+    try:
+        await anext(stream)
+        for _ in range(3):
+            product_events.publish(make_event("product.updated", product_id=uuid.uuid4()))
+
+        # отставший клиент теряет накопленные события и получает один resync
+        resync = parse_sse(await anext(stream))
+        assert (resync["event"], resync["reason"]) == (RESYNC, "overflow")
+        assert product_events.overflows == overflows + 1
+        # поток не обрывается: следующие события приходят как обычно
+        product_events.publish(make_event("product.deleted", product_id=uuid.uuid4()))
+        assert parse_sse(await anext(stream))["event"] == "product.deleted"
+    finally:
+        await stream.aclose()
+
+
+async def test_event_stream_rejects_subscribers_over_limit(client, override_settings):
+    override_settings(PRODUCT_EVENTS_MAX_SUBSCRIBERS=0)
+
+    response = await client.get("/product/events")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
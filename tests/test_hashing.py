@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import func, select
+
+import hashing
+from db.models import User
+from hashing import AsyncHasher, Hasher, HasherOverloadedError
+
+SIGN_UP_BODY = {
+    "name": "Ivan",
+    "surname": "Ivanov",
+    "email": "busy@example.com",
+    "password": "secret",
+    "username": "ivan",
+    "current_company": "Company",
+    "your_role": "Founder",
+    "headline": "Headline",
+    "about": "About",
+    "links": "https://example.com",
+}
+
+
+@pytest.fixture
+def saturated_hasher(monkeypatch):
+    # все воркеры и места в очереди заняты
+    hasher = AsyncHasher(max_workers=1, max_queue=1)
+    hasher.metrics.in_flight = 2
+    monkeypatch.setattr(hashing, "_async_hasher", hasher)
+    return hasher
+
+
+async def test_hasher_rejects_jobs_beyond_queue():
+    hasher = AsyncHasher(max_workers=1, max_queue=1)
+    release = threading.Event()
+    try:
+        busy = [asyncio.ensure_future(hasher._run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        # без отказа задание встало бы в очередь за занятым воркером
+        with pytest.raises(HasherOverloadedError):
+            await asyncio.wait_for(hasher.get_password_hash("secret"), timeout=5)
+
+        release.set()
+        assert await asyncio.gather(*busy) == [True, True]
+    finally:
+        release.set()
+        hasher.shutdown()
+    assert hasher.metrics.snapshot()["rejected"] == 1
+    assert hasher.metrics.in_flight == 0
+
+
+async def test_sign_up_returns_503_when_hasher_is_saturated(client, db_session, saturated_hasher):
+    response = await client.post("/user/", json=SIGN_UP_BODY)
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    async with db_session.begin():
+        assert await db_session.scalar(select(func.count()).select_from(User)) == 0
+
+
+async def test_login_returns_503_when_hasher_is_saturated(client, make_user, saturated_hasher):
+    user = await make_user(hashed_password=Hasher.get_password_hash("secret"))
+
+    response = await client.post("/login/token", data={"username": user.email, "password": "secret"})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert saturated_hasher.metrics.rejected == 1
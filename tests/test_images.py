@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+
+import pytest
+from sqlalchemy import event
+
+from api.actions.image import _delete_image, _store_product_images
+from db.dals import ImageDAL
+from storage import StagedFile, blob_path, blob_root
+
+
+class CommitFailed(Exception):
+    pass
+
+
+@pytest.fixture
+def upload_dir(tmp_path, override_settings):
+    override_settings(UPLOAD_DIR=tmp_path)
+    return tmp_path
+
+
+def stage(content: bytes) -> StagedFile:
+    blob_root().mkdir(parents=True, exist_ok=True)
+    tmp_path = blob_root() / f".upload-{hashlib.md5(content).hexdigest()}"
+    tmp_path.write_bytes(content)
+    return StagedFile(tmp_path=tmp_path, sha256=hashlib.sha256(content).hexdigest(), size=len(content))
+
+
+def fail_next_commit(session):
+    def fail(_):
+        event.remove(session.sync_session, "before_commit", fail)
+        raise CommitFailed
+
+    event.listen(session.sync_session, "before_commit", fail)
+
+
+async def test_upload_promotes_blob_after_commit(upload_dir, session_factory, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    staged = stage(b"image bytes")
+
+    async with session_factory() as session:
+        images = await _store_product_images([staged], product.product_id, session)
+
+    assert [image.sha256 for image in images] == [staged.sha256]
+    assert blob_path(staged.sha256).read_bytes() == b"image bytes"
+    assert not staged.tmp_path.exists()
+
+
+async def test_failed_upload_commit_leaves_no_blob(upload_dir, session_factory, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    staged = stage(b"never committed")
+
+    async with session_factory() as session:
+        fail_next_commit(session)
+        with pytest.raises(CommitFailed):
+            await _store_product_images([staged], product.product_id, session)
+
+    assert not blob_path(staged.sha256).exists()
+    assert not staged.tmp_path.exists()
+
+
+async def test_failed_delete_commit_keeps_blob(upload_dir, session_factory, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    staged = stage(b"still referenced")
+    async with session_factory() as session:
+        [image] = await _store_product_images([staged], product.product_id, session)
+
+    async with session_factory() as session:
+        fail_next_commit(session)
+        with pytest.raises(CommitFailed):
+            await _delete_image(image.id, session)
+
+    assert blob_path(staged.sha256).exists()
+    async with session_factory() as session:
+        await _delete_image(image.id, session)
+    assert not blob_path(staged.sha256).exists()
+
+
+async def test_delete_keeps_blob_shared_with_another_product(upload_dir, session_factory, make_user, make_product):
+    user = await make_user()
+    first = await make_product(user.user_id)
+    second = await make_product(user.user_id)
+    async with session_factory() as session:
+        [image] = await _store_product_images([stage(b"shared")], first.product_id, session)
+        await _store_product_images([stage(b"shared")], second.product_id, session)
+
+    async with session_factory() as session:
+        await _delete_image(image.id, session)
+        async with session.begin():
+            assert await ImageDAL(session).count_blob_references(image.sha256) == 1
+
+    assert blob_path(image.sha256).exists()
+
+
+async def test_concurrent_uploads_of_same_file_share_one_row(session_factory, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    sha256 = hashlib.sha256(b"same file").hexdigest()
+    fields = {"path": "blob", "product_id": product.product_id, "sha256": sha256, "size": 9}
+
+    async with session_factory() as first, session_factory() as second:
+        async with first.begin():
+            first_image = await ImageDAL(first).create_image(**fields)
+
+            async def create_in_second():
+                async with second.begin():
+                    return await ImageDAL(second).create_image(**fields)
+
+            # вторая загрузка не видит незакоммиченную строку и ждёт на ограничении уникальности
+            creating = asyncio.create_task(create_in_second())
+            await asyncio.sleep(0.2)
+            assert not creating.done()
+        second_image = await asyncio.wait_for(creating, timeout=5)
+
+    assert second_image.id == first_image.id
+
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + bytes(range(64))
+
+
+def store_blob(content: bytes) -> str:
+    sha256 = hashlib.sha256(content).hexdigest()
+    blob_path(sha256).parent.mkdir(parents=True, exist_ok=True)
+    blob_path(sha256).write_bytes(content)
+    return sha256
+
+
+async def test_blob_is_revalidated_by_its_hash(upload_dir, client):
+    sha256 = store_blob(PNG_BYTES)
+
+    response = await client.get(f"/product/blobs/{sha256}")
+    assert response.status_code == 200
+    assert response.content == PNG_BYTES
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["etag"] == f'"{sha256}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    response = await client.get(f"/product/blobs/{sha256}", headers={"If-None-Match": f'W/"{sha256}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == f'"{sha256}"'
+
+    response = await client.get(f"/product/blobs/{sha256}", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+async def test_blob_serves_byte_ranges(upload_dir, client):
+    sha256 = store_blob(PNG_BYTES)
+
+    response = await client.get(f"/product/blobs/{sha256}", headers={"Range": "bytes=8-15"})
+
+    assert response.status_code == 206
+    assert response.content == PNG_BYTES[8:16]
+    assert response.headers["content-range"] == f"bytes 8-15/{len(PNG_BYTES)}"
+    # If-Range с другим ETag - файл целиком
+    response = await client.get(
+        f"/product/blobs/{sha256}", headers={"Range": "bytes=8-15", "If-Range": '"stale"'}
+    )
+    assert response.status_code == 200
+    assert response.content == PNG_BYTES
+
+
+async def test_missing_blob_is_404(upload_dir, client):
+    response = await client.get(f"/product/blobs/{'0' * 64}")
+
+    assert response.status_code == 404
@@ -0,0 +1,16 @@
+from benchmarks.importtime import check_side_effects, measure
+
+# тот же бюджет, что в README для python -m benchmarks.importtime: лучший из пяти прогонов сейчас 820-1170 мс
+# (Python 3.11, x86_64, одно ядро), бюджет чуть выше этого разброса, чтобы ловить заметные регрессии
+IMPORT_BUDGET_MS = 1250
+
+
+def test_main_imports_within_budget(tmp_path):
+    # лучший из нескольких прогонов: первый ещё и прогревает кэш ОС, а разброс между прогонами до 30%
+    best_ms = min(measure("main", str(tmp_path)).get("main", 0) for _ in range(5)) / 1000
+
+    assert best_ms < IMPORT_BUDGET_MS
+
+
+def test_main_import_has_no_side_effects(tmp_path):
+    assert check_side_effects("main", str(tmp_path)) == []
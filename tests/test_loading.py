@@ -0,0 +1,33 @@
+import pytest
+
+from db.dals import PRODUCT_WITH_IMAGES, ProductDAL
+from db.models import Product
+from db.session import LazyLoadError
+
+
+# DB_STRICT_LOADING включён для всех тестов в conftest.py
+
+
+async def test_implicit_lazy_load_fails_in_strict_mode(db_session, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    db_session.expunge_all()
+
+    async with db_session.begin():
+        loaded = await db_session.get(Product, product.product_id)
+        with pytest.raises(LazyLoadError):
+            # run_sync даёт ленивой загрузке выполниться, и до базы её не пускает только guard
+            await db_session.run_sync(lambda _: loaded.user)
+
+
+async def test_explicit_load_options_pass_in_strict_mode(db_session, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    db_session.expunge_all()
+
+    async with db_session.begin():
+        products = await ProductDAL(db_session).get_products_by_ids(
+            [product.product_id], load_options=PRODUCT_WITH_IMAGES
+        )
+
+    assert [image for loaded in products for image in loaded.images] == []
@@ -0,0 +1,63 @@
+import re
+
+from metrics import Histogram
+
+
+def server_timing(header: str) -> dict:
+    metrics = {}
+    for metric in header.split(","):
+        name, *params = metric.strip().split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+async def test_response_has_server_timing(client, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+
+    response = await client.get("/product/", params={"product_id": str(product.product_id)})
+
+    assert response.status_code == 200
+    timing = server_timing(response.headers["server-timing"])
+    assert set(timing) == {"app", "db", "pool", "hash"}
+    assert float(timing["app"]["dur"]) >= float(timing["db"]["dur"]) > 0
+    # продукта нет в кэше - хотя бы один запрос в базу
+    assert int(re.fullmatch(r'"(\d+) queries"', timing["db"]["desc"]).group(1)) >= 1
+
+
+async def test_metrics_expose_route_histograms_and_gauges(client, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    await client.get("/product/", params={"product_id": str(product.product_id)})
+
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert "# TYPE http_request_duration_seconds histogram" in lines
+    # метка - шаблон пути, а не путь с id
+    requests = next(
+        line for line in lines
+        if line.startswith('http_request_duration_seconds_count{method="GET",route="/product/",status="200"}')
+    )
+    assert int(requests.split()[-1]) >= 1
+    assert any(line.startswith('http_request_db_queries_count{route="/product/"}') for line in lines)
+    for gauge in ("db_pool", "password_hasher", "principal_cache", "product_cache", "product_views"):
+        assert f"# TYPE {gauge} gauge" in lines
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 5.0):
+        histogram.observe(value, '/a"b')
+
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a\\"b",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a\\"b"} 6.25',
+        'latency_seconds_count{route="/a\\"b"} 4',
+    ]
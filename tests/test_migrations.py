@@ -0,0 +1,82 @@
+"""Migrations from migrations/ on a scratch database next to the test one:
+upgrading an old database must end with exactly the schema of db.models.
+"""
+
+from pathlib import Path
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import NullPool
+
+import settings
+from db.models import Base
+
+ROOT = Path(__file__).resolve().parent.parent
+CATEGORY_ID = "11111111-2222-3333-4444-555555555555"
+USER_ID = "21111111-2222-3333-4444-555555555555"
+PRODUCT_ID = "31111111-2222-3333-4444-555555555555"
+
+
+@pytest.fixture
+def migrations_url(sync_engine, override_settings):
+    url = make_url(settings.TEST_DATABASE_URL).set(drivername="postgresql+psycopg2")
+    database = f"{url.database}_migrations"
+    admin = sync_engine.execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        with admin.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS "{database}"'))
+            connection.execute(text(f'CREATE DATABASE "{database}"'))
+    except DBAPIError as e:
+        pytest.skip(f"can't create a scratch database: {e.orig}")
+    scratch_url = url.set(database=database)
+    # env.py берёт адрес из настроек
+    override_settings(REAL_DATABASE_URL=scratch_url.render_as_string(hide_password=False))
+    yield scratch_url
+    with admin.connect() as connection:
+        connection.execute(text(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)'))
+
+
+def alembic_config() -> Config:
+    config = Config(str(ROOT / "alembic.ini"))
+    config.set_main_option("script_location", str(ROOT / "migrations"))
+    config.attributes["configure_logger"] = False
+    return config
+
+
+# выражение генерируемой колонки autogenerate сравнивать не умеет, его проверяет поиск ниже
+@pytest.mark.filterwarnings("ignore:Computed default on products.search_vector")
+def test_upgrade_from_baseline_matches_models(migrations_url):
+    config = alembic_config()
+    engine = create_engine(migrations_url, poolclass=NullPool)
+    try:
+        command.upgrade(config, "0001")
+        with engine.begin() as connection:
+            connection.execute(text(f"INSERT INTO categories VALUES ('{CATEGORY_ID}', 42)"))
+            connection.execute(text(
+                "INSERT INTO users (user_id, email, is_active, hashed_password) "
+                f"VALUES ('{USER_ID}', 'old@example.com', true, 'x')"
+            ))
+            connection.execute(text(
+                f"INSERT INTO products (product_id, user_id, name) VALUES ('{PRODUCT_ID}', '{USER_ID}', 'Hello world')"
+            ))
+
+        command.upgrade(config, "head")
+        with engine.connect() as connection:
+            category = connection.execute(text("SELECT name, path, depth, parent_id FROM categories")).one()
+            assert category == ("42", "/" + CATEGORY_ID.replace("-", "") + "/", 0, None)
+            product = connection.execute(text(
+                "SELECT version, search_vector @@ plainto_tsquery('english', 'hello') FROM products"
+            )).one()
+            assert product == (1, True)
+            diff = compare_metadata(MigrationContext.configure(connection), Base.metadata)
+        assert diff == []
+
+        command.downgrade(config, "base")
+    finally:
+        engine.dispose()
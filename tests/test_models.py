@@ -0,0 +1,53 @@
+import uuid
+
+from api.models import ShowCategory, ShowProduct, ShowUser
+from db.models import Category, Product, User
+
+
+def test_show_product_from_orm_instance():
+    product = Product(
+        product_id=uuid.uuid4(),
+        user_id=uuid.uuid4(),
+        name="Product",
+        description="Description",
+        link_to_product="https://example.com/product",
+        price="100",
+        logo="logo.png",
+        about="About",
+        problem="Problem",
+        decision="Decision",
+        advantages="Advantages",
+        additional="Additional",
+        link="https://example.com",
+    )
+
+    shown = ShowProduct.model_validate(product)
+
+    assert shown.product_id == product.product_id
+    assert shown.model_dump(mode="json")["name"] == "Product"
+
+
+def test_show_user_from_orm_instance():
+    user = User(
+        user_id=uuid.uuid4(),
+        name="Ivan",
+        surname="Ivanov",
+        email="ivan@example.com",
+        is_active=True,
+        hashed_password="hash",
+        username="ivan",
+        current_company="Company",
+        your_role="Founder",
+        headline="Headline",
+        about="About",
+        links="https://example.com",
+    )
+
+    assert ShowUser.model_validate(user).user_id == user.user_id
+
+
+def test_show_category_from_orm_instance():
+    category_id = uuid.uuid4()
+    category = Category(id=category_id, name="Fintech", parent_id=None, path=f"/{category_id.hex}/", depth=0)
+
+    assert ShowCategory.model_validate(category).path == f"/{category_id.hex}/"
@@ -0,0 +1,38 @@
+from datetime import date
+
+from sqlalchemy import delete, select
+
+from db.dals import _backfill_portfolios
+from db.models import UserPortfolio
+
+
+async def test_portfolio_lists_user_products(client, make_user, make_product):
+    user = await make_user()
+    await make_product(user.user_id, name="Older", post_date=date(2024, 1, 1))
+    newer = await make_product(user.user_id, name="Newer", post_date=date(2024, 2, 1))
+
+    response = await client.get(f"/user/{user.user_id}/portfolio")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["user"]["email"] == user.email
+    assert body["product_count"] == 2
+    assert body["latest_product_id"] == str(newer.product_id)
+    assert [product["name"] for product in body["products"]] == ["Newer", "Older"]
+
+
+async def test_backfill_builds_missing_portfolios(db_session, make_user, make_product):
+    users = [await make_user() for _ in range(3)]
+    for user in users:
+        await make_product(user.user_id)
+    await make_user()  # без продуктов сводка не нужна
+    async with db_session.begin():
+        # как до появления таблицы: продукты есть, сводок нет
+        await db_session.execute(delete(UserPortfolio))
+
+    assert await _backfill_portfolios(db_session, batch_size=2) == 3
+    async with db_session.begin():
+        portfolios = (await db_session.execute(select(UserPortfolio))).scalars().all()
+    assert sorted(portfolio.user_id for portfolio in portfolios) == sorted(user.user_id for user in users)
+    assert all(portfolio.product_count == 1 for portfolio in portfolios)
+    assert await _backfill_portfolios(db_session, batch_size=2) == 0
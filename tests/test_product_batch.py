@@ -0,0 +1,20 @@
+import uuid
+
+
+async def test_batch_returns_found_products_and_missing_ids(client, make_user, make_product):
+    user = await make_user()
+    first = await make_product(user.user_id, name="First")
+    second = await make_product(user.user_id, name="Second")
+    missing_id = uuid.uuid4()
+
+    response = await client.post("/product/batch", json={
+        "product_ids": [str(second.product_id), str(missing_id), str(first.product_id), str(second.product_id)],
+        "include_images": True,
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    # порядок как в запросе, повторы схлопнуты
+    assert [item["product"]["name"] for item in body["items"]] == ["Second", "First"]
+    assert all(item["images"] == [] for item in body["items"])
+    assert body["missing_ids"] == [str(missing_id)]
@@ -0,0 +1,20 @@
+from datetime import date, timedelta
+
+
+async def test_list_products_pages_through_orm_rows(client, make_user, make_product):
+    user = await make_user()
+    products = [
+        await make_product(user.user_id, name=f"Product {day}", post_date=date(2024, 1, 1) + timedelta(days=day))
+        for day in range(3)
+    ]
+
+    first_page = await client.get("/product/list", params={"limit": 2})
+    assert first_page.status_code == 200
+    body = first_page.json()
+    assert [item["name"] for item in body["items"]] == ["Product 2", "Product 1"]
+    assert body["next_cursor"] is not None
+
+    second_page = await client.get("/product/list", params={"limit": 2, "cursor": body["next_cursor"]})
+    assert second_page.status_code == 200
+    assert [item["product_id"] for item in second_page.json()["items"]] == [str(products[0].product_id)]
+    assert second_page.json()["next_cursor"] is None
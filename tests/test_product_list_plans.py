@@ -0,0 +1,83 @@
+"""The product list filters must be served by the indexes from db/models.py: no sequential scan
+over products and no extra Sort node on top of the keyset order."""
+
+import hashlib
+import uuid
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from db.dals import ProductDAL
+from db.models import ProductStatus
+
+
+@pytest.fixture
+async def catalog(db_session):
+    """A catalog big enough for the planner to tell the indexes apart; returns one user id and one category path"""
+    async with db_session.begin():
+        await db_session.execute(text("""
+            INSERT INTO users (user_id, email, is_active, hashed_password)
+            SELECT md5('user' || i)::uuid, 'user' || i || '@example.com', true, 'hash'
+            FROM generate_series(1, 200) AS i
+        """))
+        await db_session.execute(text("""
+            INSERT INTO products (product_id, user_id, is_active, name, status_of_project, post_date)
+            SELECT md5('product' || i)::uuid, md5('user' || (i % 200 + 1))::uuid, i % 10 <> 0, 'Product ' || i,
+                   ('status' || (i % 7 + 1))::product_status_enum, date '2020-01-01' + (i % 1500)
+            FROM generate_series(1, 20000) AS i
+        """))
+        await db_session.execute(text("""
+            INSERT INTO categories (id, name, path, depth)
+            SELECT md5('category' || i)::uuid, 'Category ' || i, '/' || md5('category' || i) || '/', 0
+            FROM generate_series(1, 200) AS i
+        """))
+        await db_session.execute(text("""
+            INSERT INTO product_categories (product_id, category_id)
+            SELECT md5('product' || i)::uuid, md5('category' || (i % 200 + 1))::uuid
+            FROM generate_series(1, 20000) AS i
+        """))
+        for table in ("users", "products", "categories", "product_categories"):
+            await db_session.execute(text(f"ANALYZE {table}"))
+        user_id = await db_session.scalar(text("SELECT md5('user1')::uuid"))
+    return user_id, f"/{hashlib.md5(b'category1').hexdigest()}/"
+
+
+async def explain(session, query) -> str:
+    sql = query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    async with session.begin():
+        # запасной выход для планировщика: если подходящего индекса нет, seq scan всё равно появится в плане
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        rows = await session.execute(text(f"EXPLAIN {sql}"))
+        return "\n".join(row[0] for row in rows)
+
+
+@pytest.mark.parametrize("filters, index", [
+    ({}, "ix_products_post_date_product_id"),
+    ({"user_id": uuid.uuid4()}, "ix_products_user_id_post_date"),
+    ({"is_active": True}, "ix_products_active_post_date"),
+    ({"status_of_project": ProductStatus.status2}, "ix_products_status_post_date"),
+])
+async def test_list_filters_use_their_index(db_session, filters, index):
+    plan = await explain(db_session, ProductDAL._list_products_query(limit=20, **filters))
+
+    assert index in plan, plan
+    assert "Seq Scan" not in plan, plan
+    assert "Sort" not in plan, plan
+
+
+async def test_keyset_page_uses_the_index(db_session, catalog):
+    query = ProductDAL._list_products_query(limit=20, after_post_date=date(2021, 6, 1), after_product_id=uuid.uuid4())
+    plan = await explain(db_session, query)
+
+    assert "Seq Scan" not in plan, plan
+    assert "Sort" not in plan, plan
+
+
+async def test_category_filter_avoids_seq_scan(db_session, catalog):
+    _, category_path = catalog
+    plan = await explain(db_session, ProductDAL._list_products_query(limit=20, category_path=category_path))
+
+    assert "ix_categories_path" in plan, plan
+    assert "Seq Scan" not in plan, plan
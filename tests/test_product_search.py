@@ -0,0 +1,11 @@
+async def test_search_returns_matching_products(client, make_user, make_product):
+    user = await make_user()
+    telescope = await make_product(user.user_id, name="Pocket telescope", about="Stargazing for everyone")
+    await make_product(user.user_id, name="Coffee grinder", about="Fresh coffee every morning")
+
+    response = await client.get("/product/search", params={"q": "telescopes"})
+
+    assert response.status_code == 200
+    hits = response.json()["items"]
+    assert [hit["product"]["product_id"] for hit in hits] == [str(telescope.product_id)]
+    assert hits[0]["rank"] > 0
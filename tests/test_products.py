@@ -0,0 +1,100 @@
+import uuid
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import api.actions.product
+from api.actions.product import _get_product_for_display, _update_product
+from cache import get_product_cache
+from db.dals import ProductDAL
+from db.models import Product
+from db.session import REPLICA_SESSION_KEY
+from tests.conftest import UPDATE_PRODUCT_BODY, auth_headers
+
+
+async def test_get_product_for_display(db_session, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id, name="Cached product")
+
+    shown, version, updated_at = await _get_product_for_display(product.product_id, db_session)
+
+    assert shown.product_id == product.product_id
+    assert shown.name == "Cached product"
+    assert version == 1
+    # второй раз - из кэша, с теми же данными
+    cached, _, _ = await _get_product_for_display(product.product_id, db_session)
+    assert cached == shown
+
+
+async def test_update_evicts_product_cache_after_commit(db_session, session_factory, make_user, make_product, monkeypatch):
+    user = await make_user()
+    product = await make_product(user.user_id, name="Old name")
+    await _get_product_for_display(product.product_id, db_session)
+
+    update_product = ProductDAL.update_product
+
+    async def update_then_read_concurrently(self, *args, **kwargs):
+        updated_product_id = await update_product(self, *args, **kwargs)
+        # чтение из другой сессии до коммита видит старую строку и кладёт её в кэш
+        async with session_factory() as other_session:
+            await get_product_cache().invalidate(product.product_id)
+            shown, _, _ = await _get_product_for_display(product.product_id, other_session)
+            assert shown.name == "Old name"
+        return updated_product_id
+
+    monkeypatch.setattr(ProductDAL, "update_product", update_then_read_concurrently)
+    async with session_factory() as update_session:
+        await _update_product({"name": "New name"}, product.product_id, update_session, owner_id=user.user_id)
+
+    async with session_factory() as read_session:
+        shown, version, _ = await _get_product_for_display(product.product_id, read_session)
+    assert shown.name == "New name"
+    assert version == 2
+
+
+async def test_cache_miss_on_replica_is_loaded_from_primary(session_factory, make_user, make_product, monkeypatch):
+    user = await make_user()
+    product = await make_product(user.user_id, name="Fresh")
+    monkeypatch.setattr(api.actions.product, "async_session", session_factory)
+    # недоступная реплика: если кэш попробует заполниться через неё, запрос упадёт
+    replica_engine = create_async_engine("postgresql+asyncpg://replica@127.0.0.1:9/replica", poolclass=NullPool)
+    replica_session = AsyncSession(replica_engine, info={REPLICA_SESSION_KEY: True})
+    try:
+        shown, _, _ = await _get_product_for_display(product.product_id, replica_session)
+    finally:
+        await replica_session.close()
+        await replica_engine.dispose()
+
+    assert shown.name == "Fresh"
+    assert (await get_product_cache().peek(product.product_id))["product"]["name"] == "Fresh"
+
+
+@pytest.mark.parametrize("method", ["patch", "delete"])
+@pytest.mark.parametrize("actor, target, expected_status", [
+    ("owner", "product", 200),
+    ("stranger", "product", 403),
+    ("owner", "missing", 404),
+    ("stranger", "missing", 404),
+])
+async def test_product_changes_check_ownership(client, db_session, make_user, make_product, method, actor, target, expected_status):
+    users = {"owner": await make_user(), "stranger": await make_user()}
+    product = await make_product(users["owner"].user_id)
+    product_id = product.product_id if target == "product" else uuid.uuid4()
+    params, headers = {"product_id": str(product_id)}, auth_headers(users[actor])
+
+    if method == "patch":
+        response = await client.patch("/product/", params=params, json=UPDATE_PRODUCT_BODY, headers=headers)
+    else:
+        response = await client.delete("/product/", params=params, headers=headers)
+
+    assert response.status_code == expected_status, response.text
+    async with db_session.begin():
+        version, name, is_active = (await db_session.execute(
+            select(Product.version, Product.name, Product.is_active).where(Product.product_id == product.product_id)
+        )).one()
+    if expected_status == 200:
+        assert version == product.version + 1
+    else:
+        assert (version, name, is_active) == (product.version, product.name, True)
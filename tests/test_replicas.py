@@ -0,0 +1,92 @@
+import time
+
+import pytest
+from starlette.requests import Request
+
+import db.session
+import settings
+from db.session import STICKY_COOKIE_NAME, ReplicaSet, get_read_db, is_replica_session
+from tests.conftest import UPDATE_PRODUCT_BODY, auth_headers
+
+UNREACHABLE_REPLICA_URL = "postgresql+asyncpg://replica@127.0.0.1:9/replica"
+
+
+@pytest.fixture
+async def replica_set(monkeypatch):
+    # проверка здоровья запускается только явно из теста
+    replicas = ReplicaSet([settings.TEST_DATABASE_URL, UNREACHABLE_REPLICA_URL], "round_robin", 10 ** 9)
+    monkeypatch.setattr(db.session, "_replica_set", replicas)
+    yield replicas
+    await replicas.dispose()
+
+
+def make_request(cookies: dict = None) -> Request:
+    cookie = "; ".join(f"{name}={value}" for name, value in (cookies or {}).items())
+    return Request({"type": "http", "headers": [(b"cookie", cookie.encode())] if cookie else []})
+
+
+async def read_session(request: Request):
+    sessions = get_read_db(request)
+    session = await anext(sessions)
+    await sessions.aclose()
+    return session
+
+
+async def test_unhealthy_replica_is_skipped(replica_set):
+    healthy, unreachable = replica_set.replicas
+
+    await replica_set.check_health()
+
+    assert healthy.healthy and not unreachable.healthy
+    assert {replica_set.choose() for _ in range(4)} == {healthy}
+
+
+async def test_reads_fall_back_to_primary_without_healthy_replicas(replica_set, session_factory, monkeypatch):
+    monkeypatch.setattr(db.session, "get_session_factory", lambda: session_factory)
+    assert is_replica_session(await read_session(make_request()))
+
+    for replica in replica_set.replicas:
+        replica.healthy = False
+
+    assert replica_set.choose() is None
+    assert not is_replica_session(await read_session(make_request()))
+
+
+async def test_sticky_cookie_reads_from_primary(replica_set, session_factory, monkeypatch):
+    monkeypatch.setattr(db.session, "get_session_factory", lambda: session_factory)
+
+    sticky = make_request({STICKY_COOKIE_NAME: int(time.time()) + 60})
+    expired = make_request({STICKY_COOKIE_NAME: int(time.time()) - 60})
+    garbage = make_request({STICKY_COOKIE_NAME: "soon"})
+
+    assert not is_replica_session(await read_session(sticky))
+    assert is_replica_session(await read_session(expired))
+    assert is_replica_session(await read_session(garbage))
+
+
+async def test_successful_write_sets_sticky_cookie(client, replica_set, make_user, make_product):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    params = {"product_id": str(product.product_id)}
+
+    read = await client.get("/product/", params=params)
+    forbidden = await client.patch("/product/", params=params, json=UPDATE_PRODUCT_BODY,
+                                   headers=auth_headers(await make_user()))
+    write = await client.patch("/product/", params=params, json=UPDATE_PRODUCT_BODY, headers=auth_headers(user))
+
+    assert STICKY_COOKIE_NAME not in read.cookies
+    assert forbidden.status_code == 403 and STICKY_COOKIE_NAME not in forbidden.cookies
+    assert write.status_code == 200
+    assert 0 < int(write.cookies[STICKY_COOKIE_NAME]) - time.time() <= settings.READ_YOUR_WRITES_SECONDS
+
+
+async def test_write_without_replicas_sets_no_cookie(client, make_user, make_product, monkeypatch):
+    monkeypatch.setattr(db.session, "_replica_set", ReplicaSet([], "round_robin", 10 ** 9))
+    user = await make_user()
+    product = await make_product(user.user_id)
+
+    response = await client.patch("/product/", params={"product_id": str(product.product_id)},
+                                  json=UPDATE_PRODUCT_BODY, headers=auth_headers(user))
+
+    assert response.status_code == 200
+    assert STICKY_COOKIE_NAME not in response.cookies
@@ -0,0 +1,62 @@
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import thumbnails
+from db.dals import ImageDAL
+from thumbnails import ThumbnailQueue
+
+
+async def test_worker_survives_failing_status_update(monkeypatch):
+    attempts = []
+
+    async def set_status_with_database_down(image_id, status):
+        attempts.append((image_id, status))
+        raise ConnectionError("database is down")
+
+    monkeypatch.setattr(thumbnails, "_set_status", set_status_with_database_down)
+    queue = ThumbnailQueue(workers=1, max_size=10)
+    # без процессов и Pillow: нужен только цикл воркера
+    queue._queue = asyncio.Queue()
+    queue._executor = ThreadPoolExecutor(max_workers=1)
+    queue._tasks = [asyncio.create_task(queue._worker())]
+    image_ids = [uuid.uuid4(), uuid.uuid4()]
+    for image_id in image_ids:
+        queue._queue.put_nowait((image_id, "0" * 64))
+
+    try:
+        await asyncio.wait_for(queue._queue.join(), timeout=5)
+        assert not queue._tasks[0].done()
+    finally:
+        await queue.stop(drain=False)
+
+    assert [image_id for image_id, status in attempts if status == thumbnails.DerivativeStatus.FAILED] == image_ids
+
+
+async def test_requeue_picks_up_unfinished_images(monkeypatch, session_factory, make_user, make_product, db_session):
+    user = await make_user()
+    product = await make_product(user.user_id)
+    statuses = [
+        thumbnails.DerivativeStatus.PENDING,
+        thumbnails.DerivativeStatus.PROCESSING,
+        thumbnails.DerivativeStatus.READY,
+        thumbnails.DerivativeStatus.FAILED,
+    ]
+    async with db_session.begin():
+        images = [
+            await ImageDAL(db_session).create_image(
+                path="blob", product_id=product.product_id, sha256=str(i) * 64, size=1, derivatives_status=status
+            )
+            for i, status in enumerate(statuses)
+        ]
+
+    monkeypatch.setattr(thumbnails, "async_session", session_factory)
+    monkeypatch.setattr(thumbnails, "PILLOW_INSTALLED", True)
+    queue = ThumbnailQueue(workers=1, max_size=10)
+    # очередь без воркеров: проверяем только, что в неё попало
+    monkeypatch.setattr(queue, "_ensure_started", lambda: setattr(queue, "_queue", queue._queue or asyncio.Queue()))
+
+    assert await queue._requeue_unfinished() == 2
+
+    queued = [queue._queue.get_nowait() for _ in range(queue._queue.qsize())]
+    assert sorted(queued) == sorted((image.id, image.sha256) for image in images[:2])
@@ -0,0 +1,82 @@
+import uuid
+
+import pytest
+
+from api.actions.auth import get_current_user_from_token
+from api.actions.user import _delete_user
+from cache import get_principal_cache
+from db.dals import PortalRole, UserDAL
+from security import create_access_token
+from tests.conftest import UPDATE_USER_BODY, auth_headers
+
+USER = [PortalRole.ROLE_PORTAL_USER]
+ADMIN = [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_ADMIN]
+SUPERADMIN = [PortalRole.ROLE_PORTAL_USER, PortalRole.ROLE_PORTAL_SUPERADMIN]
+
+
+async def test_deactivation_evicts_principal_after_commit(session_factory, make_user, monkeypatch):
+    user = await make_user()
+    token = create_access_token(data={"sub": user.email})
+
+    delete_user = UserDAL.delete_user
+
+    async def delete_then_authenticate_concurrently(self, *args, **kwargs):
+        deleted_user_id = await delete_user(self, *args, **kwargs)
+        # запрос с токеном до коммита видит пользователя ещё активным и кладёт его в кэш
+        async with session_factory() as other_session:
+            authenticated = await get_current_user_from_token(token=token, db=other_session)
+            assert authenticated.is_active
+        return deleted_user_id
+
+    monkeypatch.setattr(UserDAL, "delete_user", delete_then_authenticate_concurrently)
+    async with session_factory() as session:
+        await _delete_user(user.user_id, session, current_user=user)
+
+    assert await get_principal_cache().get(user.email) is None
+    async with session_factory() as session:
+        authenticated = await get_current_user_from_token(token=token, db=session)
+    assert not authenticated.is_active
+
+
+async def _change_user(client, method: str, user_id, actor):
+    if method == "patch":
+        return await client.patch(
+            "/user/", params={"user_id": str(user_id)}, json=UPDATE_USER_BODY, headers=auth_headers(actor)
+        )
+    return await client.delete("/user/", params={"user_id": str(user_id)}, headers=auth_headers(actor))
+
+
+@pytest.mark.parametrize("method", ["patch", "delete"])
+@pytest.mark.parametrize("actor_roles, target_roles, expected_status", [
+    # обычный пользователь меняет только себя
+    (USER, USER, 403),
+    (USER, ADMIN, 403),
+    (USER, SUPERADMIN, 403),
+    # админ - обычных пользователей, но не других админов и суперадминов
+    (ADMIN, USER, 200),
+    (ADMIN, ADMIN, 403),
+    (ADMIN, SUPERADMIN, 403),
+    # суперадмин - всех
+    (SUPERADMIN, USER, 200),
+    (SUPERADMIN, ADMIN, 200),
+    (SUPERADMIN, SUPERADMIN, 200),
+])
+async def test_role_rules_for_changing_other_users(client, make_user, method, actor_roles, target_roles, expected_status):
+    actor = await make_user(roles=actor_roles)
+    target = await make_user(roles=target_roles)
+
+    response = await _change_user(client, method, target.user_id, actor)
+
+    assert response.status_code == expected_status, response.text
+
+
+@pytest.mark.parametrize("method", ["patch", "delete"])
+@pytest.mark.parametrize("actor_roles", [USER, ADMIN, SUPERADMIN])
+async def test_anyone_changes_themselves_and_gets_404_for_missing_users(client, make_user, method, actor_roles):
+    actor = await make_user(roles=actor_roles)
+
+    response = await _change_user(client, method, uuid.uuid4(), actor)
+    assert response.status_code == 404, response.text
+
+    response = await _change_user(client, method, actor.user_id, actor)
+    assert response.status_code == 200, response.text
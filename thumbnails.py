@@ -0,0 +1,217 @@
+"""Background generation of resized derivatives for uploaded product images"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Optional
+from uuid import UUID
+
+import settings
+from db.dals import ImageDAL
+from db.session import async_session
+from storage import blob_path
+
+logger = logging.getLogger(__name__)
+
+###################################
+# BLOCK WITH DERIVATIVE RENDERING #
+###################################
+
+FORMAT_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+# Pillow - необязательная зависимость, без неё превью просто не строятся.
+# Сам модуль импортируют только процессы пула, основному процессу он не нужен
+PILLOW_INSTALLED = importlib.util.find_spec("PIL") is not None
+
+
+class DerivativeStatus:
+    PENDING = "pending"
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+
+
+def derivative_path(sha256: str, width: int, fmt: str) -> Path:
+    # превью адресуются хэшем оригинала, поэтому одинаковые картинки делят и превью
+    return settings.UPLOAD_DIR / "derivatives" / sha256[:2] / sha256[2:4] / f"{sha256}_{width}.{FORMAT_EXTENSIONS[fmt]}"
+
+
+def render_derivatives(sha256: str, widths: list[int], formats: list[str]) -> list[dict]:
+    """Runs in a worker process: resizes the blob to every width/format pair"""
+    from PIL import Image as PILImage
+
+    rendered = []
+    with PILImage.open(blob_path(sha256)) as source:
+        source.load()
+        for width in widths:
+            resized = source.copy()
+            resized.thumbnail((width, width))
+            if resized.mode not in ("RGB", "RGBA"):
+                resized = resized.convert("RGBA")
+            for fmt in formats:
+                target = derivative_path(sha256, width, fmt)
+                if not target.exists():
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    image = resized.convert("RGB") if fmt == "jpeg" else resized
+                    tmp_target = target.with_name(f".{target.name}.{os.getpid()}")
+                    image.save(tmp_target, format=fmt.upper(), quality=settings.THUMBNAIL_QUALITY)
+                    os.replace(tmp_target, target)
+                rendered.append({
+                    "width": resized.width,
+                    "height": resized.height,
+                    "format": fmt,
+                    "path": str(target),
+                })
+    return rendered
+
+
+def remove_derivatives(sha256: str):
+    for width in settings.THUMBNAIL_WIDTHS:
+        for fmt in settings.THUMBNAIL_FORMATS:
+            try:
+                os.remove(derivative_path(sha256, width, fmt))
+            except FileNotFoundError:
+                pass
+
+
+###############################
+# BLOCK WITH IN-PROCESS QUEUE #
+###############################
+
+
+class ThumbnailQueue:
+    """Asyncio job queue feeding a process pool, so uploads return before resizing is done"""
+    def __init__(self, workers: int, max_size: int):
+        self.workers = workers
+        self.max_size = max_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._executor: Optional[Executor] = None
+        self._requeue_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return PILLOW_INSTALLED and self.workers > 0
+
+    def _ensure_started(self):
+        if self._queue is not None:
+            return
+        # multiprocessing подтягиваем только с первой задачей, а не при импорте
+        from concurrent.futures import ProcessPoolExecutor
+
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def enqueue(self, image_id: UUID, sha256: str) -> bool:
+        """Returns False when the job could not be queued"""
+        if not self.enabled:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((image_id, sha256))
+        except asyncio.QueueFull:
+            logger.warning("Thumbnail queue is full, skipping image %s", image_id)
+            await _set_status(image_id, DerivativeStatus.FAILED)
+            return False
+        return True
+
+    def requeue_unfinished(self):
+        """Starts re-queueing images left pending/processing by a previous run: jobs live only in memory"""
+        if self.enabled and self._requeue_task is None:
+            self._requeue_task = asyncio.create_task(self._requeue_unfinished())
+
+    async def _requeue_unfinished(self) -> int:
+        try:
+            async with async_session() as session:
+                jobs = await ImageDAL(session).get_image_jobs_by_derivatives_status(
+                    [DerivativeStatus.PENDING, DerivativeStatus.PROCESSING]
+                )
+        except Exception:
+            logger.exception("Failed to load images with unfinished derivatives")
+            return 0
+        if jobs:
+            logger.info("Re-queueing derivatives of %d images", len(jobs))
+            self._ensure_started()
+        for job in jobs:
+            # ждём места в очереди, а не помечаем картинку FAILED, как при переполнении новыми загрузками
+            await self._queue.put(job)
+        return len(jobs)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            image_id, sha256 = await self._queue.get()
+            try:
+                await _set_status(image_id, DerivativeStatus.PROCESSING)
+                derivatives = await loop.run_in_executor(
+                    self._executor,
+                    render_derivatives,
+                    sha256,
+                    settings.THUMBNAIL_WIDTHS,
+                    settings.THUMBNAIL_FORMATS,
+                )
+                await _save_derivatives(image_id, derivatives)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to render derivatives for image %s", image_id)
+                try:
+                    await _set_status(image_id, DerivativeStatus.FAILED)
+                except Exception:
+                    # например, база недоступна: воркер должен жить дальше, иначе встанут все следующие задачи
+                    logger.exception("Failed to mark derivatives of image %s as failed", image_id)
+            finally:
+                self._queue.task_done()
+
+    async def stop(self, drain: bool = True):
+        if self._requeue_task is not None:
+            self._requeue_task.cancel()
+            await asyncio.gather(self._requeue_task, return_exceptions=True)
+            self._requeue_task = None
+        if self._queue is None:
+            return
+        if drain:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+        self._queue, self._tasks, self._executor = None, [], None
+
+
+async def _set_status(image_id: UUID, status: str):
+    async with async_session() as session:
+        async with session.begin():
+            await ImageDAL(session).set_derivatives_status(image_id, status)
+
+
+async def _save_derivatives(image_id: UUID, derivatives: list[dict]):
+    async with async_session() as session:
+        async with session.begin():
+            image_dal = ImageDAL(session)
+            await image_dal.replace_derivatives(image_id, derivatives)
+            await image_dal.set_derivatives_status(image_id, DerivativeStatus.READY)
+
+
+_thumbnail_queue: Optional[ThumbnailQueue] = None
+
+
+def get_thumbnail_queue() -> ThumbnailQueue:
+    """Returns the queue from settings, creating it on first use; workers start with the first job"""
+    global _thumbnail_queue
+    if _thumbnail_queue is None:
+        _thumbnail_queue = ThumbnailQueue(
+            workers=settings.THUMBNAIL_WORKERS,
+            max_size=settings.THUMBNAIL_QUEUE_SIZE,
+        )
+    return _thumbnail_queue
+
+
+async def stop_thumbnail_queue(drain: bool = False):
+    global _thumbnail_queue
+    if _thumbnail_queue is not None:
+        await _thumbnail_queue.stop(drain=drain)
+    _thumbnail_queue = None